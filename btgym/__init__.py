@@ -19,8 +19,9 @@
 
 from gym.envs.registration import register
 
-from .strategy import BTgymBaseStrategy
+from .strategy import BTgymBaseStrategy, BTgymFastStrategy
 from .server import BTgymServer
+from .fastengine import BTgymFastEngine
 from .datafeed import BTgymDataset, BTgymRandomDataDomain, BTgymSequentialDataDomain
 from .datafeed import DataSampleConfig, EnvResetConfig
 from .dataserver import BTgymDataFeedServer
@@ -28,6 +29,7 @@ from .dataserver import BTgymDataFeedServer
 from .rendering import BTgymRendering
 from .spaces import DictSpace
 from .envs.backtrader import BTgymEnv
+from .envs.vector import BTgymVecEnv
 
 register(
     id='backtrader-v0000',
@@ -21,7 +21,7 @@
 #from .rollout import Rollout, make_data_getter
 #from .memory import Memory
 from btgym.algorithms.runner.threadrunner import RunnerThread
-from .aac import BaseAAC, Unreal, A3C, PPO
+from .aac import BaseAAC, Unreal, A3C, PPO, IMPALA
 from .envs import AtariRescale42x42
 from .launcher import Launcher
 from .policy import BaseAacPolicy, Aac1dPolicy, StackedLstmPolicy, AacStackedRL2Policy
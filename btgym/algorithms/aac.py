@@ -20,15 +20,18 @@
 from __future__ import print_function
 
 import sys
+import time
+import threading
 
 import numpy as np
+import six.moves.queue as queue
 import tensorflow as tf
 from logbook import Logger, StreamHandler
 
-from btgym.algorithms.memory import Memory
+from btgym.algorithms.memory import ArrayMemory
 from btgym.algorithms.rollout import make_data_getter
-from btgym.algorithms.runner import BaseEnvRunnerFn, RunnerThread
-from btgym.algorithms.math_utils import log_uniform
+from btgym.algorithms.runner import BaseEnvRunnerFn, RunnerThread, BatchRunnerThread
+from btgym.algorithms.math_utils import log_uniform, vtrace
 from btgym.algorithms.nn.losses import value_fn_loss_def, rp_loss_def, pc_loss_def, aac_loss_def, ppo_loss_def
 from btgym.algorithms.utils import feed_dict_rnn_context, feed_dict_from_nested, batch_stack
 from btgym.spaces import DictSpace as ObSpace  # now can simply be gym.Dict
@@ -63,6 +66,8 @@ class BaseAAC(object):
                  rp_loss=rp_loss_def,
                  pc_loss=pc_loss_def,
                  runner_fn_ref=BaseEnvRunnerFn,
+                 batch_runner_fn_ref=None,
+                 process_runner_config=None,
                  random_seed=None,
                  model_gamma=0.99,  # decay
                  model_gae_lambda=1.00,  # GAE lambda
@@ -84,6 +89,8 @@ class BaseAAC(object):
                  replay_memory_size=2000,
                  replay_batch_size=None,
                  replay_rollout_length=None,
+                 replay_memory_config=None,
+                 prefetch_size=0,
                  use_off_policy_aac=False,
                  use_reward_prediction=False,
                  use_pixel_control=False,
@@ -115,6 +122,14 @@ class BaseAAC(object):
             rp_loss:                callable returning tensor holding reward prediction loss graph and summaries
             pc_loss:                callable returning tensor holding pixel_control loss graph and summaries
             runner_fn_ref:          callable defining environment runner execution logic
+            batch_runner_fn_ref:    callable defining synchronous multi-environment runner logic,
+                                    e.g. `BatchEnvRunnerFn`; if given, all environments are stepped together
+                                    by single runner thread with batched policy estimation, def: None
+            process_runner_config:  dict, if given, environments are run by separate processes, see
+                                    `processrunner.RunnerProcess`, requires Python 3.8+:
+                                    `env_config` entry is list of environment configurations as
+                                    dict(class_ref=..., kwargs=dict(...)), one per process, other entries are
+                                    passed to every runner, e.g. `sync_period`; def: None
             random_seed:            int or None
             model_gamma:            scalar, gamma discount factor
             model_gae_lambda:       scalar, GAE lambda
@@ -139,6 +154,13 @@ class BaseAAC(object):
             replay_memory_size:     int, in number of experiences
             replay_batch_size:      int, mini-batch size for off-policy training, def = 1
             replay_rollout_length:  int off-policy rollout length by def. equals on_policy_rollout_length
+            replay_memory_config:   dict, replay memory class and kwargs as dict(class_ref=..., kwargs=dict(...)),
+                                    given entries override defaults, e.g. set `class_ref` to PrioritizedMemory
+                                    for sum-tree prioritized sequence replay; def: ArrayMemory
+            prefetch_size:          int, if positive, train batches are collected and prepared by background
+                                    thread up to `prefetch_size` batches ahead, overlapping with train steps;
+                                    targets estimated by policy are still computed by `process_targets()`
+                                    after policy sync; def: 0, prepare every batch just before train step
             use_off_policy_aac:     bool, use full AAC off-policy loss instead of Value-replay
             use_reward_prediction:  bool, use aux. off-policy reward prediction task
             use_pixel_control:      bool, use aux. off-policy pixel control task
@@ -235,6 +257,8 @@ class BaseAAC(object):
 
             # Environmnet runner runtime function:
             self.runner_fn_ref = runner_fn_ref
+            self.batch_runner_fn_ref = batch_runner_fn_ref
+            self.process_runner_config = process_runner_config
 
             # AAC specific:
             self.model_gamma = model_gamma  # decay
@@ -302,6 +326,9 @@ class BaseAAC(object):
             else:
                 self.replay_rollout_length = rollout_length # by default off-rollout equals on-policy one
 
+            self.replay_memory_config = replay_memory_config
+            self.prefetch_size = prefetch_size
+            self.prefetcher = None
             self.rp_sequence_size = rp_sequence_size
             self.rp_reward_threshold = rp_reward_threshold
 
@@ -534,6 +561,11 @@ class BaseAAC(object):
                 self.summary_writer = None
                 self.local_steps = 0
 
+                # Time learner spends waiting for train data, for summaries:
+                self.data_wait_time = 0.0
+                self.data_wait_fraction = None
+                self._data_wait_window_start = None
+
                 self.log.debug('train op defined')
 
                 # Model stat. summary:
@@ -596,7 +628,7 @@ class BaseAAC(object):
                 # Replay memory_config:
                 if self.use_memory:
                     memory_config = dict(
-                        class_ref=Memory,
+                        class_ref=ArrayMemory,
                         kwargs=dict(
                             history_size=self.replay_memory_size,
                             max_sample_size=self.replay_rollout_length,
@@ -607,6 +639,13 @@ class BaseAAC(object):
                             log_level=self.log_level,
                         )
                     )
+                    if self.replay_memory_config is not None:
+                        memory_config['class_ref'] = self.replay_memory_config.get(
+                            'class_ref',
+                            memory_config['class_ref']
+                        )
+                        memory_config['kwargs'].update(self.replay_memory_config.get('kwargs', {}))
+
                 else:
                     memory_config = None
 
@@ -614,15 +653,45 @@ class BaseAAC(object):
                 # `rollout_length` represents the number of "local steps":  the number of time steps
                 # we run the policy before we get full rollout, run train step and update the parameters.
                 self.runners = []
+                self.process_runners = []
                 task = 0  # Runners will have [worker_task][env_count] id's
-                for env in self.env_list:
+                if self.process_runner_config is not None:
+                    # Needs Python 3.8+, imported only when asked for:
+                    from btgym.algorithms.runner.processrunner import RunnerProcess
+
+                    process_runner_kwargs = {
+                        key: value for key, value in self.process_runner_config.items() if key != 'env_config'
+                    }
+                    for env_config in self.process_runner_config['env_config']:
+                        self.runners.append(
+                            RunnerProcess(
+                                env_config=env_config,
+                                policy=pi,
+                                policy_config=dict(class_ref=self.policy_class, kwargs=self.policy_kwargs),
+                                runner_fn_ref=self.runner_fn_ref,
+                                task=self.task + task,
+                                rollout_length=self.rollout_length,
+                                episode_summary_freq=self.episode_summary_freq,
+                                env_render_freq=self.env_render_freq,
+                                test=self.test_mode,
+                                memory_config=memory_config,
+                                episode_train_test_cycle=(self.num_train_episodes, self.num_test_episodes),
+                                log_level=log_level,
+                                **process_runner_kwargs
+                            )
+                        )
+                        task += 0.01
+
+                    self.process_runners = list(self.runners)
+
+                elif self.batch_runner_fn_ref is not None:
                     self.runners.append(
-                        RunnerThread(
-                            env=env,
+                        BatchRunnerThread(
+                            envs=self.env_list,
                             policy=pi,
-                            runner_fn_ref=self.runner_fn_ref,
-                            task=self.task + task,
-                            rollout_length=self.rollout_length,  # ~20
+                            runner_fn_ref=self.batch_runner_fn_ref,
+                            task=self.task,
+                            rollout_length=self.rollout_length,
                             episode_summary_freq=self.episode_summary_freq,
                             env_render_freq=self.env_render_freq,
                             test=self.test_mode,
@@ -631,9 +700,29 @@ class BaseAAC(object):
                             log_level=log_level,
                         )
                     )
-                    task += 0.01
+                else:
+                    for env in self.env_list:
+                        self.runners.append(
+                            RunnerThread(
+                                env=env,
+                                policy=pi,
+                                runner_fn_ref=self.runner_fn_ref,
+                                task=self.task + task,
+                                rollout_length=self.rollout_length,  # ~20
+                                episode_summary_freq=self.episode_summary_freq,
+                                env_render_freq=self.env_render_freq,
+                                test=self.test_mode,
+                                ep_summary=self.ep_summary,
+                                memory_config=memory_config,
+                                log_level=log_level,
+                            )
+                        )
+                        task += 0.01
                 # Make rollouts provider[s]:
-                self.data_getter = [make_data_getter(runner.queue) for runner in self.runners]
+                self.data_getter = [
+                    make_data_getter(runner_queue) for runner in self.runners
+                    for runner_queue in getattr(runner, 'queues', [runner.queue])
+                ]
 
                 self.log.debug('trainer.init() done')
 
@@ -655,6 +744,30 @@ class BaseAAC(object):
 
         return {key: [stream[key] for stream in data_streams] for key in data_streams[0].keys()}
 
+    @staticmethod
+    def _is_train_data(data):
+        """
+        Test or train: if at least one on-policy rollout from parallel runners is test one -
+        entire minibatch is test one.
+        """
+        try:
+            return not np.asarray([env['state']['metadata']['type'] for env in data['on_policy']]).any()
+
+        except KeyError:
+            return True
+
+    def _prepare_data(self, sess):
+        """
+        Collects and processes next train batch, run by prefetching thread.
+
+        Returns:
+            data dictionary, train data flag, train step feed dictionary
+        """
+        data = self._get_data()
+        is_train = self._is_train_data(data)
+
+        return data, is_train, self.process_data(sess, data, is_train)
+
     def get_sample_config(self, _new_trial=False):
         """
         Returns environment configuration parameters for next episode to sample.
@@ -813,6 +926,16 @@ class BaseAAC(object):
             # Start thread_runners:
             self._start_runners(sess, summary_writer)
 
+            if self.prefetch_size > 0:
+                self.prefetcher = _DataPrefetcher(
+                    prepare_fn=lambda: self._prepare_data(sess),
+                    size=self.prefetch_size,
+                    log=self.log,
+                )
+                self.prefetcher.start()
+
+            self._data_wait_window_start = time.time()
+
         except:
             msg = 'start() exception occurred' + \
                 '\n\nPress `Ctrl-C` or jupyter:[Kernel]->[Interrupt] for clean exit.\n'
@@ -888,6 +1011,8 @@ class BaseAAC(object):
     def process_data(self, sess, data, is_train):
         """
         Processes data, composes train step feed dictionary.
+        Can be run by prefetching thread ahead of policy sync, so should not run graph, see process_targets().
+
         Args:
             sess:               tf session obj.
             data (dict):        data dictionary
@@ -1001,6 +1126,22 @@ class BaseAAC(object):
 
         return feed_dict
 
+    def process_targets(self, sess, data, feed_dict):
+        """
+        Updates train step feed dictionary with targets estimated by local policy.
+        Called by process() after local policy has been synced, never by prefetching thread,
+        thus graph can be run here, unlike in process_data(). Default is no-op.
+
+        Args:
+            sess:               tf session obj.
+            data (dict):        data dictionary
+            feed_dict (dict):   train step feed dictionary made by process_data()
+
+        Returns:
+            feed_dict (dict):   train step feed dictionary
+        """
+        return feed_dict
+
     def process_summary(self, sess, data, model_data=None):
         """
         Fetches and writes summary data from `data` and `model_data`.
@@ -1068,7 +1209,15 @@ class BaseAAC(object):
 
         # Every worker writes train episode summaries:
         if model_data is not None:
-            self.summary_writer.add_summary(tf.Summary.FromString(model_data), sess.run(self.global_step))
+            global_step = sess.run(self.global_step)
+            self.summary_writer.add_summary(tf.Summary.FromString(model_data), global_step)
+            if self.data_wait_fraction is not None:
+                self.summary_writer.add_summary(
+                    tf.Summary(
+                        value=[tf.Summary.Value(tag='model/data_wait_fraction', simple_value=self.data_wait_fraction)]
+                    ),
+                    global_step
+                )
             self.summary_writer.flush()
 
     def process(self, sess):
@@ -1085,28 +1234,37 @@ class BaseAAC(object):
         """
         # Quick wrap to get direct traceback from this trainer if something goes wrong:
         try:
-            # Collect data from child thread runners:
-            data = self._get_data()
+            wait_start = time.time()
+            if self.prefetcher is not None:
+                # Get batch prepared while previous train step was running:
+                data, is_train, feed_dict = self.prefetcher.get()
+
+            else:
+                # Collect data from child thread runners:
+                data = self._get_data()
+                # Test data sets learn rate to zero for entire minibatch. Doh.
+                is_train = self._is_train_data(data)
+                feed_dict = None
+
+            self.data_wait_time += time.time() - wait_start
 
             # Copy weights from local policy to local target policy:
             if self.use_target_policy and self.local_steps % self.pi_prime_update_period == 0:
                 sess.run(self.sync_pi_prime)
 
-            # Test or train: if at least one on-policy rollout from parallel runners is test one -
-            # set learn rate to zero for entire minibatch. Doh.
-            try:
-                is_train = not np.asarray([env['state']['metadata']['type'] for env in data['on_policy']]).any()
-
-            except KeyError:
-                is_train = True
-
             if is_train:
                 # If there is no any test rollouts  - copy weights from shared to local new_policy:
                 sess.run(self.sync_pi)
 
             # self.log.debug('is_train: {}'.format(is_train))
 
-            feed_dict = self.process_data(sess, data, is_train)
+            if feed_dict is None:
+                wait_start = time.time()
+                feed_dict = self.process_data(sess, data, is_train)
+                self.data_wait_time += time.time() - wait_start
+
+            # Targets depending on synced local policy can't be prepared ahead:
+            feed_dict = self.process_targets(sess, data, feed_dict)
 
             # Say No to redundant summaries:
             wirte_model_summary =\
@@ -1127,9 +1285,20 @@ class BaseAAC(object):
 
             fetched = sess.run(fetches_last, feed_dict=feed_dict)
 
+            # Send policy parameters to runner processes, if any:
+            if len(self.process_runners) > 0:
+                self.process_runners[0].sync_weights(sess, self.process_runners)
+
             if wirte_model_summary:
                 model_summary = fetched[-2]
 
+                # Fraction of time since last model summary learner was waiting for data:
+                if self._data_wait_window_start is not None:
+                    now = time.time()
+                    self.data_wait_fraction = self.data_wait_time / max(now - self._data_wait_window_start, 1e-12)
+                    self.data_wait_time = 0.0
+                    self._data_wait_window_start = now
+
             else:
                 model_summary = None
 
@@ -1158,6 +1327,44 @@ class BaseAAC(object):
             raise RuntimeError(msg)
 
 
+class _DataPrefetcher(threading.Thread):
+    """
+    Background thread preparing train batches ahead of trainer, see `BaseAAC.prefetch_size`.
+    """
+    def __init__(self, prepare_fn, size, log):
+        """
+        Args:
+            prepare_fn:     callable returning prepared batch
+            size:           int, max. number of batches prepared ahead
+            log:            logbook logger
+        """
+        threading.Thread.__init__(self)
+        self.prepare_fn = prepare_fn
+        self.queue = queue.Queue(size)
+        self.log = log
+        self.daemon = True
+
+    def run(self):
+        try:
+            while True:
+                self.queue.put(self.prepare_fn())
+
+        except Exception as e:
+            self.log.exception('Data prefetching exception occurred.')
+            self.queue.put(e)
+
+    def get(self):
+        """
+        Returns:
+            next prepared batch.
+        """
+        batch = self.queue.get(timeout=600.0)
+        if isinstance(batch, Exception):
+            raise RuntimeError('Data prefetching thread failed') from batch
+
+        return batch
+
+
 class Unreal(BaseAAC):
     """
     Unreal: Asynchronous Advantage Actor Critic with auxiliary control tasks.
@@ -1377,3 +1584,110 @@ class PPO(BaseAAC):
         )
 
 
+class IMPALA(BaseAAC):
+    """
+    Decoupled actor-learner AAC with V-trace off-policy correction.
+
+    Acting is done by environment runners, preferably runner processes (see `process_runner_config`),
+    which keep own policy copies synchronized every `sync_period` train steps; trainer acts as learner
+    doing train steps on batches of `learner_batch_size` rollouts collected from any runners.
+    Policy lag between actors and learner is corrected by V-trace targets.
+
+    Paper: https://arxiv.org/abs/1802.01561
+
+    Note:
+        bootstrap value of non-terminal rollout is estimated by behaviour policy.
+    """
+    def __init__(self, vtrace_rho_clip=1.0, vtrace_c_clip=1.0, learner_batch_size=None, **kwargs):
+        """
+        IMPALA args. is a superset of BaseAAC arguments, see `BaseAAC` class for descriptions.
+
+        Args:
+            vtrace_rho_clip:        scalar, V-trace importance weights truncation level, def: 1.0
+            vtrace_c_clip:          scalar, V-trace traces truncation level, def: 1.0
+            learner_batch_size:     int, number of on-policy rollouts per train step, taken from runners
+                                    in turn; def: one rollout from every runner
+            env:
+            task:
+            policy_config:
+            log_level:
+            runner_fn_ref:
+            process_runner_config:
+            random_seed:
+            model_gamma:
+            model_beta:
+            opt_max_env_steps:
+            opt_decay_steps:
+            opt_end_learn_rate:
+            opt_learn_rate:
+            opt_decay:
+            opt_momentum:
+            opt_epsilon:
+            rollout_length:
+            episode_summary_freq:
+            env_render_freq:
+            model_summary_freq:
+            test_mode:
+        """
+        self.vtrace_rho_clip = vtrace_rho_clip
+        self.vtrace_c_clip = vtrace_c_clip
+        super(IMPALA, self).__init__(
+            on_policy_loss=aac_loss_def,
+            _use_target_policy=False,
+            _log_name='IMPALA',
+            **kwargs
+        )
+        if learner_batch_size is None:
+            learner_batch_size = len(self.data_getter)
+
+        self.learner_batch_size = learner_batch_size
+        self._next_getter = 0
+
+    def _get_data(self):
+        """
+        Collects `learner_batch_size` rollouts taking runners in turn.
+
+        Returns:
+            dictionary of lists of data streams
+        """
+        data_streams = []
+        for i in range(self.learner_batch_size):
+            data_streams.append(self.data_getter[self._next_getter]())
+            self._next_getter = (self._next_getter + 1) % len(self.data_getter)
+
+        return {key: [stream[key] for stream in data_streams] for key in data_streams[0].keys()}
+
+    def process_targets(self, sess, data, feed_dict):
+        """
+        Replaces on-policy advantages and returns targets with V-trace ones,
+        estimated with current learner policy.
+        """
+        target_logits, target_values = sess.run(
+            [self.local_network.on_logits, self.local_network.on_vf],
+            feed_dict
+        )
+        target_values = np.reshape(target_values, [-1])
+        advantage = np.zeros_like(feed_dict[self.on_pi_adv_target])
+        r = np.zeros_like(feed_dict[self.on_pi_r_target])
+
+        offset = 0
+        for rollout in data['on_policy']:
+            size = len(rollout['reward'])
+            time = slice(offset, offset + size)
+            r[time], advantage[time] = vtrace(
+                behaviour_logits=np.reshape(rollout['logits'], [size, -1]),
+                target_logits=target_logits[time],
+                actions=np.reshape(rollout['action'], [size, -1]),
+                rewards=np.asarray(rollout['reward']),
+                values=target_values[time],
+                bootstrap_value=rollout['r'][-1][0],
+                gamma=self.model_gamma,
+                rho_clip=self.vtrace_rho_clip,
+                c_clip=self.vtrace_c_clip,
+            )
+            # Rollouts are zero-padded to `rollout_length` unless time-flattened:
+            offset += size if self.time_flat else self.rollout_length
+
+        feed_dict.update({self.on_pi_adv_target: advantage, self.on_pi_r_target: r})
+
+        return feed_dict
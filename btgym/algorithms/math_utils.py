@@ -7,6 +7,54 @@ def discount(x, gamma):
     return scipy.signal.lfilter([1], [1, -gamma], x[::-1], axis=0)[::-1]
 
 
+def vtrace(behaviour_logits, target_logits, actions, rewards, values, bootstrap_value, gamma,
+           rho_clip=1.0, c_clip=1.0):
+    """
+    Computes V-trace value targets and policy gradient advantages for single trajectory
+    collected by behaviour policy, as in IMPALA paper: https://arxiv.org/abs/1802.01561
+
+    Args:
+        behaviour_logits:   actions logits of behaviour policy, [time, num_actions]
+        target_logits:      actions logits of target policy, [time, num_actions]
+        actions:            one-hot actions taken, [time, num_actions]
+        rewards:            rewards received, [time]
+        values:             target policy V-fn values, [time]
+        bootstrap_value:    V-fn value of state next to last one or 0 if terminal
+        gamma:              discount factor
+        rho_clip:           importance weights truncation level for value targets and advantages
+        c_clip:             importance weights truncation level for traces
+
+    Returns:
+        V-trace value targets, policy gradient advantages, both of size [time]
+
+    Note:
+        `bootstrap_value` is not importance-weighted; as used by IMPALA trainer, it is estimated
+        by behaviour policy and thus lags learner for non-terminal rollouts.
+    """
+    def log_prob(logits):
+        logits = logits - np.max(logits, axis=-1, keepdims=True)
+        return np.sum(actions * logits, axis=-1) - np.log(np.sum(np.exp(logits), axis=-1))
+
+    rhos = np.exp(log_prob(target_logits) - log_prob(behaviour_logits))
+    clipped_rhos = np.minimum(rho_clip, rhos)
+    cs = np.minimum(c_clip, rhos)
+
+    values_next = np.append(values[1:], bootstrap_value)
+    deltas = clipped_rhos * (rewards + gamma * values_next - values)
+
+    vs_minus_v = np.zeros_like(deltas)
+    acc = 0.0
+    for t in reversed(range(deltas.shape[0])):
+        acc = deltas[t] + gamma * cs[t] * acc
+        vs_minus_v[t] = acc
+
+    vs = vs_minus_v + values
+    vs_next = np.append(vs[1:], bootstrap_value)
+    pg_advantages = clipped_rhos * (rewards + gamma * vs_next - values)
+
+    return vs, pg_advantages
+
+
 def log_uniform(lo_hi, size):
     """
     Samples from log-uniform distribution in range specified by `lo_hi`.
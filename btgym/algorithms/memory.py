@@ -7,7 +7,7 @@ import sys
 
 import numpy as np
 from collections import deque
-from btgym.algorithms.rollout import Rollout
+from btgym.algorithms.rollout import Rollout, ArrayRollout
 
 
 class Memory(object):
@@ -250,6 +250,617 @@ class Memory(object):
         return None
 
 
+class _WindowBuffer(object):
+    """
+    Ring buffer of bars keeping overlapping time-embedded windows without duplicates.
+    Every appended window is compared to previous one: if it is previous window shifted by few bars,
+    only new bars are stored, otherwise window is stored entirely.
+    """
+    def __init__(self, size, shift=None):
+        """
+        Args:
+            size:       expected number of windows to keep;
+            shift:      int, expected window shift in bars or None.
+        """
+        self.size = size
+        self.shift = shift
+        self.time_dim = None
+        self.bars = None
+        self.capacity = None
+        self.total = 0  # number of bars ever written, bar `i` is kept at `i % capacity`
+        self._last_window = None
+
+    def _find_shift(self, window):
+        """
+        Returns number of new bars in `window` with respect to previous one or None if windows don't overlap.
+        """
+        last = self._last_window
+        if last is None or last.shape != window.shape:
+            return None
+
+        candidates = [self.shift] if self.shift is not None else []
+        candidates += range(self.time_dim)
+        for shift in candidates:
+            if 0 <= shift < self.time_dim and np.array_equal(last[shift:], window[:self.time_dim - shift]):
+                if self.shift is None:
+                    self.shift = shift
+                return shift
+
+        return None
+
+    def append(self, window, keep_from):
+        """
+        Stores window.
+
+        Args:
+            window:     array of shape [time_dim, ...];
+            keep_from:  index of first bar still referred to by stored frames.
+
+        Returns:
+            index of window last bar.
+        """
+        window = np.asarray(window)
+        if self.bars is None:
+            self.time_dim = window.shape[0]
+            self.capacity = self.size * (self.shift or 1) + self.time_dim
+            self.bars = np.empty((self.capacity,) + window.shape[1:], dtype=window.dtype)
+
+        shift = self._find_shift(window)
+        bars = window if shift is None else window[self.time_dim - shift:]
+
+        while self.total + len(bars) - keep_from > self.capacity:
+            self._grow(keep_from)
+
+        self.bars[(self.total + np.arange(len(bars))) % self.capacity] = bars
+        self.total += len(bars)
+        self._last_window = window.copy()
+
+        return self.total - 1
+
+    def _grow(self, keep_from):
+        """
+        Doubles capacity, keeping bars from `keep_from` on.
+        """
+        capacity = self.capacity * 2
+        bars = np.empty((capacity,) + self.bars.shape[1:], dtype=self.bars.dtype)
+        index = np.arange(max(keep_from, 0), self.total)
+        bars[index % capacity] = self.bars[index % self.capacity]
+        self.bars = bars
+        self.capacity = capacity
+
+    def gather(self, last_bar):
+        """
+        Rebuilds windows.
+
+        Args:
+            last_bar:   array of windows last bars indices.
+
+        Returns:
+            array of windows of shape [len(last_bar), time_dim, ...].
+        """
+        index = np.asarray(last_bar)[:, None] - self.time_dim + 1 + np.arange(self.time_dim)
+        return self.bars[index % self.capacity]
+
+
+class ArrayMemory(Memory):
+    """
+    Replay memory with rebalanced replay based on reward value,
+    keeping experiences in preallocated structure-of-arrays ring buffers.
+
+    Same interface and sampling logic as `Memory`, but rollouts are inserted by index assignment
+    and sequences of any length are gathered by fancy indexing; samples are `ArrayRollout` instances.
+    Terminal and episode-boundary bookkeeping is done over `terminal`, `reward` and `position` columns.
+
+    Time-embedded state entries listed in `window_keys` can be stored deduplicated: successive frames windows
+    overlap by all but few most recent bars, so only newly appended bars are kept per frame
+    and full windows are rebuilt on sampling, cutting memory footprint by ~`time_dim / window_shift` times.
+
+    Note:
+        must be filled up before calling sampling methods.
+    """
+    def __init__(self, history_size, max_sample_size, priority_sample_size, log_level=WARNING,
+                 rollout_provider=None, task=-1, reward_threshold=0.1, use_priority_sampling=False,
+                 window_keys=None, window_shift=None):
+        """
+
+        Args:
+            history_size:           number of experiences stored;
+            max_sample_size:        maximum allowed sample size (e.g. off-policy rollout length);
+            priority_sample_size:   sample size of priority_sample() method
+            log_level:              int, logbook.level;
+            rollout_provider:       callable returning list of Rollouts NOT USED
+            task:                   parent worker id;
+            reward_threshold:       if |experience.reward| > reward_threshold: experience is saved as 'prioritized';
+            window_keys:            list of `state` keys holding time-embedded windows with time as first dimension,
+                                    e.g. ['external', 'internal'], to store deduplicated; def: store as is;
+            window_shift:           int, expected number of bars appended to window per frame (e.g. `skip_frame`),
+                                    if None - detected for every frame.
+        """
+        super(ArrayMemory, self).__init__(
+            history_size=history_size,
+            max_sample_size=max_sample_size,
+            priority_sample_size=priority_sample_size,
+            log_level=log_level,
+            rollout_provider=rollout_provider,
+            task=task,
+            reward_threshold=reward_threshold,
+            use_priority_sampling=use_priority_sampling,
+        )
+        self._storage = ArrayRollout(history_size)
+        # Total number of frames ever added, frame with absolute index `i` is kept at `i % history_size`:
+        self._count = 0
+        # Deduplicated windows bars, frames store index of window last bar instead of window itself:
+        self._windows = {key: _WindowBuffer(history_size, window_shift) for key in window_keys or []}
+
+    def _column(self, *path):
+        struct = self._storage._buffers
+        for key in path:
+            struct = struct[key]
+        return struct
+
+    def _last_slot(self):
+        return (self._count - 1) % self._history_size
+
+    def add(self, frame):
+        """
+        Writes single experience frame to memory.
+
+        Args:
+            frame:  dictionary of values.
+        """
+        if frame['terminal'] and self._count > 0 and self._column('terminal')[self._last_slot()]:
+            # Discard if terminal frame continues
+            self.log.warning("Memory_{}: Sequential terminal frame encountered. Discarded.".format(self.task))
+            return
+
+        frame = self._encode(self._storage._map(frame, lambda value: np.asarray(value)[None, ...]))
+        frame = self._storage._map(frame, lambda array: array[0])
+        self._storage.allocate(frame)
+        self._storage.write(frame, self._count % self._history_size)
+        self._count += 1
+
+    def add_rollout(self, rollout):
+        """
+        Writes frames from given rollout to memory with respect to episode continuation.
+
+        Args:
+            rollout:    `Rollout` or `ArrayRollout` instance.
+        """
+        data = {key: rollout.as_array(rollout[key]) for key in rollout.keys()}
+        terminal = np.asarray(data['terminal'], dtype=bool)
+        last_terminal = False
+
+        if self._count > 0:
+            last = self._last_slot()
+            stored_terminal = self._column('terminal')
+            last_terminal = bool(stored_terminal[last])
+            # Check if current rollout is direct extension of last stored frame sequence:
+            if not last_terminal and not (
+                self._column('position', 'episode')[last] == data['position']['episode'][0] and
+                self._column('position', 'step')[last] + 1 == data['position']['step'][0]
+            ):
+                # Means part or tail of previously recorded episode is somehow lost,
+                # so we need to mark stored episode as 'ended':
+                stored_terminal[last] = True
+                last_terminal = True
+                self.log.warning('Memory_{}: last stored frame changed to terminal'.format(self.task))
+
+        # Discard terminal frames continuing terminal ones:
+        keep = ~(terminal & np.append(last_terminal, terminal[:-1]))
+        if not keep.all():
+            self.log.warning(
+                "Memory_{}: {} sequential terminal frames encountered. Discarded.".format(self.task, (~keep).sum())
+            )
+        # Can't hold more than `history_size` most recent frames:
+        keep &= np.cumsum(keep[::-1])[::-1] <= self._history_size
+        if not keep.all():
+            data = self._storage._map(data, lambda array: array[keep])
+
+        size = int(keep.sum())
+        if size == 0:
+            return
+
+        data = self._encode(data)
+        self._storage.allocate(self._storage._map(data, lambda array: array[0]))
+        self._storage.write(data, (self._count + np.arange(size)) % self._history_size)
+        self._count += size
+
+    def _encode(self, data):
+        """
+        Appends windows of given frames to deduplicated storage.
+
+        Args:
+            data:   [nested] dictionary of arrays for successive frames to be written.
+
+        Returns:
+            data with every `window_keys` state entry replaced by window last bar indices.
+        """
+        if not self._windows:
+            return data
+
+        data = dict(data)
+        data['state'] = dict(data['state'])
+
+        if self._count > 0:
+            # Bars of oldest stored frame window must be kept:
+            top_slot = max(self._count - self._history_size, 0) % self._history_size
+            keep_from = {
+                key: self._column('state', key)[top_slot] - window.time_dim + 1 for key, window in self._windows.items()
+            }
+
+        else:
+            keep_from = {key: 0 for key in self._windows.keys()}
+
+        for key, window in self._windows.items():
+            data['state'][key] = np.asarray(
+                [window.append(value, keep_from[key]) for value in data['state'][key]],
+                dtype=np.int64
+            )
+
+        return data
+
+    def _gather(self, slots):
+        """
+        Collects frames at given slots, rebuilding deduplicated windows.
+
+        Returns:
+            instance of ArrayRollout.
+        """
+        if not self._windows:
+            return self._storage.gather(slots)
+
+        arrays = self._storage._map(self._storage._buffers, lambda buffer: buffer[slots])
+        for key, window in self._windows.items():
+            arrays['state'][key] = window.gather(arrays['state'][key])
+
+        return ArrayRollout.from_arrays(arrays)
+
+    def is_full(self):
+        return self._count >= self._history_size
+
+    def sample_uniform(self, sequence_size):
+        """
+        Uniformly samples sequence of successive frames of size `sequence_size` or less (~off-policy rollout).
+
+        Args:
+            sequence_size:  maximum sample size.
+        Returns:
+            instance of ArrayRollout of size <= sequence_size.
+        """
+        start_pos = np.random.randint(0, self._history_size - sequence_size - 1)
+        start_index = self._count - self._history_size + start_pos
+        terminal = self._column('terminal')
+        # Shift by one if hit terminal frame:
+        if terminal[start_index % self._history_size]:
+            start_index += 1  # assuming that there are no successive terminal frames.
+
+        slots = (start_index + np.arange(sequence_size)) % self._history_size
+        # It's ok to return less than `sequence_size` frames if `terminal` frame encountered:
+        terminal_pos = np.flatnonzero(terminal[slots])
+        if terminal_pos.size > 0:
+            slots = slots[:terminal_pos[0] + 1]
+
+        return self._gather(slots)
+
+    def _sample_end_index(self, from_zero, batch_size=32):
+        """
+        Uniformly samples index of valid sequence end frame with zero or non-zero reward.
+        Draws batch of candidates and takes first of requested kind; falls back to
+        exhaustive search if none found or to other kind if there is no frames of requested one.
+
+        Args:
+            from_zero:      bool, sample frame with |reward| <= reward_threshold or with greater one;
+            batch_size:     number of candidates to draw at once.
+
+        Returns:
+            absolute frame index.
+        """
+        # Valid sequence end frames indices are those allowing to sample `max_sample_size` frames:
+        lo = max(self._count - self._history_size, 0) + self.max_sample_size - 1
+        reward = self._column('reward')
+
+        candidates = np.random.randint(lo, self._count, size=batch_size)
+        is_match = (np.abs(reward[candidates % self._history_size]) > self.reward_threshold) != from_zero
+        if is_match.any():
+            return candidates[is_match.argmax()]
+
+        candidates = np.arange(lo, self._count)
+        is_match = (np.abs(reward[candidates % self._history_size]) > self.reward_threshold) != from_zero
+        if not is_match.any():
+            # Requested kind container is empty:
+            is_match = ~is_match
+
+        candidates = candidates[is_match]
+        return candidates[np.random.randint(candidates.size)]
+
+    def _sample_priority(self, size=None, exact_size=False, skewness=2, sample_attempts=100):
+        """
+        Implements rebalanced replay.
+        Samples sequence of successive frames from distribution skewed by means of reward of last sample frame.
+
+        Args:
+            size:               sample size, must be <= self.max_sample_size;
+            exact_size:         whether accept sample with size less than 'size'
+                                or re-sample to get sample of exact size (used for reward prediction task);
+            skewness:           int>=1, sampling probability denominator, such as probability of sampling sequence with
+                                last frame having non-zero reward is: p[non_zero]=1/skewness;
+            sample_attempts:    if exact_size=True, sets number of re-sampling attempts
+                                to get sample of continuous experiences (no `Terminal` frames inside except last one);
+                                if number is reached - sample returned 'as is'.
+        Returns:
+            instance of ArrayRollout().
+        """
+        if size is None:
+            size = self.priority_sample_size
+
+        if size > self.max_sample_size:
+            size = self.max_sample_size
+
+        # Toss skewed coin:
+        from_zero = np.random.randint(int(skewness)) != 0
+        terminal = self._column('terminal')
+
+        # Try to sample sequence of given length from one episode, see Memory._sample_priority():
+        for attempt in range(sample_attempts):
+            end_frame_index = self._sample_end_index(from_zero)
+            slots = (end_frame_index - size + 1 + np.arange(size)) % self._history_size
+            is_full = True
+
+            if attempt == sample_attempts - 1:
+                self.log.warning(
+                    'Memory_{}: failed to sample {} successive frames, sampled as is.'.format(self.task, size)
+                )
+
+            else:
+                terminal_pos = np.flatnonzero(terminal[slots[:-1]])
+                if terminal_pos.size > 0:
+                    if exact_size:
+                        is_full = False
+                    # Last frame can be terminal anyway:
+                    slots = np.append(slots[:terminal_pos[0] + 1], slots[-1])
+
+            if is_full:
+                break
+
+        return self._gather(slots)
+
+
+class SumTree(object):
+    """
+    Binary tree of priorities with every inner node holding sum of its children.
+    Supports O(log N) priority updates and sampling proportional to priority.
+    """
+    def __init__(self, size):
+        """
+        Args:
+            size:   number of leaves (priorities) to store.
+        """
+        self.size = int(size)
+        self.capacity = 1
+        while self.capacity < self.size:
+            self.capacity *= 2
+        # Root is at 1, leaves are at [capacity, capacity + size):
+        self.tree = np.zeros(2 * self.capacity)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, index):
+        """
+        Returns priorities for given leaves indices.
+        """
+        return self.tree[np.asarray(index) + self.capacity]
+
+    def update(self, index, priority):
+        """
+        Sets priorities for given leaves indices.
+
+        Args:
+            index:      int or array of ints, leaves indices;
+            priority:   scalar or array of non-negative priorities.
+        """
+        node = np.atleast_1d(np.asarray(index) + self.capacity)
+        self.tree[node] = priority
+        node = np.unique(node // 2)
+        while node[0] > 0:
+            self.tree[node] = self.tree[2 * node] + self.tree[2 * node + 1]
+            node = np.unique(node // 2)
+
+    def find(self, value):
+        """
+        Returns index of the leaf such as sum of priorities of preceding leaves is <= `value` and
+        sum including the leaf itself is > `value`.
+
+        Args:
+            value:  scalar or array of values in [0, total).
+
+        Returns:
+            leaf index or array of leaves indices.
+        """
+        if np.ndim(value) == 0:
+            node = 1
+            while node < self.capacity:
+                node *= 2
+                if value >= self.tree[node]:
+                    value -= self.tree[node]
+                    node += 1
+            return min(node - self.capacity, self.size - 1)
+
+        value = np.asarray(value, dtype=np.float64).copy()
+        node = np.ones(value.shape, dtype=np.int64)
+        while node[0] < self.capacity:
+            left = 2 * node
+            go_right = value >= self.tree[left]
+            value -= np.where(go_right, self.tree[left], 0.0)
+            node = left + go_right
+        # Guard against float rounding at right bound:
+        return np.minimum(node - self.capacity, self.size - 1)
+
+
+class PrioritizedMemory(ArrayMemory):
+    """
+    Ring-buffer replay memory with prioritized sequence replay backed by sum-tree.
+
+    Every frame is given a priority `(|reward| + priority_epsilon) ** priority_alpha` when added,
+    stored as priority of sequence of `priority_sample_size` frames ending at that frame.
+    Sequences crossing episode boundary (terminal frame anywhere but at the end) or
+    reaching beyond oldest stored frame get zero priority, so sample_priority() never retries.
+
+    Note:
+        - priorities can be refined later by update_priorities(), e.g. from learner loss values;
+        - `skewness`, `sample_attempts` args of sample_priority() are ignored, sequences of size other than
+          `priority_sample_size` are sampled by ArrayMemory rebalanced replay;
+        - sample_priority() returned rollout holds absolute end frame index as `memory_index` attribute.
+    """
+    def __init__(self, history_size, max_sample_size, priority_sample_size, log_level=WARNING,
+                 rollout_provider=None, task=-1, reward_threshold=0.1, use_priority_sampling=False,
+                 window_keys=None, window_shift=None, priority_alpha=0.6, priority_epsilon=0.01):
+        """
+
+        Args:
+            history_size:           number of experiences stored;
+            max_sample_size:        maximum allowed sample size (e.g. off-policy rollout length);
+            priority_sample_size:   sample size of priority_sample() method
+            log_level:              int, logbook.level;
+            rollout_provider:       callable returning list of Rollouts NOT USED
+            task:                   parent worker id;
+            reward_threshold:       NOT USED for prioritized sampling;
+            use_priority_sampling:  bool, enables sample_priority() method;
+            window_keys:            list of time-embedded `state` keys to store deduplicated, see ArrayMemory;
+            window_shift:           int, expected number of bars appended to window per frame;
+            priority_alpha:         priority exponent, 0 means uniform sampling of valid sequences;
+            priority_epsilon:       priority offset for zero-reward frames.
+        """
+        super(PrioritizedMemory, self).__init__(
+            history_size=history_size,
+            max_sample_size=max_sample_size,
+            priority_sample_size=priority_sample_size,
+            log_level=log_level,
+            rollout_provider=rollout_provider,
+            task=task,
+            reward_threshold=reward_threshold,
+            use_priority_sampling=use_priority_sampling,
+            window_keys=window_keys,
+            window_shift=window_shift,
+        )
+        self.priority_alpha = priority_alpha
+        self.priority_epsilon = priority_epsilon
+        self.sequence_size = min(self.priority_sample_size, self.max_sample_size)
+        self._tree = SumTree(history_size)
+        # Absolute index of most recent terminal frame:
+        self._last_terminal_index = -1
+
+    def _set_priorities(self, start_index, reward, terminal):
+        """
+        Sets initial priorities and validity for just written frames `[start_index, start_index + len(reward))`.
+        """
+        size = len(terminal)
+        index = start_index + np.arange(size)
+
+        # Most recent terminal frame strictly before every frame:
+        terminal_index = np.where(terminal, index, -1)
+        previous_terminal = np.maximum.accumulate(np.append(self._last_terminal_index, terminal_index[:-1]))
+        if terminal.any():
+            self._last_terminal_index = index[terminal][-1]
+
+        # Sequence ending at frame is valid if it holds no terminal frames but last and fits into memory:
+        top_frame_index = max(self._count - self._history_size, 0)
+        is_valid = (index - previous_terminal >= self.sequence_size) & \
+            (index - self.sequence_size + 1 >= top_frame_index)
+        priority = (np.abs(np.reshape(reward, [size, -1])[:, 0]) + self.priority_epsilon) ** self.priority_alpha
+        self._tree.update(index % self._history_size, np.where(is_valid, priority, 0.0))
+
+        # Sequences starting at overwritten frames are no longer valid:
+        evicted_end = index - self._history_size + self.sequence_size - 1
+        evicted_end = evicted_end[(evicted_end >= top_frame_index) & (evicted_end < start_index)]
+        if evicted_end.size > 0:
+            self._tree.update(evicted_end % self._history_size, 0.0)
+
+    def add(self, frame):
+        """
+        Writes single experience frame to memory.
+
+        Args:
+            frame:  dictionary of values.
+        """
+        count = self._count
+        super(PrioritizedMemory, self).add(frame)
+        if self._count > count:
+            self._set_priorities(
+                count,
+                np.asarray([frame['reward']]),
+                np.asarray([frame['terminal']], dtype=bool),
+            )
+
+    def add_rollout(self, rollout):
+        """
+        Writes frames from given rollout to memory with respect to episode continuation.
+
+        Args:
+            rollout:    `Rollout` or `ArrayRollout` instance.
+        """
+        count = self._count
+        if count > 0:
+            last = self._last_slot()
+            was_terminal = bool(self._column('terminal')[last])
+
+        super(PrioritizedMemory, self).add_rollout(rollout)
+
+        if count > 0 and not was_terminal and self._column('terminal')[last]:
+            # Last stored frame has been marked as terminal:
+            self._last_terminal_index = count - 1
+
+        if self._count > count:
+            slots = (count + np.arange(self._count - count)) % self._history_size
+            self._set_priorities(count, self._column('reward')[slots], self._column('terminal')[slots])
+
+    def update_priorities(self, index, priority):
+        """
+        Sets priorities of sequences ending at given frames; frames no longer valid are ignored.
+
+        Args:
+            index:      int or array of absolute end frame indices, e.g. sampled rollout `memory_index`;
+            priority:   scalar or array of new priorities values, before `priority_alpha` exponent.
+        """
+        index, priority = np.broadcast_arrays(np.atleast_1d(index), np.atleast_1d(priority))
+        is_stored = index >= max(self._count - self._history_size, 0) + self.sequence_size - 1
+        is_valid = is_stored & (self._tree.get(index % self._history_size) > 0)
+        if is_valid.any():
+            self._tree.update(
+                index[is_valid] % self._history_size,
+                (np.abs(priority[is_valid]) + self.priority_epsilon) ** self.priority_alpha,
+            )
+
+    def _sample_priority(self, size=None, exact_size=False, skewness=2, sample_attempts=100):
+        """
+        Samples sequence of successive frames with probability proportional to sequence priority.
+
+        Args:
+            size:               sample size, must be <= self.max_sample_size;
+            exact_size:         NOT USED, samples are always of exact size;
+            skewness:           NOT USED;
+            sample_attempts:    NOT USED.
+
+        Returns:
+            instance of ArrayRollout().
+        """
+        if size is None:
+            size = self.priority_sample_size
+
+        if size > self.max_sample_size:
+            size = self.max_sample_size
+
+        if size != self.sequence_size or self._tree.total() <= 0:
+            return super(PrioritizedMemory, self)._sample_priority(size, exact_size, skewness, sample_attempts)
+
+        slot = self._tree.find(np.random.uniform(0, self._tree.total()))
+        end_frame_index = self._count - 1 - (self._count - 1 - slot) % self._history_size
+        sampled_rollout = self._gather((end_frame_index - size + 1 + np.arange(size)) % self._history_size)
+        sampled_rollout.memory_index = end_frame_index
+
+        return sampled_rollout
+
+
 class _DummyMemory:
 
     def __init__(self):
@@ -8,6 +8,8 @@
 # Async. framework code comes from OpenAI repository under MIT licence:
 # https://github.com/openai/universe-starter-agent
 #
+import threading
+
 import tensorflow as tf
 
 from btgym.algorithms.nn.networks import *
@@ -247,6 +249,64 @@ class BaseAacPolicy(object):
         #print('ops:', [self.on_sample, self.on_vf, self.on_lstm_state_out])
         return sess.run([self.on_sample, self.on_logits, self.on_vf, self.on_lstm_state_out], feeder)
 
+    def act_fused(self, observation, lstm_state, action_reward, last_observation=None):
+        """
+        Predicts action and estimates auxiliary targets for transition from `last_observation` to
+        `observation` with single session run, reusing pre-bound feed dictionary.
+
+        Args:
+            observation:        dictionary containing single observation
+            lstm_state:         lstm context value
+            action_reward:      concatenated last action-reward value
+            last_observation:   previous observation, if given - auxiliary targets are estimated
+
+        Returns:
+            (action [one-hot], actions logits, V-fn value, output RNN state) tuple, same as act() output;
+            dictionary of estimated auxiliary targets, keyed same as `callback` entries they replace.
+
+        Note:
+            only default `pixel_change` callback is fused, other callbacks should be called as usual.
+        """
+        sess = tf.get_default_session()
+        try:
+            feeder = self._fused_feeds.feeder
+
+        except AttributeError:
+            feeder = self._make_fused_feeder()
+
+        feeder.update(feed_dict_rnn_context(self.on_lstm_state_pl_flatten, lstm_state))
+        feeder.update(feed_dict_from_nested(self.on_state_in, observation, expand_batch=True))
+        feeder[self.on_a_r_in] = [action_reward]
+        fetches = [self.on_sample, self.on_logits, self.on_vf, self.on_lstm_state_out]
+
+        if last_observation is not None and self.callback.get('pixel_change') == self.get_pc_target:
+            feeder[self.pc_change_state_in] = observation['external']
+            feeder[self.pc_change_last_state_in] = last_observation['external']
+            action, logits, value, context, pc_target = sess.run(fetches + [self.pc_target], feeder)
+
+            return (action, logits, value, context), {'pixel_change': pc_target[0, ..., 0]}
+
+        else:
+            return tuple(sess.run(fetches, feeder)), {}
+
+    def _make_fused_feeder(self):
+        """
+        Makes feed dictionary for `act_fused()` with constant entries bound,
+        one per thread as several runner threads can share policy.
+        """
+        try:
+            fused_feeds = self._fused_feeds
+
+        except AttributeError:
+            fused_feeds = self._fused_feeds = threading.local()
+
+        fused_feeds.feeder = {
+            self.on_batch_size: 1,
+            self.on_time_length: 1,
+            self.train_phase: False
+        }
+        return fused_feeds.feeder
+
     def get_value(self, observation, lstm_state, action_reward):
         """
         Estimates policy V-function.
@@ -273,6 +333,72 @@ class BaseAacPolicy(object):
 
         return sess.run(self.on_vf, feeder)[0]
 
+    def _batch_feeder(self, observations, lstm_states, action_rewards):
+        """
+        Returns feed dictionary for single time-step run over batch of parallel environments.
+        """
+        feeder = feed_dict_rnn_context(self.on_lstm_state_pl_flatten, nested_stack(lstm_states, concatenate=True))
+        feeder.update(feed_dict_from_nested(self.on_state_in, nested_stack(observations)))
+        feeder.update(
+            {
+                self.on_a_r_in: np.stack(action_rewards, axis=0),
+                self.on_batch_size: len(observations),
+                self.on_time_length: 1,
+                self.train_phase: False
+            }
+        )
+        return feeder
+
+    def act_batch(self, observations, lstm_states, action_rewards):
+        """
+        Predicts actions for several parallel environments with single session run.
+
+        Args:
+            observations:   list of single observation dictionaries
+            lstm_states:    list of lstm context values
+            action_rewards: list of concatenated last action-reward values
+
+        Returns:
+            list of (action [one-hot], action logits, V-fn value, output RNN state) tuples
+            for every environment, shaped same as act() output.
+
+        Note:
+            `on_sample` op samples for first batch entry only, so actions are sampled from logits
+            by Gumbel-max trick, which is the same categorical distribution.
+        """
+        sess = tf.get_default_session()
+        size = len(observations)
+        logits, value, context = sess.run(
+            [self.on_logits, self.on_vf, self.on_lstm_state_out],
+            self._batch_feeder(observations, lstm_states, action_rewards)
+        )
+        gumbel = -np.log(-np.log(np.random.uniform(size=logits.shape)))
+        action = np.eye(logits.shape[-1], dtype=np.float32)[np.argmax(logits + gumbel, axis=-1)]
+
+        return list(
+            zip(
+                action,
+                nested_unstack(logits, size),
+                nested_unstack(value, size),
+                nested_unstack(context, size),
+            )
+        )
+
+    def get_value_batch(self, observations, lstm_states, action_rewards):
+        """
+        Estimates policy V-function for several parallel environments with single session run.
+
+        Args:
+            observations:   list of single observation dictionaries
+            lstm_states:    list of lstm context values
+            action_rewards: list of concatenated last action-reward values
+
+        Returns:
+            array of V-function values
+        """
+        sess = tf.get_default_session()
+        return sess.run(self.on_vf, self._batch_feeder(observations, lstm_states, action_rewards))
+
     def get_pc_target(self, state, last_state, **kwargs):
         """
         Estimates pixel-control task target.
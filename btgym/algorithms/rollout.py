@@ -14,7 +14,7 @@ from btgym.algorithms.utils import batch_pad
 
 
 # Info:
-ExperienceConfig = ['position', 'state', 'action', 'reward', 'value', 'terminal', 'r', 'context',
+ExperienceConfig = ['position', 'state', 'action', 'reward', 'value', 'logits', 'terminal', 'r', 'context',
                     'last_action_reward', 'pixel_change']
 
 
@@ -134,8 +134,8 @@ class Rollout(dict):
         # Total accumulated empirical return:
         rewards = np.asarray(self['reward'])
         rollout_r = self['r'][-1][0]  # bootstrapped V_next or 0 if terminal
-        vpred_t = np.asarray(self['value'] + [rollout_r])
-        rewards_plus_v = np.asarray(self['reward'] + [rollout_r])
+        vpred_t = np.append(np.reshape(self['value'], [-1]), rollout_r)
+        rewards_plus_v = np.append(rewards, rollout_r)
         batch['r'] = discount(rewards_plus_v, gamma)[:-1]
 
         # This formula for the advantage is (16) from "Generalized Advantage Estimation" paper:
@@ -288,3 +288,264 @@ class Rollout(dict):
                 print('length: {}, type: {}, shape of element: {}\n'.format(len(_struct), type(_struct[0]), _struct[0].shape))
             except:
                 print('length: {}, type: {}\n'.format(len(_struct), type(_struct[0])))
+
+
+class ArrayRollout(Rollout):
+    """
+    Columnar experience rollout backed by preallocated typed ndarrays.
+
+    Buffers of `[length, *frame_entry_shape]` are allocated from the structure of the first frame added
+    and every following frame is written in place. Dictionary access returns views of first `size` records,
+    so process() gets ready arrays without list-to-array conversion; get_frame() returns views of single record.
+
+    Note:
+        - all frames are expected to share the structure and shapes of the first one;
+        - buffers are doubled in size if more than `length` frames are added.
+    """
+
+    def __init__(self, length=None):
+        """
+        Args:
+            length:     int, expected number of frames, e.g. runner `rollout_length`.
+        """
+        super(ArrayRollout, self).__init__()
+        self.length = length
+        self._buffers = None  # nested structure of buffers, same as frame one
+        self._leaves = None  # flat list of [path, buffer] pairs for fast in-place writes
+        self._synced_size = None
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Makes rollout holding given arrays as buffers, no copy is made.
+
+        Args:
+            arrays:     [nested] dictionary of arrays sharing first (time) dimension.
+
+        Returns:
+            ArrayRollout instance of size equal to arrays first dimension.
+        """
+        rollout = cls()
+        rollout._leaves = []
+        rollout._buffers = rollout._allocate(arrays, buffer_fn=lambda array: array)
+        rollout.size = rollout.length = rollout._leaves[0][1].shape[0]
+        return rollout
+
+    def __reduce__(self):
+        # Pickle filled records only, e.g. to pass rollout to another process:
+        if self._buffers is None:
+            return type(self), (self.length,)
+
+        size = self.size
+        return self.from_arrays, (self._map(self._buffers, lambda buffer: buffer[:size]),)
+
+    def allocate(self, values):
+        """
+        Allocates buffers for `length` frames structured as given frame, if not allocated yet.
+
+        Args:
+            values:    [nested] dictionary of values.
+        """
+        if self._buffers is None:
+            if self.length is None:
+                self.length = 1
+            self._leaves = []
+            self._buffers = self._allocate(values)
+
+    def _allocate(self, values, path=(), buffer_fn=None):
+        """
+        Returns nested structure of buffers for given frame and fills in flat leaves list.
+        """
+        if isinstance(values, dict):
+            return {key: self._allocate(value, path + (key,), buffer_fn) for key, value in values.items()}
+
+        elif isinstance(values, LSTMStateTuple):
+            return LSTMStateTuple(
+                *[self._allocate(value, path + (i,), buffer_fn) for i, value in enumerate(values)]
+            )
+
+        elif isinstance(values, tuple):
+            return tuple([self._allocate(value, path + (i,), buffer_fn) for i, value in enumerate(values)])
+
+        else:
+            if buffer_fn is not None:
+                buffer = buffer_fn(values)
+
+            else:
+                value = np.asarray(values)
+                if value.dtype == object:
+                    buffer = np.empty(self.length, dtype=object)
+
+                else:
+                    buffer = np.empty((self.length,) + value.shape, dtype=value.dtype)
+
+            self._leaves.append([path, buffer])
+            return buffer
+
+    def _grow(self):
+        """
+        Doubles capacity of all buffers.
+        """
+        for leaf in self._leaves:
+            leaf[1] = np.concatenate([leaf[1], np.empty_like(leaf[1])], axis=0)
+
+        self._rebuild()
+        self.length *= 2
+
+    def _rebuild(self):
+        """
+        Restores nested buffers structure from flat leaves list.
+        """
+        leaves = iter(self._leaves)
+        self._buffers = self._map(self._buffers, lambda buffer: next(leaves)[1])
+        self._synced_size = None
+
+    def _map(self, struct, fn):
+        """
+        Applies `fn` to every buffer of nested structure, preserving containers.
+        """
+        if isinstance(struct, dict):
+            return {key: self._map(value, fn) for key, value in struct.items()}
+
+        elif isinstance(struct, LSTMStateTuple):
+            return LSTMStateTuple(*[self._map(value, fn) for value in struct])
+
+        elif isinstance(struct, tuple):
+            return tuple([self._map(value, fn) for value in struct])
+
+        else:
+            return fn(struct)
+
+    def write(self, values, index):
+        """
+        Writes data to buffers in place.
+
+        Args:
+            values:     [nested] dictionary of values for single frame or of arrays for several frames;
+            index:      int, slice or array of buffer positions to write to.
+        """
+        promoted = False
+        for leaf in self._leaves:
+            value = values
+            for key in leaf[0]:
+                value = value[key]
+
+            if leaf[1].dtype.kind in 'biu' and np.asarray(value).dtype.kind in 'fc':
+                # Integer buffer inferred from first frame (e.g. zero reward), promote to keep fractions:
+                leaf[1] = leaf[1].astype(np.result_type(leaf[1].dtype, np.asarray(value).dtype))
+                promoted = True
+
+            leaf[1][index] = value
+
+        if promoted:
+            self._rebuild()
+
+    def gather(self, index):
+        """
+        Collects records at given positions.
+
+        Args:
+            index:      slice or array of buffer positions.
+
+        Returns:
+            new ArrayRollout holding copies of selected records.
+        """
+        return self.from_arrays(self._map(self._buffers, lambda buffer: np.asarray(buffer[index]).copy()))
+
+    def add(self, values, _struct=None):
+        """
+        Writes single experience frame to rollout buffers.
+
+        Args:
+            values:    [nested] dictionary of values.
+        """
+        self.allocate(values)
+        if self.size >= self.length:
+            self._grow()
+
+        self.write(values, self.size)
+        self.size += 1
+
+    def _sync(self):
+        """
+        Refreshes dictionary entries as views of first `size` records.
+        """
+        if self._synced_size != self.size:
+            dict.clear(self)
+            if self._buffers is not None:
+                size = self.size
+                dict.update(self, self._map(self._buffers, lambda buffer: buffer[:size]))
+            self._synced_size = self.size
+
+    def __getitem__(self, key):
+        self._sync()
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        self._sync()
+        return dict.__contains__(self, key)
+
+    def __iter__(self):
+        self._sync()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._sync()
+        return dict.__len__(self)
+
+    def get(self, key, default=None):
+        self._sync()
+        return dict.get(self, key, default)
+
+    def keys(self):
+        self._sync()
+        return dict.keys(self)
+
+    def values(self):
+        self._sync()
+        return dict.values(self)
+
+    def items(self):
+        self._sync()
+        return dict.items(self)
+
+    def get_frame(self, idx, _struct=None):
+        """
+        Extracts single experience from rollout.
+
+        Args:
+            idx:    experience position
+
+        Returns:
+            frame as [nested] dictionary of buffer views
+        """
+        # No idx range checks here!
+        if idx < 0:
+            idx += self.size
+        return self._map(self._buffers, lambda buffer: buffer[idx])
+
+    def pop_frame(self, idx, _struct=None):
+        """
+        Pops single experience from rollout.
+
+        Args:
+            idx:    experience position
+
+        Returns:
+            frame as [nested] dictionary; views for last frame, copies otherwise
+        """
+        # No idx range checks here!
+        if idx < 0:
+            idx += self.size
+
+        if idx == self.size - 1:
+            frame = self.get_frame(idx)
+
+        else:
+            frame = self._map(self._buffers, lambda buffer: np.copy(buffer[idx]))
+            for _, buffer in self._leaves:
+                buffer[idx:self.size - 1] = buffer[idx + 1:self.size]
+
+        self.size -= 1
+        self._synced_size = None
+        return frame
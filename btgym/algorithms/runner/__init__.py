@@ -1,2 +1,3 @@
 from .base import BaseEnvRunnerFn
-from .threadrunner import RunnerThread
\ No newline at end of file
+from .threadrunner import RunnerThread
+from .batch import BatchEnvRunnerFn, BatchRunnerThread
@@ -1,8 +1,23 @@
 import numpy as np
 
-from btgym.algorithms.rollout import Rollout
+from btgym.algorithms.rollout import ArrayRollout
 from btgym.algorithms.memory import _DummyMemory
 
+
+def _estimate_next(policy, state, context, action, reward, last_state, terminal):
+    """
+    Estimates policy for the step next to taken one along with auxiliary targets of taken step
+    by single policy call, unless episode is over.
+
+    Returns:
+        policy.act() output or None, dictionary of auxiliary targets
+    """
+    if terminal:
+        return None, {}
+
+    return policy.act_fused(state, context, np.concatenate([action, np.asarray([reward])], axis=-1), last_state)
+
+
 def BaseEnvRunnerFn(sess,
                     env,
                     policy,
@@ -35,6 +50,10 @@ def BaseEnvRunnerFn(sess,
 
     Yelds:
         collected data as dictionary of on_policy, off_policy rollouts and episode statistics.
+
+    Note:
+        policy is estimated for next step right after environment step, along with auxiliary targets
+        of the step taken, see `policy.act_fused()`; rollout bootstrap value comes from that estimation.
     """
     if memory_config is not None:
         memory = memory_config['class_ref'](**memory_config['kwargs'])
@@ -63,16 +82,24 @@ def BaseEnvRunnerFn(sess,
     test_ep_stat = None
     render_stat = None
 
+    # Policy estimation for next step, made along with auxiliary targets of current one:
+    next_estimation = None
+
     while True:
         terminal_end = False
-        rollout = Rollout()
+        rollout = ArrayRollout(rollout_length)
 
-        action, _, value_, context = policy.act(last_state, last_context, last_action_reward)
+        if next_estimation is None:
+            action, logits, value_, context = policy.act(last_state, last_context, last_action_reward)
+
+        else:
+            action, logits, value_, context = next_estimation
 
         #log.debug('*: A: {}, V: {}, step: {} '.format(action, value_, length))
 
         # argmax to convert from one-hot:
         state, reward, terminal, info = env.step(action.argmax())
+        next_estimation, aux_targets = _estimate_next(policy, state, context, action, reward, last_state, terminal)
 
         # Partially collect first experience of rollout:
         last_experience = {
@@ -81,13 +108,16 @@ def BaseEnvRunnerFn(sess,
             'action': action,
             'reward': reward,
             'value': value_,
+            'logits': logits,
             'terminal': terminal,
             'context': last_context,
             'last_action_reward': last_action_reward,
         }
+        last_experience.update(aux_targets)
         # Execute user-defined callbacks to policy, if any:
         for key, callback in policy.callback.items():
-            last_experience[key] = callback(**locals())
+            if key not in aux_targets:
+                last_experience[key] = callback(**locals())
 
         length += 1
         reward_sum += reward
@@ -100,12 +130,15 @@ def BaseEnvRunnerFn(sess,
         for roll_step in range(1, rollout_length):
             if not terminal:
                 # Continue adding experiences to rollout:
-                action, _, value_, context = policy.act(last_state, last_context, last_action_reward)
+                action, logits, value_, context = next_estimation
 
                 #log.debug('A: {}, V: {}, step: {} '.format(action, value_, length))
 
                 # Argmax to convert from one-hot:
                 state, reward, terminal, info = env.step(action.argmax())
+                next_estimation, aux_targets = _estimate_next(
+                    policy, state, context, action, reward, last_state, terminal
+                )
 
                 # Partially collect next experience:
                 experience = {
@@ -114,13 +147,16 @@ def BaseEnvRunnerFn(sess,
                     'action': action,
                     'reward': reward,
                     'value': value_,
+                    'logits': logits,
                     'terminal': terminal,
                     'context': last_context,
                     'last_action_reward': last_action_reward,
                     #'pixel_change': 0 #policy.get_pc_target(state, last_state),
                 }
+                experience.update(aux_targets)
                 for key, callback in policy.callback.items():
-                    experience[key] = callback(**locals())
+                    if key not in aux_targets:
+                        experience[key] = callback(**locals())
 
                 # Bootstrap to complete and push previous experience:
                 last_experience['r'] = value_
@@ -149,7 +185,7 @@ def BaseEnvRunnerFn(sess,
                     episode_stat = env.get_stat()  # get episode statistic
                     last_i = info[-1]  # pull most recent info
                     cpu_time += [episode_stat['runtime'].total_seconds()]
-                    final_value += [last_i['broker_value']]
+                    final_value += [last_i.get('broker_value', np.nan)]  # not reported with `none` info policy
                     total_steps += [episode_stat['length']]
 
                 # Episode statistics:
@@ -220,10 +256,8 @@ def BaseEnvRunnerFn(sess,
         # After rolling `rollout_length` or less (if got `terminal`)
         # complete final experience of the rollout:
         if not terminal_end:
-            # Bootstrap:
-            last_experience['r'] = np.asarray(
-                [policy.get_value(last_state, last_context, last_action_reward)]
-            )
+            # Bootstrap with V-fn value of next step estimation already made:
+            last_experience['r'] = np.asarray([next_estimation[2][0]])
 
         else:
             last_experience['r'] = np.asarray([0.0])
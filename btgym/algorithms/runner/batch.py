@@ -0,0 +1,419 @@
+from logbook import Logger, StreamHandler, WARNING
+import sys
+from collections import deque
+
+import numpy as np
+import six.moves.queue as queue
+import threading
+
+from btgym.algorithms.rollout import ArrayRollout
+from btgym.algorithms.memory import _DummyMemory
+
+
+class _EnvLoop(object):
+    """
+    Single environment part of batched runner: holds environment episode and rollout state,
+    same runtime logic as `BaseEnvRunnerFn` with policy estimations provided from outside.
+    """
+    def __init__(self, sess, env, policy, task, rollout_length, episode_summary_freq, env_render_freq,
+                 atari_test, memory_config):
+        self.sess = sess
+        self.env = env
+        self.policy = policy
+        self.task = task
+        self.rollout_length = rollout_length
+        self.episode_summary_freq = episode_summary_freq
+        self.env_render_freq = env_render_freq
+        self.atari_test = atari_test
+
+        if memory_config is not None:
+            self.memory = memory_config['class_ref'](**memory_config['kwargs'])
+
+        else:
+            self.memory = _DummyMemory()
+        # Pass sample config to environment:
+        self.last_state = env.reset(**policy.get_sample_config())
+        self.last_context = policy.get_initial_features(state=self.last_state)
+        self.length = 0
+        self.local_episode = 0
+        self.reward_sum = 0
+        self._reset_last_action_reward()
+
+        # Summary averages accumulators:
+        self.total_r = []
+        self.cpu_time = []
+        self.final_value = []
+        self.total_steps = []
+        self.total_steps_atari = []
+
+        self.ep_stat = None
+        self.test_ep_stat = None
+        self.render_stat = None
+
+        self._new_rollout()
+
+    def _reset_last_action_reward(self):
+        self.last_action = np.zeros(self.env.action_space.n)
+        self.last_action[0] = 1
+        self.last_reward = 0.0
+        self.last_action_reward = np.concatenate([self.last_action, np.asarray([self.last_reward])], axis=-1)
+
+    def _new_rollout(self):
+        self.rollout = ArrayRollout(self.rollout_length)
+        self.last_experience = None
+        self.roll_step = 0
+        self.terminal_end = False
+
+    def policy_input(self):
+        """
+        Returns:
+            observation, context and last action-reward to estimate policy at.
+        """
+        return self.last_state, self.last_context, self.last_action_reward
+
+    def step(self, action, logits, value_, context):
+        """
+        Makes environment step with given policy estimation.
+
+        Returns:
+            True if rollout is done.
+        """
+        # Argmax to convert from one-hot:
+        state, reward, terminal, info = self.env.step(action.argmax())
+
+        # Partially collect next experience:
+        experience = {
+            'position': {'episode': self.local_episode, 'step': self.length},
+            'state': self.last_state,
+            'action': action,
+            'reward': reward,
+            'value': value_,
+            'logits': logits,
+            'terminal': terminal,
+            'context': self.last_context,
+            'last_action_reward': self.last_action_reward,
+        }
+        # Execute user-defined callbacks to policy, if any:
+        for key, callback in self.policy.callback.items():
+            experience[key] = callback(
+                state=state,
+                last_state=self.last_state,
+                action=action,
+                reward=reward,
+                terminal=terminal,
+                info=info,
+            )
+
+        if self.last_experience is not None:
+            # Bootstrap to complete and push previous experience:
+            self.last_experience['r'] = value_
+            self.rollout.add(self.last_experience)
+            self.memory.add(self.last_experience)
+
+        # Housekeeping:
+        self.length += 1
+        self.reward_sum += reward
+        self.last_state = state
+        self.last_context = context
+        self.last_action = action
+        self.last_reward = reward
+        self.last_action_reward = np.concatenate([self.last_action, np.asarray([self.last_reward])], axis=-1)
+        self.last_experience = experience
+        self.roll_step += 1
+
+        if terminal:
+            self._end_episode(state, info)
+
+        return terminal or self.roll_step >= self.rollout_length
+
+    def _end_episode(self, state, info):
+        """
+        Collects episode summaries and resets environment.
+        """
+        # Finished episode within last taken step:
+        self.terminal_end = True
+        # Accumulate values for averaging:
+        self.total_r += [self.reward_sum]
+        self.total_steps_atari += [self.length]
+        if not self.atari_test:
+            episode_stat = self.env.get_stat()  # get episode statistic
+            last_i = info[-1]  # pull most recent info
+            self.cpu_time += [episode_stat['runtime'].total_seconds()]
+            self.final_value += [last_i.get('broker_value', np.nan)]  # not reported with `none` info policy
+            self.total_steps += [episode_stat['length']]
+
+        # Episode statistics:
+        try:
+            # Was it test episode ( `type` in metadata is not zero)?
+            is_test_episode = not self.atari_test and bool(state['metadata']['type'])
+
+        except KeyError:
+            is_test_episode = False
+
+        if is_test_episode:
+            self.test_ep_stat = dict(
+                total_r=self.total_r[-1],
+                final_value=self.final_value[-1],
+                steps=self.total_steps[-1]
+            )
+        else:
+            if self.local_episode % self.episode_summary_freq == 0:
+                if not self.atari_test:
+                    # BTgym:
+                    self.ep_stat = dict(
+                        total_r=np.average(self.total_r),
+                        cpu_time=np.average(self.cpu_time),
+                        final_value=np.average(self.final_value),
+                        steps=np.average(self.total_steps)
+                    )
+                else:
+                    # Atari:
+                    self.ep_stat = dict(
+                        total_r=np.average(self.total_r),
+                        steps=np.average(self.total_steps_atari)
+                    )
+                self.total_r = []
+                self.cpu_time = []
+                self.final_value = []
+                self.total_steps = []
+                self.total_steps_atari = []
+
+        if self.task == 0 and self.local_episode % self.env_render_freq == 0:
+            if not self.atari_test:
+                # Render environment (chief worker only, and not in atari atari_test mode):
+                self.render_stat = {
+                    mode: self.env.render(mode)[None, :] for mode in self.env.render_modes
+                }
+            else:
+                # Atari:
+                self.render_stat = dict(render_atari=state['external'][None, :] * 255)
+
+        # New episode:
+        self.last_state = self.env.reset(**self.policy.get_sample_config())
+        self.last_context = self.policy.get_initial_features(state=self.last_state, context=self.last_context)
+        self.length = 0
+        self.reward_sum = 0
+        self._reset_last_action_reward()
+
+        # Increment global and local episode counts:
+        self.sess.run(self.policy.inc_episode)
+        self.local_episode += 1
+
+    def finish_rollout(self, value=None):
+        """
+        Completes final experience of the rollout.
+
+        Args:
+            value:  bootstrapped V-fn value for non-terminal rollout end.
+
+        Returns:
+            collected data as dictionary of on_policy, off_policy rollouts and episode statistics or None
+            if replay memory is not filled yet.
+        """
+        if not self.terminal_end:
+            # Bootstrap:
+            self.last_experience['r'] = np.asarray([value])
+
+        else:
+            self.last_experience['r'] = np.asarray([0.0])
+
+        self.rollout.add(self.last_experience)
+
+        # Only training rollouts are added to replay memory:
+        try:
+            # Was it test (`type` in metadata is not zero)?
+            is_test = not self.atari_test and bool(self.last_experience['state']['metadata']['type'])
+
+        except KeyError:
+            is_test = False
+
+        if not is_test:
+            self.memory.add(self.last_experience)
+
+        data = None
+        if self.memory.is_full():
+            data = dict(
+                on_policy=self.rollout,
+                off_policy=self.memory.sample_uniform(sequence_size=self.rollout_length),
+                off_policy_rp=self.memory.sample_priority(exact_size=True),
+                ep_summary=self.ep_stat,
+                test_ep_summary=self.test_ep_stat,
+                render_summary=self.render_stat,
+            )
+            self.ep_stat = None
+            self.test_ep_stat = None
+            self.render_stat = None
+
+        self._new_rollout()
+
+        return data
+
+
+def BatchEnvRunnerFn(sess,
+                     envs,
+                     policy,
+                     task,
+                     rollout_length,
+                     summary_writer,
+                     episode_summary_freq,
+                     env_render_freq,
+                     atari_test,
+                     ep_summary,
+                     memory_config,
+                     log):
+    """
+    Synchronous multi-environment runner function: steps all environments together making single
+    batched policy estimation per step for all of them. Every environment gets own episodes, rollouts and
+    replay memory, same as with `BaseEnvRunnerFn`. Environment which has finished its rollout is not stepped
+    until all others finish theirs.
+
+    Args:
+        envs:                   list of environment instances
+        policy:                 policy instance
+        task:                   int
+        rollout_length:         int
+        episode_summary_freq:   int
+        env_render_freq:        int
+        atari_test:             bool, Atari or BTGyn
+        ep_summary:             dict of tf.summary op and placeholders
+        memory_config:          replay memory configuration dictionary
+        log:                    logbook logger
+
+    Yelds:
+        list of collected data dictionaries of on_policy, off_policy rollouts and episode statistics,
+        one for every environment.
+    """
+    loops = [
+        _EnvLoop(
+            sess,
+            env,
+            policy,
+            task + 0.01 * i,
+            rollout_length,
+            episode_summary_freq,
+            env_render_freq,
+            atari_test,
+            memory_config
+        ) for i, env in enumerate(envs)
+    ]
+    # Finished rollouts waiting for other environments ones:
+    pending = [deque() for loop in loops]
+
+    while True:
+        # Environments holding finished rollout wait for others to catch up, so at most one is pending:
+        active = [loop for loop, data in zip(loops, pending) if len(data) == 0]
+        estimations = policy.act_batch(*zip(*[loop.policy_input() for loop in active]))
+        done = [loop for loop, estimation in zip(active, estimations) if loop.step(*estimation)]
+
+        if len(done) > 0:
+            # Bootstrap rollouts ended by rollout_length:
+            bootstrap = [loop for loop in done if not loop.terminal_end]
+            values = dict()
+            if len(bootstrap) > 0:
+                values = dict(
+                    zip(
+                        bootstrap,
+                        policy.get_value_batch(*zip(*[loop.policy_input() for loop in bootstrap]))
+                    )
+                )
+            for loop in done:
+                data = loop.finish_rollout(values.get(loop))
+                if data is not None:
+                    pending[loops.index(loop)].append(data)
+
+            if all(pending):
+                yield [data.popleft() for data in pending]
+
+
+class BatchRunnerThread(threading.Thread):
+    """
+    Runner thread stepping several environments synchronously with batched policy estimation,
+    see `BatchEnvRunnerFn`. Data collected from every environment is put to its own queue, so
+    it can be used in place of list of `RunnerThread` instances via `queues` attribute.
+    """
+    def __init__(self,
+                 envs,
+                 policy,
+                 task,
+                 rollout_length,
+                 episode_summary_freq,
+                 env_render_freq,
+                 test,
+                 ep_summary,
+                 runner_fn_ref=BatchEnvRunnerFn,
+                 memory_config=None,
+                 log_level=WARNING, ):
+        """
+
+        Args:
+            envs:                   list of environment instances
+            policy:                 policy instance
+            task:                   int
+            rollout_length:         int
+            episode_summary_freq:   int
+            env_render_freq:        int
+            test:                   Atari or BTGyn
+            ep_summary:             tf.summary
+            runner_fn_ref:          callable defining batched runner execution logic
+            memory_config:          replay memory configuration dictionary
+            log_level:              int, logbook.level
+        """
+        threading.Thread.__init__(self)
+        self.queues = [queue.Queue(5) for env in envs]
+        self.rollout_length = rollout_length
+        self.envs = envs
+        self.policy = policy
+        self.runner_fn_ref = runner_fn_ref
+        self.daemon = True
+        self.sess = None
+        self.summary_writer = None
+        self.episode_summary_freq = episode_summary_freq
+        self.env_render_freq = env_render_freq
+        self.task = task
+        self.test = test
+        self.ep_summary = ep_summary
+        self.memory_config = memory_config
+        self.log_level = log_level
+        StreamHandler(sys.stdout).push_application()
+        self.log = Logger('BatchRunner_{}'.format(self.task), level=self.log_level)
+
+    def start_runner(self, sess, summary_writer):
+        try:
+            self.sess = sess
+            self.summary_writer = summary_writer
+            self.start()
+
+        except:
+            msg = 'start() exception occurred.\n\nPress `Ctrl-C` or jupyter:[Kernel]->[Interrupt] for clean exit.\n'
+            self.log.exception(msg)
+            raise RuntimeError
+
+    def run(self):
+        """Just keep running."""
+        try:
+            with self.sess.as_default():
+                self._run()
+
+        except:
+            msg = 'RunTime exception occurred.\n\nPress `Ctrl-C` or jupyter:[Kernel]->[Interrupt] for clean exit.\n'
+            self.log.exception(msg)
+            raise RuntimeError
+
+    def _run(self):
+        rollout_provider = self.runner_fn_ref(
+            self.sess,
+            self.envs,
+            self.policy,
+            self.task,
+            self.rollout_length,
+            self.summary_writer,
+            self.episode_summary_freq,
+            self.env_render_freq,
+            self.test,
+            self.ep_summary,
+            self.memory_config,
+            self.log
+        )
+        while True:
+            for runner_queue, data in zip(self.queues, next(rollout_provider)):
+                runner_queue.put(data, timeout=600.0)
@@ -0,0 +1,433 @@
+from logbook import Logger, StreamHandler, WARNING
+import sys
+import atexit
+import pickle
+import struct
+
+import numpy as np
+import six.moves.queue as queue
+import multiprocessing
+from multiprocessing import shared_memory
+
+from btgym.datafeed.shared import BTgymSharedData
+from btgym.algorithms.runner import BaseEnvRunnerFn
+
+# Runner processes are spawned: neither tf sessions nor zmq sockets are fork-safe:
+_context = multiprocessing.get_context('spawn')
+
+
+class SharedMemoryQueue(object):
+    """
+    Single producer, single consumer FIFO queue of fixed number of fixed size slots in shared memory segment.
+    Objects are serialized with pickle protocol 5: numpy arrays go out-of-band and are written directly to slot,
+    consumer makes single copy of slot content and rebuilds arrays on top of it.
+    Can be passed to spawned process as `Process` argument or attribute; segment is owned and
+    unlinked by creating process.
+    """
+    _header = struct.Struct('q')
+
+    def __init__(self, num_slots=5, slot_size=2**24):
+        """
+        Args:
+            num_slots:      int, queue capacity
+            slot_size:      int, slot size in bytes, should hold single pickled object
+        """
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        self.shm = shared_memory.SharedMemory(create=True, size=num_slots * slot_size)
+        self.is_owner = True
+        self._free = _context.Semaphore(num_slots)
+        self._filled = _context.Semaphore(0)
+        # Local producer and consumer positions:
+        self._head = 0
+        self._tail = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['shm'] = self.shm.name
+        state['is_owner'] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = BTgymSharedData._attach(state['shm'])
+
+    def put(self, obj, block=True, timeout=None):
+        """
+        Puts object to queue.
+
+        Raises:
+            queue.Full if no free slot is available within `timeout`;
+            ValueError if serialized object does not fit slot.
+        """
+        buffers = []
+        chunks = [pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)]
+        chunks += [buffer.raw() for buffer in buffers]
+        sizes = [memoryview(chunk).nbytes for chunk in chunks]
+        header = struct.pack('{}q'.format(len(chunks) + 1), len(chunks), *sizes)
+        if len(header) + sum(sizes) > self.slot_size:
+            raise ValueError(
+                'Serialized object size {} exceeds queue slot size {}'.format(len(header) + sum(sizes), self.slot_size)
+            )
+        if not self._free.acquire(block, timeout):
+            raise queue.Full
+
+        offset = (self._head % self.num_slots) * self.slot_size
+        self.shm.buf[offset: offset + len(header)] = header
+        offset += len(header)
+        for chunk, size in zip(chunks, sizes):
+            self.shm.buf[offset: offset + size] = memoryview(chunk).cast('B')
+            offset += size
+
+        self._head += 1
+        self._filled.release()
+
+    def get(self, block=True, timeout=None):
+        """
+        Removes and returns object from queue.
+
+        Raises:
+            queue.Empty if nothing is available within `timeout`.
+        """
+        if not self._filled.acquire(block, timeout):
+            raise queue.Empty
+
+        offset = (self._tail % self.num_slots) * self.slot_size
+        num_chunks = self._header.unpack_from(self.shm.buf, offset)[0]
+        sizes = struct.unpack_from('{}q'.format(num_chunks), self.shm.buf, offset + self._header.size)
+        offset += self._header.size * (num_chunks + 1)
+        data = memoryview(bytearray(self.shm.buf[offset: offset + sum(sizes)]))
+
+        self._tail += 1
+        self._free.release()
+
+        chunks = []
+        offset = 0
+        for size in sizes:
+            chunks.append(data[offset: offset + size])
+            offset += size
+
+        return pickle.loads(chunks[0], buffers=chunks[1:])
+
+    def close(self):
+        """
+        Releases shared memory; owner also removes segment.
+        """
+        self.shm.close()
+        if self.is_owner:
+            self.shm.unlink()
+
+
+class SharedWeights(object):
+    """
+    Versioned flat float32 copy of policy parameters in shared memory segment,
+    published by trainer process and fetched by runner processes.
+    """
+    def __init__(self, size):
+        """
+        Args:
+            size:   int, total number of parameters
+        """
+        self.size = size
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1) * 4)
+        self.is_owner = True
+        self._lock = _context.Lock()
+        self._version = _context.Value('q', 0, lock=False)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['shm'] = self.shm.name
+        state['is_owner'] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = BTgymSharedData._attach(state['shm'])
+
+    @property
+    def version(self):
+        return self._version.value
+
+    def publish(self, values):
+        """
+        Writes new parameters.
+
+        Args:
+            values:     list of parameters arrays
+        """
+        flat = np.ndarray((self.size,), dtype=np.float32, buffer=self.shm.buf)
+        with self._lock:
+            offset = 0
+            for value in values:
+                flat[offset: offset + np.size(value)] = np.reshape(value, [-1])
+                offset += np.size(value)
+            self._version.value += 1
+        del flat
+
+    def fetch(self, version=None):
+        """
+        Reads parameters if newer than given version.
+
+        Args:
+            version:    int, version of parameters caller already has
+
+        Returns:
+            flat copy of parameters or None, version of parameters
+        """
+        if version is not None and self._version.value == version:
+            return None, version
+
+        flat = np.ndarray((self.size,), dtype=np.float32, buffer=self.shm.buf)
+        with self._lock:
+            values = flat.copy()
+            version = self._version.value
+        del flat
+
+        return values, version
+
+    def close(self):
+        self.shm.close()
+        if self.is_owner:
+            self.shm.unlink()
+
+
+class _SampleConfigCycle(object):
+    """
+    Stateful train/test episodes cycle for runner process policy, same as trainer one,
+    see `BaseAAC.get_sample_config()`.
+    """
+    def __init__(self, episode_train_test_cycle, log):
+        self.num_train_episodes = episode_train_test_cycle[0]
+        self.num_test_episodes = episode_train_test_cycle[-1]
+        self.current_train_episode = 0
+        self.current_test_episode = 0
+        self.log = log
+
+    def get_sample_config(self, _new_trial=False):
+        from btgym.algorithms.aac import BaseAAC
+
+        return BaseAAC.get_sample_config(self, _new_trial)
+
+
+class RunnerProcess(_context.Process):
+    """
+    Environment runner living in separate process: makes own environment instance and own copy of policy
+    with separate tf session, so environment stepping and policy inference do not compete with trainer for
+    python interpreter lock. Collected data is sent back via `SharedMemoryQueue`, policy parameters are
+    received via `SharedWeights` every `sync_period` trainer calls of `sync_weights()`.
+    Exposes `start_runner()` and `queue`, same as `RunnerThread`.
+
+    Note:
+        episodes are counted by runner process local counter, trainer `global_episode` is not incremented;
+
+        process is not daemonic, since environment it runs starts own server processes; it is stopped
+        by `stop_runner()`, called at trainer process exit if not called before.
+    """
+    def __init__(self,
+                 env_config,
+                 policy,
+                 policy_config,
+                 task,
+                 rollout_length,
+                 episode_summary_freq,
+                 env_render_freq,
+                 test,
+                 runner_fn_ref=BaseEnvRunnerFn,
+                 memory_config=None,
+                 episode_train_test_cycle=(1,0),
+                 sync_period=1,
+                 queue_size=5,
+                 queue_slot_size=2**24,
+                 log_level=WARNING, ):
+        """
+
+        Args:
+            env_config:                 environment class and kwargs as dict(class_ref=..., kwargs=dict(...)),
+                                        instance is made inside runner process
+            policy:                     trainer local policy instance to get parameters from
+            policy_config:              policy class and kwargs, same as `policy` instance ones
+            task:                       int
+            rollout_length:             int
+            episode_summary_freq:       int
+            env_render_freq:            int
+            test:                       Atari or BTGyn
+            runner_fn_ref:              callable defining runner execution logic
+            memory_config:              replay memory configuration dictionary
+            episode_train_test_cycle:   tuple or list as (train_number, test_number)
+            sync_period:                int, send policy parameters to runner every i`th `sync_weights()` call
+            queue_size:                 int, number of rollouts can be held by data queue
+            queue_slot_size:            int, max. size of single pickled data object, in bytes
+            log_level:                  int, logbook.level
+        """
+        super(RunnerProcess, self).__init__()
+        self.queue = SharedMemoryQueue(queue_size, queue_slot_size)
+        self.weights = None
+        self.env_config = env_config
+        self.policy = policy
+        self.policy_config = policy_config
+        self.task = task
+        self.rollout_length = rollout_length
+        self.episode_summary_freq = episode_summary_freq
+        self.env_render_freq = env_render_freq
+        self.test = test
+        self.runner_fn_ref = runner_fn_ref
+        self.memory_config = memory_config
+        self.episode_train_test_cycle = episode_train_test_cycle
+        self.sync_period = sync_period
+        self.sync_steps = 0
+        self.stop_event = _context.Event()
+        self.daemon = False
+        self.log_level = log_level
+        StreamHandler(sys.stdout).push_application()
+        self.log = Logger('RunnerProcess_{}'.format(self.task), level=self.log_level)
+
+    def __getstate__(self):
+        # Trainer side objects are not passed to runner process:
+        state = self.__dict__.copy()
+        for key in ['policy', 'log']:
+            state.pop(key, None)
+        return state
+
+    def start_runner(self, sess, summary_writer):
+        try:
+            self.weights = SharedWeights(int(sum([np.prod(v.get_shape().as_list()) for v in self.policy.var_list])))
+            self.weights.publish(sess.run(self.policy.var_list))
+            self.start()
+            atexit.register(self.stop_runner)
+
+        except:
+            msg = 'start() exception occurred.\n\nPress `Ctrl-C` or jupyter:[Kernel]->[Interrupt] for clean exit.\n'
+            self.log.exception(msg)
+            raise RuntimeError
+
+    def stop_runner(self, timeout=60.0):
+        """
+        Asks runner process to finish current rollout and exit, closing its environment;
+        terminates process if it doesn't exit within `timeout` seconds. Releases shared memory.
+
+        Args:
+            timeout:    seconds, int
+        """
+        atexit.unregister(self.stop_runner)
+        if self.stop_event.is_set():
+            return
+
+        self.stop_event.set()
+        self.join(timeout)
+        if self.is_alive():
+            self.log.warning('Runner process failed to exit in {} sec., terminating.'.format(timeout))
+            self.terminate()
+            self.join()
+
+        self.queue.close()
+        self.weights.close()
+
+    @staticmethod
+    def sync_weights(sess, runners):
+        """
+        Sends trainer policy parameters to every runner process every its `sync_period` calls.
+        Parameters are fetched from trainer session once for all runners due.
+
+        Args:
+            sess:       tf session obj.
+            runners:    list of `RunnerProcess` instances sharing same trainer policy
+        """
+        due = []
+        for runner in runners:
+            runner.sync_steps += 1
+            if runner.sync_steps % runner.sync_period == 0:
+                due.append(runner)
+
+        if len(due) > 0:
+            values = sess.run(due[0].policy.var_list)
+            for runner in due:
+                runner.weights.publish(values)
+
+    def run(self):
+        """Just keep running."""
+        StreamHandler(sys.stdout).push_application()
+        self.log = Logger('RunnerProcess_{}'.format(self.task), level=self.log_level)
+        try:
+            self._run()
+
+        except:
+            msg = 'RunTime exception occurred.\n\nPress `Ctrl-C` or jupyter:[Kernel]->[Interrupt] for clean exit.\n'
+            self.log.exception(msg)
+            raise RuntimeError
+
+    def _run(self):
+        env = self.env_config['class_ref'](**self.env_config['kwargs'])
+        try:
+            self._run_env(env)
+
+        finally:
+            env.close()
+            self.queue.close()
+            self.weights.close()
+
+    def _run_env(self, env):
+        import tensorflow as tf
+
+        with tf.Graph().as_default():
+            with tf.variable_scope('local'):
+                policy = self.policy_config['class_ref'](**self.policy_config['kwargs'])
+                policy.global_episode = tf.get_variable(
+                    "runner_episode",
+                    [],
+                    tf.int32,
+                    initializer=tf.constant_initializer(
+                        0,
+                        dtype=tf.int32
+                    ),
+                    trainable=False
+                )
+                policy.inc_episode = policy.global_episode.assign_add(1)
+                policy.get_sample_config = _SampleConfigCycle(self.episode_train_test_cycle, self.log).get_sample_config
+
+            # Flat parameters to policy variables:
+            shapes = [v.get_shape().as_list() for v in policy.var_list]
+            flat_pl = tf.placeholder(tf.float32, [self.weights.size], name='runner_weights_pl')
+            split = tf.split(flat_pl, [int(np.prod(shape)) for shape in shapes])
+            set_weights = tf.group(
+                *[
+                    v.assign(tf.cast(tf.reshape(w, shape), v.dtype.base_dtype))
+                    for v, w, shape in zip(policy.var_list, split, shapes)
+                ]
+            )
+            config = tf.ConfigProto(
+                device_count={'GPU': 0},
+                intra_op_parallelism_threads=1,
+                inter_op_parallelism_threads=2,
+            )
+            with tf.Session(config=config) as sess:
+                sess.run(tf.global_variables_initializer())
+                values, version = self.weights.fetch()
+                sess.run(set_weights, feed_dict={flat_pl: values})
+
+                rollout_provider = self.runner_fn_ref(
+                    sess,
+                    env,
+                    policy,
+                    self.task,
+                    self.rollout_length,
+                    None,
+                    self.episode_summary_freq,
+                    self.env_render_freq,
+                    self.test,
+                    None,
+                    self.memory_config,
+                    self.log
+                )
+                while not self.stop_event.is_set():
+                    data = next(rollout_provider)
+                    while not self.stop_event.is_set():
+                        try:
+                            self.queue.put(data, timeout=1.0)
+                            break
+
+                        except queue.Full:
+                            pass
+
+                    values, version = self.weights.fetch(version)
+                    if values is not None:
+                        sess.run(set_weights, feed_dict={flat_pl: values})
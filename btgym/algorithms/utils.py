@@ -29,7 +29,7 @@ def rnn_placeholders(state):
         return tuple(structure)
 
 
-def nested_placeholders(ob_space, batch_dim=None, name='nested'):
+def nested_placeholders(ob_space, batch_dim=None, name='nested', dtype=tf.float32):
     """
     Given nested observation space as dictionary of shape tuples,
     returns nested state batch-wise placeholders.
@@ -38,18 +38,21 @@ def nested_placeholders(ob_space, batch_dim=None, name='nested'):
         ob_space:   [nested] dict of shapes
         name:       name scope
         batch_dim:  batch dimension
+        dtype:      placeholders dtype, should match environment observation dtype to avoid casting at feed time
     Returns:
         nested dictionary of placeholders
     """
     if isinstance(ob_space,dict):
-        out = {key: nested_placeholders(value, batch_dim, name + '_' + key) for key, value in ob_space.items()}
+        out = {
+            key: nested_placeholders(value, batch_dim, name + '_' + key, dtype) for key, value in ob_space.items()
+        }
         return out
     else:
-        out = tf.placeholder(tf.float32, [batch_dim] + list(ob_space), name + '_pl')
+        out = tf.placeholder(dtype, [batch_dim] + list(ob_space), name + '_pl')
         return out
 
 
-def flat_placeholders(ob_space, batch_dim=None, name='flt'):
+def flat_placeholders(ob_space, batch_dim=None, name='flt', dtype=tf.float32):
     """
     Given nested observation space as dictionary of shape tuples,
     returns flattened dictionary of batch-wise placeholders.
@@ -58,10 +61,105 @@ def flat_placeholders(ob_space, batch_dim=None, name='flt'):
         ob_space:   [nested dict] of tuples
         name:       name_scope
         batch_dim:  batch dimension
+        dtype:      placeholders dtype
     Returns:
         flat dictionary of tf.placeholders
     """
-    return flatten_nested(nested_placeholders(ob_space, batch_dim=batch_dim, name=name))
+    return flatten_nested(nested_placeholders(ob_space, batch_dim=batch_dim, name=name, dtype=dtype))
+
+
+class FlattenPlan(object):
+    """
+    Compiled layout of [nested] structure of dicts, tuples and LSTMStateTuples: leaves paths listed in
+    `flatten_nested` order (dict keys sorted) and builder restoring structure from flat list of leaves.
+    Lets same-structured values be flattened, processed leaf-wise and restored without walking
+    the structure and dispatching on types every time.
+    """
+    def __init__(self, struct, sequence_types=(tuple,)):
+        """
+        Args:
+            struct:             [nested] structure to compile plan for
+            sequence_types:     types of sequences to walk through besides dictionaries, others are leaves
+        """
+        self.sequence_types = sequence_types
+        self.paths = []
+        self._template = self._compile(struct, ())
+
+    def _compile(self, struct, path):
+        # Template is either leaf index or (container type, children templates) pair:
+        if isinstance(struct, dict):
+            return dict, [(key, self._compile(struct[key], path + (key,))) for key in sorted(struct.keys())]
+
+        elif isinstance(struct, self.sequence_types):
+            return type(struct), [self._compile(value, path + (i,)) for i, value in enumerate(struct)]
+
+        else:
+            self.paths.append(path)
+            return len(self.paths) - 1
+
+    def _build(self, template, leaves):
+        if isinstance(template, int):
+            return leaves[template]
+
+        container, children = template
+        if container is dict:
+            return {key: self._build(child, leaves) for key, child in children}
+
+        elif hasattr(container, '_fields'):
+            # LSTMStateTuple or other namedtuple:
+            return container(*[self._build(child, leaves) for child in children])
+
+        else:
+            return container([self._build(child, leaves) for child in children])
+
+    def flatten(self, struct):
+        """
+        Returns:
+            list of `struct` leaves.
+        """
+        leaves = []
+        for path in self.paths:
+            leaf = struct
+            for key in path:
+                leaf = leaf[key]
+            leaves.append(leaf)
+
+        return leaves
+
+    def unflatten(self, leaves):
+        """
+        Returns:
+            structure of plan layout holding given leaves.
+        """
+        return self._build(self._template, leaves)
+
+
+# Plans for long-living placeholders structures, as {id: (placeholders, plan, flat placeholders)}:
+_cached_plans = {}
+
+
+def _get_cached_plan(placeholders, struct, sequence_types=(tuple,)):
+    """
+    Returns plan compiled from `struct` on first call for given `placeholders` object
+    and flat list of placeholders.
+    """
+    try:
+        cached_placeholders, plan, flat_placeholders = _cached_plans[id(placeholders)]
+        if cached_placeholders is placeholders:
+            return plan, flat_placeholders
+
+    except KeyError:
+        pass
+
+    plan = FlattenPlan(struct, sequence_types)
+    if struct is placeholders:
+        flat_placeholders = plan.flatten(placeholders)
+
+    else:
+        flat_placeholders = list(placeholders)
+
+    _cached_plans[id(placeholders)] = (placeholders, plan, flat_placeholders)
+    return plan, flat_placeholders
 
 
 def feed_dict_from_nested(placeholder, value, expand_batch=False):
@@ -75,25 +173,20 @@ def feed_dict_from_nested(placeholder, value, expand_batch=False):
 
     Returns:
         flat feed_dict
-    """
-    assert_same_structure(placeholder, value, check_types=True)
-    return _flat_from_nested(placeholder, value, expand_batch)
-
-
-def _flat_from_nested(placeholder, value, expand_batch):
-    feed_dict = {}
-    if isinstance(placeholder, dict):
-        for key in placeholder.keys():
-            feed_dict.update(_flat_from_nested(placeholder[key], value[key], expand_batch))
 
-    else:
-        if expand_batch:
-            feed_dict.update({placeholder: [value]})
+    Note:
+        structures are checked on first call for given placeholders only,
+        later ones use cached flatten plan.
+    """
+    if _cached_plans.get(id(placeholder), (None,))[0] is not placeholder:
+        assert_same_structure(placeholder, value, check_types=True)
 
-        else:
-            feed_dict.update({placeholder: value})
+    plan, flat_placeholders = _get_cached_plan(placeholder, placeholder)
+    values = plan.flatten(value)
+    if expand_batch:
+        values = [[value] for value in values]
 
-    return feed_dict
+    return dict(zip(flat_placeholders, values))
 
 
 def feed_dict_rnn_context(placeholders, values):
@@ -107,7 +200,9 @@ def feed_dict_rnn_context(placeholders, values):
     Returns:
         flat feed dictionary
     """
-    return {key: value for key, value in zip(placeholders, flatten_nested(values))}
+    plan, flat_placeholders = _get_cached_plan(placeholders, values, (tuple, list))
+
+    return dict(zip(flat_placeholders, plan.flatten(values)))
 
 
 def as_array(struct):
@@ -174,6 +269,66 @@ def batch_stack(dict_list, _top=True):
     return batch
 
 
+def nested_stack(struct_list, concatenate=False):
+    """
+    Stacks [nested] structures of single environment values into one structure of batched arrays,
+    e.g. observations or rnn states of several parallel environments.
+
+    Args:
+        struct_list:    list of [nested] structures of the same layout;
+        concatenate:    if True - concatenate values along existing batch dimension (e.g. rnn states),
+                        else stack along new leading dimension (e.g. observations).
+
+    Returns:
+        [nested] structure of arrays of batch size len(struct_list).
+    """
+    master = struct_list[0]
+    if isinstance(master, dict):
+        return {key: nested_stack([struct[key] for struct in struct_list], concatenate) for key in master.keys()}
+
+    elif isinstance(master, LSTMStateTuple):
+        return LSTMStateTuple(
+            *[nested_stack([struct[i] for struct in struct_list], concatenate) for i in range(len(master))]
+        )
+
+    elif isinstance(master, tuple):
+        return tuple([nested_stack([struct[i] for struct in struct_list], concatenate) for i in range(len(master))])
+
+    elif concatenate:
+        return np.concatenate(struct_list, axis=0)
+
+    else:
+        return np.stack(struct_list, axis=0)
+
+
+def nested_unstack(struct, size):
+    """
+    Splits [nested] structure of batched arrays to list of structures for every batch entry, opposite to
+    nested_stack(..., concatenate=True): batch dimension of size 1 is kept.
+
+    Args:
+        struct:     [nested] structure of arrays;
+        size:       batch size.
+
+    Returns:
+        list of `size` [nested] structures of array views.
+    """
+    if isinstance(struct, dict):
+        values = {key: nested_unstack(value, size) for key, value in struct.items()}
+        return [{key: value[i] for key, value in values.items()} for i in range(size)]
+
+    elif isinstance(struct, LSTMStateTuple):
+        values = [nested_unstack(value, size) for value in struct]
+        return [LSTMStateTuple(*[value[i] for value in values]) for i in range(size)]
+
+    elif isinstance(struct, tuple):
+        values = [nested_unstack(value, size) for value in struct]
+        return [tuple([value[i] for value in values]) for i in range(size)]
+
+    else:
+        return [struct[i:i + 1] for i in range(size)]
+
+
 def batch_pad(batch, to_size, _one_hot=False):
     """
     Pads given `batch` with zeros along zero dimension
@@ -185,33 +340,32 @@ def batch_pad(batch, to_size, _one_hot=False):
     Returns:
         dictionary with all included np.arrays being zero-padded to size [to_size, own_depth].
     """
-    if isinstance(batch, dict):
-        padded_batch = {}
-        for key, struct in batch.items():
+    # Tuples, scalars and everything else but arrays are kept as is:
+    plan = FlattenPlan(batch, sequence_types=())
+    padded_leaves = []
+    for path, leaf in zip(plan.paths, plan.flatten(batch)):
+        if isinstance(leaf, np.ndarray):
             # Mind one-hot action encoding:
-            if key in ['action', 'last_action_reward']:
-                one_hot = True
+            one_hot = path[-1] in ['action', 'last_action_reward'] if len(path) > 0 else _one_hot
+            leaf = _pad_array(leaf, to_size, one_hot)
 
-            else:
-                one_hot = False
+        padded_leaves.append(leaf)
 
-            padded_batch[key] = batch_pad(struct, to_size, one_hot)
+    return plan.unflatten(padded_leaves)
 
-    elif isinstance(batch, np.ndarray):
-        shape = batch.shape
-        assert shape[0] < to_size, \
-            'Padded batch size must be greater than initial, got: {}, {}'.format(to_size, shape[0])
 
-        pad = np.zeros((to_size - shape[0],) + shape[1:])
-        if _one_hot:
-            pad[:, 0, ...] = 1
-        padded_batch = np.concatenate([batch, pad], axis=0)
+def _pad_array(array, to_size, one_hot):
+    shape = array.shape
+    assert shape[0] < to_size, \
+        'Padded batch size must be greater than initial, got: {}, {}'.format(to_size, shape[0])
 
-    else:
-        # Hit tuple, scalar or something else:
-        padded_batch = batch
+    # Keep dtype, e.g. float32 observations shouldn't get upcast:
+    padded_array = np.zeros((to_size,) + shape[1:], dtype=array.dtype)
+    padded_array[:shape[0]] = array
+    if one_hot:
+        padded_array[shape[0]:, 0, ...] = 1
 
-    return padded_batch
+    return padded_array
 
 
 def _show_struct(struct):
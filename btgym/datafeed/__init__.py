@@ -21,3 +21,4 @@
 from .base import BTgymBaseData, DataSampleConfig, EnvResetConfig
 from .derivative import BTgymEpisode, BTgymDataTrial, BTgymRandomDataDomain, BTgymDataset
 from .stateful import BTgymSequentialDataDomain
+from .shared import BTgymSharedData
@@ -21,13 +21,19 @@ from logbook import Logger, StreamHandler, WARNING
 
 import datetime
 import random
-from numpy.random import beta as random_beta
 import copy
 import os
 import sys
+import glob
+import json
+import shutil
+import hashlib
+import tempfile
 
 import backtrader.feeds as btfeeds
+import numpy as np
 import pandas as pd
+from scipy.special import betainc
 
 DataSampleConfig = dict(
     get_new=True,
@@ -73,6 +79,7 @@ class BTgymBaseData:
             name='base_data',
             task=0,
             log_level=WARNING,
+            use_cache=True,
             _config_stack=None,
             **kwargs
     ):
@@ -123,6 +130,10 @@ class BTgymBaseData:
                                             [0_record<-train_data->split_point_record<-test_data->last_record].
             sample_expanding:               None, reserved for child classes.
 
+            use_cache:                      True - if set, parsed CSV data is cached in binary columnar format
+                                            next to source file and loaded from there on subsequent reads,
+                                            see `read_csv()` method.
+
         Note:
             - CSV file can contain duplicate records, checks will be performed and all duplicates will be removed;
 
@@ -189,6 +200,7 @@ class BTgymBaseData:
         self.name = name
         self.task = task
         self.log_level = log_level
+        self.use_cache = use_cache
 
         self.data = None  # Will hold actual data as pandas dataframe
         self.is_ready = False
@@ -205,6 +217,11 @@ class BTgymBaseData:
 
         self.sample_instance = None
 
+        # Precomputed sampling index, see `_build_start_index()`:
+        self.valid_start = None
+        self.start_row = None
+        self._start_cdf_cache = {}
+
         self.test_range_delta = None
         self.train_range_delta = None
         self.test_num_records = 0
@@ -334,16 +351,148 @@ class BTgymBaseData:
         self.train_interval = [0, break_point]
         self.test_interval = [break_point, self.data.shape[0]]
 
+        self._build_start_index()
+
         self.sample_num = 0
         self.is_ready = True
 
+    def _build_start_index(self):
+        """
+        Precomputes, for every data record, whether sample drawn at this record satisfies
+        `start_weekdays`, `start_00` and `time_gap` conditions. Sets attributes:
+
+            start_row:      1d array of int or None, actual sample start row for every drawn record,
+                            differs from record itself only if `start_00` is set;
+            valid_start:    1d array of bool, sample drawn at record is acceptable.
+        """
+        index = pd.DatetimeIndex(self.data.index)
+        num_rows = index.shape[0]
+
+        # Weekday condition is checked against record drawn:
+        weekday_ok = np.isin(index.dayofweek.values, list(self.start_weekdays))
+
+        # If 00 option set, actual sample start is the first record of the day:
+        if self.start_00:
+            self.start_row = index.get_indexer(index.normalize(), method='nearest')
+
+        else:
+            self.start_row = None
+
+        # Time gap condition is checked against actual sample start:
+        last_row = np.minimum(np.arange(num_rows) + self.sample_num_records, num_rows) - 1
+        times = index.values
+        sample_len = times[last_row] - times
+        gap_ok = sample_len < np.timedelta64(self.max_sample_len_delta + self.max_time_gap)
+
+        if self.start_row is not None:
+            gap_ok = gap_ok[self.start_row]
+
+        self.valid_start = weekday_ok & gap_ok
+        self._start_cdf_cache = {}
+
+        self.log.debug(
+            'Valid sample start records: {} of {}.'.format(self.valid_start.sum(), num_rows)
+        )
+
+    def _get_start_cdf(self, interval, b_alpha, b_beta):
+        """
+        Returns candidate start records within interval and cumulative probabilities of drawing each of them,
+        conditioned on sample validity.
+
+        Candidate record `interval[0] + k` gets probability mass of B-distribution over `[k/M, (k+1)/M)`,
+        where `M = interval[-1] - interval[0] - sample_num_records`, and zero mass if sample drawn at it is invalid.
+
+        Args:
+            interval:       list of two ints, [lower_row_number, upper_row_number];
+            b_alpha:        float > 0, sampling B-distribution alpha param;
+            b_beta:         float > 0, sampling B-distribution beta param.
+
+        Returns:
+            tuple of 1d arrays: (candidate rows, normalized cumulative probabilities)
+            or None if no valid start exists within interval.
+        """
+        key = (int(interval[0]), int(interval[-1]), float(b_alpha), float(b_beta))
+        if key in self._start_cdf_cache:
+            return self._start_cdf_cache[key]
+
+        num_positions = interval[-1] - interval[0] - self.sample_num_records
+        if num_positions > 0:
+            rows = np.arange(interval[0], interval[0] + num_positions)
+            bounds = betainc(b_alpha, b_beta, np.linspace(0, 1, num_positions + 1))
+            weights = np.diff(bounds)
+
+        else:
+            rows = np.asarray([interval[0]])
+            weights = np.ones(1)
+
+        weights = weights * self.valid_start[rows]
+        total = weights.sum()
+
+        if total > 0:
+            cdf = np.cumsum(weights) / total
+            result = (rows, cdf)
+
+        else:
+            result = None
+
+        if len(self._start_cdf_cache) > 32:
+            self._start_cdf_cache = {}
+
+        self._start_cdf_cache[key] = result
+        return result
+
+    def _draw_start(self, interval, b_alpha=1.0, b_beta=1.0):
+        """
+        Draws sample start record within interval using precomputed validity index.
+
+        Args:
+            interval:       list of two ints, [lower_row_number, upper_row_number];
+            b_alpha:        float > 0, sampling B-distribution alpha param;
+            b_beta:         float > 0, sampling B-distribution beta param.
+
+        Returns:
+            tuple of ints: (record drawn, actual sample first row)
+
+        Raises:
+            RuntimeError if no valid sample can be drawn from interval.
+        """
+        if self.valid_start is None or self.valid_start.shape[0] != self.data.shape[0]:
+            self._build_start_index()
+
+        start_cdf = self._get_start_cdf(interval, b_alpha, b_beta)
+
+        if start_cdf is None:
+            msg = 'No valid sample start found within interval {}. Hint: check sampling params / dataset consistency.'.\
+                format(interval)
+            self.log.error(msg)
+            raise RuntimeError(msg)
+
+        rows, cdf = start_cdf
+        position = min(int(np.searchsorted(cdf, random.random(), side='right')), rows.shape[0] - 1)
+        drawn_row = int(rows[position])
+
+        if self.start_row is not None:
+            first_row = int(self.start_row[drawn_row])
+
+        else:
+            first_row = drawn_row
+
+        return drawn_row, first_row
+
     def read_csv(self, data_filename=None, force_reload=False):
         """
         Populates instance by loading data: CSV file --> pandas dataframe.
 
         Args:
             data_filename: [opt] csv data filename as string or list of such strings.
-            force_reload:  ignore loaded data.
+            force_reload:  ignore loaded data and binary cache.
+
+        Note:
+            If `use_cache` is set, parsed and de-duplicated data for every source file is stored
+            as set of numpy arrays (one per column plus index) in hidden directory next to that file.
+            Cache is keyed by absolute file path, size, modification time and CSV parsing parameters,
+            so any change to source or parsing options invalidates it.
+            Cached arrays are loaded memory-mapped, bypassing CSV parsing altogether.
         """
         if self.data is not None and not force_reload:
             self.log.debug('data has been already loaded. Use `force_reload=True` to reload')
@@ -357,14 +506,34 @@ class BTgymBaseData:
         for filename in self.filename:
             try:
                 assert filename and os.path.isfile(filename)
-                current_dataframe = pd.read_csv(
-                    filename,
-                    sep=self.sep,
-                    header=self.header,
-                    index_col=self.index_col,
-                    parse_dates=self.parse_dates,
-                    names=self.names
-                )
+
+            except AssertionError:
+                msg = 'Data file <{}> not specified / not found.'.format(str(filename))
+                self.log.error(msg)
+                raise FileNotFoundError(msg)
+
+            current_dataframe = None
+            cache_dir = None
+            if self.use_cache:
+                cache_dir = self._get_cache_dir(filename)
+                if not force_reload:
+                    current_dataframe = self._load_cache(cache_dir)
+
+            if current_dataframe is None:
+                try:
+                    current_dataframe = pd.read_csv(
+                        filename,
+                        sep=self.sep,
+                        header=self.header,
+                        index_col=self.index_col,
+                        parse_dates=self.parse_dates,
+                        names=self.names
+                    )
+
+                except:
+                    msg = 'Failed to parse data file <{}>.'.format(str(filename))
+                    self.log.error(msg)
+                    raise FileNotFoundError(msg)
 
                 # Check and remove duplicate datetime indexes:
                 duplicates = current_dataframe.index.duplicated(keep='first')
@@ -374,18 +543,128 @@ class BTgymBaseData:
                     self.log.warning('Found {} duplicated date_time records in <{}>.\
                      Removed all but first occurrences.'.format(how_bad, filename))
 
-                dataframes += [current_dataframe]
-                self.log.info('Loaded {} records from <{}>.'.format(dataframes[-1].shape[0], filename))
+                if cache_dir is not None:
+                    self._save_cache(current_dataframe, cache_dir)
 
-            except:
-                msg = 'Data file <{}> not specified / not found.'.format(str(filename))
-                self.log.error(msg)
-                raise FileNotFoundError(msg)
+            dataframes += [current_dataframe]
+            self.log.info('Loaded {} records from <{}>.'.format(dataframes[-1].shape[0], filename))
 
         self.data = pd.concat(dataframes)
         range = pd.to_datetime(self.data.index)
         self.data_range_delta = (range[-1] - range[0]).to_pytimedelta()
 
+    def _get_cache_dir(self, filename):
+        """
+        Returns path to binary cache directory for given source file.
+
+        Args:
+            filename:   str, existing csv data file name
+
+        Returns:
+            str, path to cache directory (not necessarily existing)
+        """
+        filename = os.path.abspath(filename)
+        file_stat = os.stat(filename)
+        key = repr(
+            (
+                filename,
+                file_stat.st_size,
+                file_stat.st_mtime_ns,
+                self.sep,
+                self.header,
+                self.index_col,
+                self.parse_dates,
+                list(self.names) if self.names is not None else None,
+            )
+        )
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        return os.path.join(
+            os.path.dirname(filename),
+            '.{}.{}.btgym_cache'.format(os.path.basename(filename), digest)
+        )
+
+    def _load_cache(self, cache_dir):
+        """
+        Loads memory-mapped dataframe from binary cache.
+
+        Args:
+            cache_dir:  str, path to cache directory
+
+        Returns:
+            pandas dataframe or None if cache is missing or corrupted.
+        """
+        try:
+            with open(os.path.join(cache_dir, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+
+            index = np.load(os.path.join(cache_dir, 'index.npy'), mmap_mode='r')
+            columns = [
+                np.load(os.path.join(cache_dir, 'column_{}.npy'.format(i)), mmap_mode='r')
+                for i in range(len(meta['columns']))
+            ]
+            dataframe = pd.DataFrame(
+                dict(zip(meta['columns'], columns)),
+                index=pd.Index(index, name=meta['index_name']),
+                columns=meta['columns'],
+            )
+            self.log.debug('Loaded cached data from <{}>.'.format(cache_dir))
+            return dataframe
+
+        except FileNotFoundError:
+            return None
+
+        except Exception as e:
+            self.log.warning('Failed to load cached data from <{}>, reason: {}'.format(cache_dir, e))
+            return None
+
+    def _save_cache(self, dataframe, cache_dir):
+        """
+        Stores dataframe in binary columnar format, removes stale caches of the same source file, if any.
+        Dataframes with non-numeric columns or index are not cached.
+
+        Args:
+            dataframe:  pandas dataframe
+            cache_dir:  str, path to cache directory
+        """
+        arrays = [np.asarray(dataframe.index.values)] + \
+            [np.asarray(dataframe[column].values) for column in dataframe.columns]
+        if any(array.dtype == object for array in arrays):
+            self.log.debug('Non-numeric data, caching skipped.')
+            return
+
+        parent_dir, cache_name = os.path.split(cache_dir)
+        source_name = cache_name.rsplit('.', 2)[0]
+        tmp_dir = None
+        try:
+            # Write to temporary location first, so concurrent readers never see partial cache:
+            tmp_dir = tempfile.mkdtemp(prefix=cache_name + '.tmp', dir=parent_dir)
+            # Temporary dirs are private, cache should be readable by other users like source file is:
+            os.chmod(tmp_dir, 0o755)
+            for i, array in enumerate(arrays):
+                np.save(
+                    os.path.join(tmp_dir, 'index.npy' if i == 0 else 'column_{}.npy'.format(i - 1)),
+                    np.ascontiguousarray(array)
+                )
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+                json.dump(
+                    dict(
+                        columns=[str(column) for column in dataframe.columns],
+                        index_name=dataframe.index.name,
+                    ),
+                    f
+                )
+            for stale_dir in glob.glob(os.path.join(parent_dir, glob.escape(source_name) + '.*.btgym_cache')):
+                shutil.rmtree(stale_dir, ignore_errors=True)
+
+            os.rename(tmp_dir, cache_dir)
+            self.log.debug('Cached data to <{}>.'.format(cache_dir))
+
+        except OSError as e:
+            # Read-only location or cache created by concurrent process:
+            self.log.debug('Caching data to <{}> failed, reason: {}'.format(cache_dir, e))
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
     def describe(self):
         """
         Returns summary dataset statistic as pandas dataframe:
@@ -549,70 +828,35 @@ class BTgymBaseData:
         self.log.debug('Respective number of steps: {}.'.format(self.sample_num_records))
         self.log.debug('Maximum allowed data time gap set to: {}.\n'.format(self.max_time_gap))
 
-        # Sanity check param:
-        max_attempts = 100
-        attempts = 0
-
-        # # Keep sampling random enter points until all conditions are met:
-        while attempts <= max_attempts:
+        first_row_drawn, first_row = self._draw_start(
+            [0, self.data.shape[0] - 1],
+            b_alpha=1.0,
+            b_beta=1.0
+        )
+        sample_first_day = self.data.index[first_row_drawn]
+        self.log.debug('Sample start: {}, weekday: {}.'.format(sample_first_day, sample_first_day.weekday()))
 
-            # Randomly sample record (row) from entire datafeed:
-            first_row = int((self.data.shape[0] - self.sample_num_records - 1) * random.random())
-            sample_first_day = self.data[first_row:first_row + 1].index[0]
-            self.log.debug('Sample start: {}, weekday: {}.'.format(sample_first_day, sample_first_day.weekday()))
+        # If 00 option set, sample starts from first record of that day:
+        if self.start_00:
+            adj_timedate = sample_first_day.date()
+            self.log.debug('Start time adjusted to <00:00>')
 
-            # Keep sampling until good day:
-            while not sample_first_day.weekday() in self.start_weekdays and attempts <= max_attempts:
-                self.log.debug('Not a good day to start, resampling...')
-                first_row = int((self.data.shape[0] - self.sample_num_records - 1) * random.random())
-                sample_first_day = self.data[first_row:first_row + 1].index[0]
-                self.log.debug('Sample start: {}, weekday: {}.'.format(sample_first_day, sample_first_day.weekday()))
-                attempts +=1
-
-            # Check if managed to get proper weekday:
-            assert attempts <= max_attempts, \
-                'Quitting after {} sampling attempts. Hint: check sampling params / dataset consistency.'. \
-                format(attempts)
+        else:
+            adj_timedate = sample_first_day
 
-            # If 00 option set, get index of first record of that day:
-            if self.start_00:
-                adj_timedate = sample_first_day.date()
-                self.log.debug('Start time adjusted to <00:00>')
+        # Easy part:
+        last_row = first_row + self.sample_num_records  # + 1
+        sampled_data = self.data[first_row: last_row]
+        self.log.debug('Actual sample duration: {}.'.format(sampled_data.index[-1] - sampled_data.index[0]))
 
-            else:
-                adj_timedate = sample_first_day
-
-            first_row = self.data.index.get_loc(adj_timedate, method='nearest')
-
-            # Easy part:
-            last_row = first_row + self.sample_num_records  # + 1
-            sampled_data = self.data[first_row: last_row]
-            sample_len = (sampled_data.index[-1] - sampled_data.index[0]).to_pytimedelta()
-            self.log.debug('Actual sample duration: {}.'.format(sample_len, ))
-            self.log.debug('Total episode time gap: {}.'.format(sample_len - self.max_sample_len_delta))
-
-            # Perform data gap check:
-            if sample_len - self.max_sample_len_delta < self.max_time_gap:
-                self.log.debug('Sample accepted.')
-                # If sample OK - compose and return sample:
-                new_instance = self.nested_class_ref(**self.nested_params)
-                new_instance.filename = name + 'n{}_at_{}'.format(self.sample_num, adj_timedate)
-                self.log.info('Sample id: <{}>.'.format(new_instance.filename))
-                new_instance.data = sampled_data
-                new_instance.metadata['type'] = 'random_sample'
-                new_instance.metadata['first_row'] = first_row
-
-                return new_instance
+        new_instance = self.nested_class_ref(**self.nested_params)
+        new_instance.filename = name + 'n{}_at_{}'.format(self.sample_num, adj_timedate)
+        self.log.info('Sample id: <{}>.'.format(new_instance.filename))
+        new_instance.data = sampled_data
+        new_instance.metadata['type'] = 'random_sample'
+        new_instance.metadata['first_row'] = first_row
 
-            else:
-                self.log.debug('Duration too big, resampling...\n')
-                attempts += 1
-
-        # Got here -> sanity check failed:
-        msg = ('Quitting after {} sampling attempts.' +
-               'Hint: check sampling params / dataset consistency.').format(attempts)
-        self.log.error(msg)
-        raise RuntimeError(msg)
+        return new_instance
 
     def _sample_interval(self, interval, b_alpha=1.0, b_beta=1.0, name='interval_sample_'):
         """
@@ -632,7 +876,13 @@ class BTgymBaseData:
              - BTgymDataset instance such as:
                 1. number of records ~ max_episode_len, subj. to `time_gap` param;
                 2. actual episode start position is sampled from `interval`;
-             - `False` if it is not possible to sample instance with set args.
+
+        Raises:
+            RuntimeError if it is not possible to sample instance with set args.
+
+        Note:
+            Start position is drawn from precomputed set of valid sample starts,
+            see `_build_start_index()` and `_get_start_cdf()`, so no resampling attempts are ever made.
         """
         try:
             assert not self.data.empty
@@ -675,85 +925,33 @@ class BTgymBaseData:
         self.log.debug('Respective number of steps: {}.'.format(sample_num_records))
         self.log.debug('Maximum allowed data time gap set to: {}.\n'.format(self.max_time_gap))
 
-        # Sanity check param:
-        max_attempts = 100
-        attempts = 0
-
-        # # Keep sampling random enter points until all conditions are met:
-        while attempts <= max_attempts:
-
-            first_row = interval[0] + int(
-                (interval[-1] - interval[0] - sample_num_records) * random_beta(a=b_alpha, b=b_beta)
-            )
+        first_row_drawn, first_row = self._draw_start(interval, b_alpha=b_alpha, b_beta=b_beta)
+        sample_first_day = self.data.index[first_row_drawn]
+        self.log.debug('Sample start: {}, weekday: {}.'.format(sample_first_day, sample_first_day.weekday()))
 
-            #print('_sample_interval_sample_num_records: ', sample_num_records)
-            #print('_sample_interval_first_row: ', first_row)
+        # If 00 option set, sample starts from first record of that day:
+        if self.start_00:
+            adj_timedate = sample_first_day.date()
+            self.log.debug('Start time adjusted to <00:00>')
 
-            sample_first_day = self.data[first_row:first_row + 1].index[0]
-            self.log.debug('Sample start: {}, weekday: {}.'.format(sample_first_day, sample_first_day.weekday()))
-
-            # Keep sampling until good day:
-            while not sample_first_day.weekday() in self.start_weekdays and attempts <= max_attempts:
-                self.log.debug('Not a good day to start, resampling...')
-                first_row = interval[0] + round(
-                    (interval[-1] - interval[0] - sample_num_records) * random_beta(a=b_alpha, b=b_beta)
-                )
-                #print('r_sample_interval_sample_num_records: ', sample_num_records)
-                #print('r_sample_interval_first_row: ', first_row)
-                sample_first_day = self.data[first_row:first_row + 1].index[0]
-                self.log.debug('Sample start: {}, weekday: {}.'.format(sample_first_day, sample_first_day.weekday()))
-                attempts += 1
-
-            # Check if managed to get proper weekday:
-            try:
-                assert attempts <= max_attempts
-
-            except AssertionError:
-                self.log.exception(
-                    'Quitting after {} sampling attempts. Hint: check sampling params / dataset consistency.'.
-                    format(attempts)
-                )
-                raise RuntimeError
-
-            # If 00 option set, get index of first record of that day:
-            if self.start_00:
-                adj_timedate = sample_first_day.date()
-                self.log.debug('Start time adjusted to <00:00>')
-
-            else:
-                adj_timedate = sample_first_day
-
-            first_row = self.data.index.get_loc(adj_timedate, method='nearest')
-
-            # Easy part:
-            last_row = first_row + sample_num_records  # + 1
-            sampled_data = self.data[first_row: last_row]
-            sample_len = (sampled_data.index[-1] - sampled_data.index[0]).to_pytimedelta()
-            self.log.debug('Actual sample duration: {}.'.format(sample_len))
-            self.log.debug('Total sample time gap: {}.'.format(sample_len - self.max_sample_len_delta))
-
-            # Perform data gap check:
-            if sample_len - self.max_sample_len_delta < self.max_time_gap:
-                self.log.debug('Sample accepted.')
-                # If sample OK - return new dataset:
-                new_instance = self.nested_class_ref(**self.nested_params)
-                new_instance.filename = name + 'num_{}_at_{}'.format(self.sample_num, adj_timedate)
-                self.log.info('New sample id: <{}>.'.format(new_instance.filename))
-                new_instance.data = sampled_data
-                new_instance.metadata['type'] = 'interval_sample'
-                new_instance.metadata['first_row'] = first_row
-
-                return new_instance
-
-            else:
-                self.log.debug('Attempt {}: duration too big, resampling, ...\n'.format(attempts))
-                attempts += 1
-
-        # Got here -> sanity check failed:
-        msg = ('Quitting after {} sampling attempts.' +
-               'Hint: check sampling params / dataset consistency.').format(attempts)
-        self.log.error(msg)
-        raise RuntimeError(msg)
+        else:
+            adj_timedate = sample_first_day
+
+        # Easy part:
+        last_row = first_row + sample_num_records  # + 1
+        sampled_data = self.data[first_row: last_row]
+        sample_len = (sampled_data.index[-1] - sampled_data.index[0]).to_pytimedelta()
+        self.log.debug('Actual sample duration: {}.'.format(sample_len))
+        self.log.debug('Total sample time gap: {}.'.format(sample_len - self.max_sample_len_delta))
+
+        new_instance = self.nested_class_ref(**self.nested_params)
+        new_instance.filename = name + 'num_{}_at_{}'.format(self.sample_num, adj_timedate)
+        self.log.info('New sample id: <{}>.'.format(new_instance.filename))
+        new_instance.data = sampled_data
+        new_instance.metadata['type'] = 'interval_sample'
+        new_instance.metadata['first_row'] = first_row
+
+        return new_instance
 
 
 
@@ -125,6 +125,7 @@ class BTgymRandomDataDomain(BTgymBaseData):
             name='RndDataDomain',
             task=0,
             log_level=WARNING,
+            use_cache=True,
     ):
         """
         Args:
@@ -142,6 +143,7 @@ class BTgymRandomDataDomain(BTgymBaseData):
             name:               str, optional
             task:               int, optional
             log_level:          int, logbook.level
+            use_cache:          bool, if True - cache parsed source data in binary format next to CSV file
         """
         if parsing_params is None:
             parsing_params = dict(
@@ -211,6 +213,7 @@ class BTgymRandomDataDomain(BTgymBaseData):
             name=name,
             task=task,
             log_level=log_level,
+            use_cache=use_cache,
             _config_stack=[episode_config, trial_config]
         )
 
@@ -258,6 +261,7 @@ class BTgymDataset(BTgymRandomDataDomain):
             test_period=None,
             name='SimpleDataSet',
             log_level=WARNING,
+            use_cache=True,
             **kwargs
     ):
         """
@@ -276,6 +280,7 @@ class BTgymDataset(BTgymRandomDataDomain):
             parsing_params:     csv parsing options, see base class description for details;
             name:               str, instance name;
             log_level:          int, logbook.level;
+            use_cache:          bool, if True - cache parsed source data in binary format next to CSV file;
             **kwargs:           deprecated kwargs;
         """
         # Default sample time duration:
@@ -328,6 +333,7 @@ class BTgymDataset(BTgymRandomDataDomain):
             target_period=test_period,
             name=name,
             log_level=log_level,
+            use_cache=use_cache,
         )
 
 
@@ -0,0 +1,169 @@
+###############################################################################
+#
+# Copyright (C) 2017-2018 Andrew Muzikin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+try:
+    from multiprocessing import shared_memory
+
+except ImportError:
+    # Python < 3.8: shared memory data mode is not available, anything else still works:
+    shared_memory = None
+
+import numpy as np
+import pandas as pd
+
+
+def check_shared_memory():
+    """
+    Raises RuntimeError if shared memory segments are not supported by this interpreter.
+    """
+    if shared_memory is None:
+        raise RuntimeError('Shared memory data mode requires Python 3.8 or later.')
+
+
+class BTgymSharedData:
+    """
+    Holds dataframe values and datetime index in single shared memory segment, so that
+    any number of processes on the host can map it without copying.
+
+    Data owner (usually data server process) creates instance from dataframe and passes
+    `descriptor` dictionary to other processes, which attach to segment via `BTgymSharedData(descriptor=...)`
+    and get zero-copy dataframe views of any continuous subset of rows via `get_slice()`.
+
+    Note:
+        All data columns are stored as single 2d array to enable zero-copy dataframe construction;
+        if columns are of different dtypes, values are cast to float64.
+    """
+
+    def __init__(self, data=None, descriptor=None):
+        """
+        Args:
+            data:           pandas dataframe with datetime index, creates new shared segment if given;
+            descriptor:     dict, segment descriptor as returned by owner instance `descriptor` property,
+                            attaches to existing segment if given; ignored if `data` is given.
+        """
+        check_shared_memory()
+
+        if data is not None:
+            values = np.ascontiguousarray(data.values)
+            if values.dtype == object:
+                values = values.astype(np.float64)
+
+            index = np.ascontiguousarray(pd.DatetimeIndex(data.index).values)
+
+            self.descriptor = dict(
+                name=None,
+                num_rows=values.shape[0],
+                columns=list(data.columns),
+                values_dtype=values.dtype.str,
+                index_dtype=index.dtype.str,
+                index_name=data.index.name,
+                index_offset=values.nbytes,
+            )
+            self.shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes + index.nbytes, 1))
+            self.descriptor['name'] = self.shm.name
+            self.is_owner = True
+
+            self._map_arrays()
+            self.values[:] = values
+            self.index[:] = index
+
+        elif descriptor is not None:
+            self.descriptor = descriptor
+            self.shm = self._attach(descriptor['name'])
+            self.is_owner = False
+            self._map_arrays()
+
+        else:
+            raise ValueError('Either `data` or `descriptor` arg should be provided.')
+
+        self.values.flags.writeable = self.is_owner
+        self.index.flags.writeable = self.is_owner
+
+    @staticmethod
+    def _attach(name):
+        """
+        Attaches to existing segment without registering it with resource tracker:
+        only owner is responsible for segment lifetime, otherwise segment gets unlinked
+        when any attached process exits.
+        """
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+
+        except TypeError:
+            # Python < 3.13:
+            from multiprocessing import resource_tracker
+            register = resource_tracker.register
+            resource_tracker.register = lambda *args, **kwargs: None
+            try:
+                return shared_memory.SharedMemory(name=name)
+
+            finally:
+                resource_tracker.register = register
+
+    def _map_arrays(self):
+        """
+        Creates numpy arrays backed by shared memory buffer.
+        """
+        num_rows = self.descriptor['num_rows']
+        self.values = np.ndarray(
+            shape=(num_rows, len(self.descriptor['columns'])),
+            dtype=np.dtype(self.descriptor['values_dtype']),
+            buffer=self.shm.buf,
+        )
+        self.index = np.ndarray(
+            shape=(num_rows,),
+            dtype=np.dtype(self.descriptor['index_dtype']),
+            buffer=self.shm.buf,
+            offset=self.descriptor['index_offset'],
+        )
+
+    def get_slice(self, start_row=0, end_row=None):
+        """
+        Returns dataframe view of [start_row, end_row) records, no data is copied.
+
+        Args:
+            start_row:  int, first row
+            end_row:    int, last row (excluded)
+
+        Returns:
+            pandas dataframe
+        """
+        if end_row is None:
+            end_row = self.descriptor['num_rows']
+
+        return pd.DataFrame(
+            self.values[start_row:end_row],
+            index=pd.DatetimeIndex(self.index[start_row:end_row], name=self.descriptor['index_name'], copy=False),
+            columns=self.descriptor['columns'],
+            copy=False,
+        )
+
+    def close(self):
+        """
+        Releases arrays and detaches from shared segment; owner also destroys segment.
+        """
+        self.values = None
+        self.index = None
+        try:
+            self.shm.close()
+            if self.is_owner:
+                self.shm.unlink()
+
+        except (FileNotFoundError, BufferError):
+            pass
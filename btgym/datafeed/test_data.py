@@ -1,11 +1,20 @@
 
+import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 from .derivative import BTgymDataset, BTgymRandomDataDomain
 from .stateful import BTgymSequentialDataDomain
 
 
 filename='../examples/data/DAT_ASCII_EURUSD_M1_2016.csv'
 
+cached_filename=os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '../../examples/data/DAT_ASCII_EURUSD_M1_201703.csv'
+)
+
 trial_params=dict(
     start_weekdays={0, 1, 2, 3, 4, 5, 6},
     sample_duration={'days': 8, 'hours': 0, 'minutes': 0},
@@ -43,6 +52,27 @@ class DomainTest(unittest.TestCase):
             )
             domain.reset()
 
+    def test_BTgymDataset_cached_data_consistency(self):
+        """
+        Data loaded from binary cache should be identical to one parsed from CSV.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Cache is written next to source file, keep it out of source tree:
+            tmp_filename = shutil.copy(cached_filename, tmp_dir)
+
+            domain = BTgymDataset(filename=tmp_filename, log_level=log_level)
+            domain.read_csv(force_reload=True)
+            parsed_data = domain.data
+            self.assertTrue(os.path.isdir(domain._get_cache_dir(tmp_filename)))
+
+            cached_domain = BTgymDataset(filename=tmp_filename, log_level=log_level)
+            # Any attempt to parse source file again fails the test:
+            with mock.patch('pandas.read_csv', side_effect=AssertionError('Data parsed instead of loaded from cache')):
+                cached_domain.read_csv()
+
+            self.assertTrue(parsed_data.equals(cached_domain.data))
+            self.assertEqual(domain.data_range_delta, cached_domain.data_range_delta)
+
     def test_BTgymDataset_sampling_bounds_consistency(self):
         """
         Any train trial mast precede any test period.
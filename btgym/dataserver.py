@@ -18,21 +18,38 @@
 ###############################################################################
 
 import multiprocessing
+import threading
 import copy
 import zmq
 
-from .datafeed import DataSampleConfig
+from collections import OrderedDict, deque
+
+from .datafeed import DataSampleConfig, BTgymSequentialDataDomain
+from .datafeed.shared import BTgymSharedData, check_shared_memory
 
 
 class BTgymDataFeedServer(multiprocessing.Process):
     """
     Data provider server class.
     Enables efficient data sampling for asynchronous multiply BTgym environments execution.
+
+    Clients communicate via REQ sockets; server routes requests to pool of worker threads
+    via ROUTER/DEALER sockets pair, so any number of environments can be served concurrently.
     """
     process = None
     dataset_stat = None
 
-    def __init__(self, dataset=None, network_address=None, log_level=None, task=0):
+    def __init__(
+            self,
+            dataset=None,
+            network_address=None,
+            log_level=None,
+            task=0,
+            shared_memory=False,
+            prefetch_size=4,
+            prefetch_max_configs=8,
+            num_workers=4,
+    ):
         """
         Configures data server instance.
 
@@ -41,6 +58,11 @@ class BTgymDataFeedServer(multiprocessing.Process):
             network_address:    ...to bind to.
             log_level:          int, logbook.level
             task:               id
+            shared_memory:      bool, if True - put entire dataset in shared memory segment once and
+                                send Trial samples as (start_row, end_row) descriptors instead of pickled data.
+            prefetch_size:      int, number of ready samples to keep for every distinct sampling configuration;
+            prefetch_max_configs:   int, maximum number of distinct sampling configurations to prefetch for.
+            num_workers:        int, number of threads serving requests concurrently.
         """
         super(BTgymDataFeedServer, self).__init__()
 
@@ -50,71 +72,345 @@ class BTgymDataFeedServer(multiprocessing.Process):
         self.local_step = 0
         self.dataset = dataset
         self.network_address = network_address
-        self.pre_sample = None
-        self.pre_sample_config = copy.deepcopy(DataSampleConfig)
+        if shared_memory:
+            # Fail here rather than in server process:
+            check_shared_memory()
+
+        self.shared_memory = shared_memory
+        self.shared_data = None
+        self.shared_data_source = None
+        self.num_workers = num_workers
+        self.backend_address = None
+        self.stop_event = None
+        self.prefetch_size = prefetch_size
+        self.prefetch_max_configs = prefetch_max_configs
+
+        # Dataset copy all new samples are made from, so dataset own `reuse sample` state is never touched:
+        self.sampler = None
+        # Last sample sent, served on `get_new=False` requests:
+        self.last_sample = None
+
+        # Prefetch pool: {config_key: (sample_config, deque of ready samples)}, ordered by last use:
+        self.prefetch_pool = OrderedDict()
+        self.prefetch_thread = None
+        self.prefetch_condition = None
+        self.dataset_lock = None
+        self.prefetch_generation = 0
+        self.prefetch_hits = 0
+        self.prefetch_misses = 0
+
+    @staticmethod
+    def _get_config_key(sample_config):
+        """
+        Returns hashable key for sampling configuration dictionary.
+        """
+        return repr(sorted(sample_config.items()))
 
-        self.debug_pre_sample_fails = 0
-        self.debug_pre_sample_attempts = 0
+    @property
+    def prefetch_enabled(self):
+        """
+        Stateful domains are iterated in strict order, so those are never sampled ahead.
+        """
+        return self.prefetch_size > 0 and not isinstance(self.dataset, BTgymSequentialDataDomain)
+
+    def _sample(self, sample_config):
+        """
+        Thread-safe new sample making.
+        """
+        with self.dataset_lock:
+            return self.sampler.sample(**sample_config)
+
+    def _prefetch_loop(self):
+        """
+        Prefetching thread runtime body: keeps every pool slot filled with ready samples.
+        """
+        while True:
+            with self.prefetch_condition:
+                generation = self.prefetch_generation
+                pending = [
+                    (key, config) for key, (config, samples) in self.prefetch_pool.items()
+                    if len(samples) < self.prefetch_size
+                ]
+                if not pending or not self.dataset.is_ready:
+                    self.prefetch_condition.wait(timeout=1.0)
+                    continue
+
+            for key, config in pending:
+                try:
+                    sample = self._sample(config)
+
+                except Exception as e:
+                    self.log.warning('Failed to prefetch sample with params: {}, reason: {}'.format(config, e))
+                    sample = None
+
+                with self.prefetch_condition:
+                    if generation != self.prefetch_generation or key not in self.prefetch_pool:
+                        # Pool has been flushed meanwhile:
+                        continue
+
+                    if not sample:
+                        # Dataset exhausted or config is invalid, stop prefetching for this config:
+                        self.log.debug('Got no sample with params: {}, prefetching stopped.'.format(config))
+                        del self.prefetch_pool[key]
+                        continue
+
+                    self.prefetch_pool[key][-1].append(sample)
+
+    def _flush_prefetch_pool(self):
+        """
+        Discards all prefetched samples and last sample sent, sets sampler for current dataset state.
+        Should be called holding dataset lock.
+        """
+        with self.prefetch_condition:
+            self.prefetch_generation += 1
+            self.prefetch_pool.clear()
+            self.last_sample = None
+            if self.prefetch_enabled:
+                # Shallow copy keeps own sample counter and last sample while sharing data:
+                self.sampler = copy.copy(self.dataset)
+                self.prefetch_pool[self._get_config_key(DataSampleConfig)] = (
+                    copy.deepcopy(DataSampleConfig),
+                    deque()
+                )
+            else:
+                self.sampler = self.dataset
+
+            self.prefetch_condition.notify_all()
 
     def get_data(self, sample_config=None):
         """
         Get Trial sample according to parameters received.
-        If no parameters being passed - just makes and stores pre-sample.
 
         Args:
-            sample_config:   sampling parameters configuration dictionary
+            sample_config:   sampling parameters configuration dictionary, default is `DataSampleConfig`.
 
         Returns:
-            sample:     if `sample_params` arg has been passed and dataset is ready
+            sample:     if dataset is ready
             None:       otherwise
 
         Notes:
-            Some heuristic used here to enable parallelism: as training usually requires long series of similar samples,
-            we pre-sample data with most probable parameters;
-            first guessed sample gets type =`Train`, b_alpha=1, b_beta=1, and subsequent ones get actual
-            sampling params of previous accepted sample. If newly received parameters doesnt match pre-sampled ones -
-            we discard our guess and sample again with actual params.
-            TODO: should be switched off if using decaying `b_alpha` and `b_beta` params.
-        """
-        if self.dataset.is_ready:
-            if sample_config is not None:
-                if self.pre_sample is None or not self.pre_sample_config == sample_config:
-                    self.log.debug('Pre-sampling guess failed, resampling.')
-                    self.pre_sample_config = copy.deepcopy(sample_config)
-                    sample = self.dataset.sample(**sample_config)
-
-                    self.debug_pre_sample_fails += 1
+            To enable parallelism, samples are prefetched by background thread into bounded pool,
+            holding up to `prefetch_size` ready samples for each of last `prefetch_max_configs`
+            distinct sampling configurations seen. Thus alternating train/test requests are served without
+            waiting on sampling; unseen configuration is sampled synchronously and added to the pool.
+            Requests with `get_new=False` are served with last sample sent. Samples are made from
+            dataset copy, stateful domains are not prefetched at all.
+        """
+        if sample_config is None:
+            sample_config = copy.deepcopy(DataSampleConfig)
+
+        if not self.dataset.is_ready:
+            # Dataset not ready, make dummy:
+            return None
+
+        if not sample_config.get('get_new', True):
+            with self.prefetch_condition:
+                sample = self.last_sample
+
+            if sample is not None:
+                self.log.debug('Reusing last sample sent.')
+                return sample
+
+        key = self._get_config_key(sample_config)
+        sample = None
+
+        if self.prefetch_enabled and sample_config.get('get_new', True):
+            with self.prefetch_condition:
+                if key in self.prefetch_pool:
+                    self.prefetch_pool.move_to_end(key)
+                    samples = self.prefetch_pool[key][-1]
+                    if len(samples) > 0:
+                        sample = samples.popleft()
 
                 else:
-                    self.log.debug('Pre-sampling guess succeeded.')
-                    sample = self.pre_sample
+                    # Start prefetching for new config, evict least recently used one if pool is full:
+                    self.prefetch_pool[key] = (copy.deepcopy(sample_config), deque())
+                    while len(self.prefetch_pool) > self.prefetch_max_configs:
+                        self.prefetch_pool.popitem(last=False)
+
+                self.prefetch_condition.notify_all()
+
+        if sample is not None:
+            self.log.debug('Prefetched sample found.')
+            self.prefetch_hits += 1
+
+        else:
+            self.log.debug('No prefetched sample found, sampling.')
+            self.prefetch_misses += 1
+            sample = self._sample(sample_config)
+
+        if sample:
+            with self.prefetch_condition:
+                self.last_sample = sample
+
+        self.local_step += 1
+
+        # Debug:
+        if self.local_step % 100 == 0:
+            self.log.debug(
+                'Prefetch hits: {}, misses: {}, hit rate: {}'.format(
+                    self.prefetch_hits,
+                    self.prefetch_misses,
+                    self.prefetch_hits / (self.prefetch_hits + self.prefetch_misses + 1e-10)
+                )
+            )
+        return sample
+
+    def _share_data(self):
+        """
+        Puts dataset data into shared memory segment, if not already there.
+        """
+        if self.shared_data is None or self.shared_data_source is not self.dataset.data:
+            if self.shared_data is not None:
+                # Dataset has been reloaded, processes already attached keep their own mapping:
+                self.shared_data.close()
+
+            self.shared_data = BTgymSharedData(data=self.dataset.data)
+            self.shared_data_source = self.dataset.data
+            self.log.info(
+                'Dataset of {} records put in shared memory segment <{}>.'.
+                format(self.dataset.data.shape[0], self.shared_data.descriptor['name'])
+            )
+
+    def _compose_sample_message(self, sample):
+        """
+        Composes response to `_get_data` request.
+
+        Args:
+            sample:     Trial instance
+
+        Returns:
+            dict with `sample` and `stat` keys; in shared memory mode also holds `sample_descriptor` key,
+            while `sample` is sent without data.
+        """
+        if not self.shared_memory or not sample:
+            return {'sample': sample, 'stat': self.dataset_stat}
+
+        start_row = self.dataset.data.index.get_loc(sample.data.index[0])
+        descriptor = dict(
+            start_row=start_row,
+            end_row=start_row + sample.data.shape[0],
+            **self.shared_data.descriptor
+        )
+        # Sample instance can be reused by dataset, send shallow copy without data:
+        light_sample = copy.copy(sample)
+        light_sample.data = None
+        return {'sample': light_sample, 'sample_descriptor': descriptor, 'stat': self.dataset_stat}
+
+    def _handle_request(self, service_input):
+        """
+        Processes single client request. Thread-safe.
+
+        Args:
+            service_input:  dict, received message
+
+        Returns:
+            response message, bool flag indicating server should shut down.
+        """
+        self.log.debug('Received <{}>'.format(service_input))
+
+        if 'ctrl' not in service_input:
+            message = {'ctrl': 'No <ctrl> key received, got:\n{}'.format(service_input)}
+            self.log.debug(str(message))
+            return message, False
+
+        # It's time to exit:
+        if service_input['ctrl'] == '_stop':
+            # Server shutdown logic:
+            # send last run statistic, release comm channel and exit:
+            message = {'ctrl': 'Exiting.'}
+            self.log.info(str(message))
+            return message, True
+
+        # Reset datafeed:
+        elif service_input['ctrl'] == '_reset_data':
+            try:
+                kwargs = service_input['kwargs']
+
+            except KeyError:
+                kwargs = {}
+
+            with self.dataset_lock:
+                self.dataset.reset(**kwargs)
+                if self.shared_memory:
+                    self._share_data()
+
+                self._flush_prefetch_pool()
+
+            message = {'ctrl': 'Reset with kwargs: {}'.format(kwargs)}
+            self.log.debug('Data_is_ready: {}'.format(self.dataset.is_ready))
+            self.local_step = 0
+            return message, False
+
+        # Send dataset sample:
+        elif service_input['ctrl'] == '_get_data':
+            if self.dataset.is_ready:
+                # Get prefetched sample or make new one:
+                sample = self.get_data(sample_config=service_input['kwargs'])
+                message = 'Sending sample_#{}.'.format(self.local_step)
+                self.log.debug(message)
+                return self._compose_sample_message(sample), False
 
             else:
-                self.log.debug('Guessing sample with params: {}'.format(self.pre_sample_config))
-                self.pre_sample = self.dataset.sample(**self.pre_sample_config)
+                message = {'ctrl': 'Dataset not ready, waiting for control key <_reset_data>'}
+                self.log.debug('Sent: ' + str(message))
+                return message, False
+
+        # Send dataset statisitc:
+        elif service_input['ctrl'] == '_get_info':
+            message = 'Sending info for #{}.'.format(self.local_step)
+            self.log.debug(message)
+            # Compose response:
+            info_dict = dict(
+                dataset_stat=self.dataset_stat,
+                dataset_columns=list(self.dataset.names),
+                pid=self.process.pid,
+                dataset_is_ready=self.dataset.is_ready,
+                prefetch_hits=self.prefetch_hits,
+                prefetch_misses=self.prefetch_misses,
+                prefetch_hit_rate=self.prefetch_hits / (self.prefetch_hits + self.prefetch_misses + 1e-10),
+                num_workers=self.num_workers,
+            )
+            return info_dict, False
+
+        else:  # ignore any other input
+            # NOTE: response dictionary must include 'ctrl' key
+            message = {'ctrl': 'waiting for control keys:  <_reset_data>, <_get_data>, <_get_info>, <_stop>.'}
+            self.log.debug('Sent: ' + str(message))
+            return message, False
+
+    def _worker_loop(self, context, worker_id):
+        """
+        Request handling thread runtime body.
 
-                self.debug_pre_sample_attempts += 1
+        Args:
+            context:    zmq context shared with router
+            worker_id:  int, thread id
+        """
+        socket = context.socket(zmq.REP)
+        socket.connect(self.backend_address)
+        self.log.debug('Worker #{} started.'.format(worker_id))
+        try:
+            while True:
+                service_input = socket.recv_pyobj()
+                try:
+                    message, is_stop = self._handle_request(service_input)
 
-                return None
+                except Exception as e:
+                    # Keep serving, let client side decide:
+                    self.log.exception('Failed to process request <{}>'.format(service_input))
+                    message, is_stop = {'ctrl': 'Failed to process request, reason: {}'.format(e)}, False
 
-            self.local_step += 1
+                socket.send_pyobj(message)
+                if is_stop:
+                    self.stop_event.set()
+                    break
 
-            # Debug:
-            if self.local_step % 100 == 0:
-                self.log.debug(
-                    'Pre_samples: {}, failed: {}, fails/attempts: {}'.
-                        format(
-                        self.debug_pre_sample_attempts,
-                        self.debug_pre_sample_fails,
-                        self.debug_pre_sample_fails / (self.debug_pre_sample_attempts + 1e-10)
-                    )
-                )
-        else:
-            # Dataset not ready, make dummy:
-            sample = None
-            self.pre_sample = None
+        except zmq.ContextTerminated:
+            pass
 
-        return sample
+        finally:
+            socket.close(linger=0)
 
     def run(self):
         """
@@ -131,10 +427,16 @@ class BTgymDataFeedServer(multiprocessing.Process):
         self.process = multiprocessing.current_process()
         self.log.info('PID: {}'.format(self.process.pid))
 
-        # Set up a comm. channel for server as ZMQ socket:
+        # Set up a comm. channel for server as ZMQ ROUTER socket,
+        # clients keep using REQ sockets; requests are passed to pool of worker threads
+        # via in-process DEALER socket and served concurrently:
         context = zmq.Context()
-        socket = context.socket(zmq.REP)
-        socket.bind(self.network_address)
+        frontend = context.socket(zmq.ROUTER)
+        frontend.bind(self.network_address)
+
+        self.backend_address = 'inproc://data_server_workers_{}'.format(self.task)
+        backend = context.socket(zmq.DEALER)
+        backend.bind(self.backend_address)
 
         # Actually load data to BTgymDataset instance, will reset it later on:
         try:
@@ -146,81 +448,48 @@ class BTgymDataFeedServer(multiprocessing.Process):
         # Describe dataset:
         self.dataset_stat = self.dataset.describe()
 
-        # Main loop:
-        get_new = True
-
-        while True:
-            if get_new:
-            # Guess sample:
-                self.get_data()
-                get_new = False
-
-            # Stick here with data in hand until receive any request:
-            service_input = socket.recv_pyobj()
-            self.log.debug('Received <{}>'.format(service_input))
-
-            if 'ctrl' in service_input:
-                # It's time to exit:
-                if service_input['ctrl'] == '_stop':
-                    # Server shutdown logic:
-                    # send last run statistic, release comm channel and exit:
-                    message = {'ctrl': 'Exiting.'}
-                    self.log.info(str(message))
-                    socket.send_pyobj(message)
-                    socket.close()
-                    context.destroy()
-                    return None
-
-                # Reset datafeed:
-                elif service_input['ctrl'] == '_reset_data':
-                    try:
-                        kwargs = service_input['kwargs']
-
-                    except KeyError:
-                        kwargs = {}
-
-                    self.dataset.reset(**kwargs)
-                    message = {'ctrl': 'Reset with kwargs: {}'.format(kwargs)}
-                    self.log.debug('Data_is_ready: {}'.format(self.dataset.is_ready))
-                    socket.send_pyobj(message)
-                    self.local_step = 0
-                    get_new = True
-
-                # Send dataset sample:
-                elif service_input['ctrl'] == '_get_data':
-                    if self.dataset.is_ready:
-                        # Call _get_data to verify sampling guess or resample:
-                        sample = self.get_data(sample_config=service_input['kwargs'])
-                        message = 'Sending sample_#{}.'.format(self.local_step)
-                        self.log.debug(message)
-                        socket.send_pyobj({'sample': sample, 'stat': self.dataset_stat})
-                        get_new = True
-
-                    else:
-                        message = {'ctrl': 'Dataset not ready, waiting for control key <_reset_data>'}
-                        self.log.debug('Sent: ' + str(message))
-                        socket.send_pyobj(message)  # pairs any other input
-
-                # Send dataset statisitc:
-                elif service_input['ctrl'] == '_get_info':
-                    message = 'Sending info for #{}.'.format(self.local_step)
-                    self.log.debug(message)
-                    # Compose response:
-                    info_dict = dict(
-                        dataset_stat=self.dataset_stat,
-                        dataset_columns=list(self.dataset.names),
-                        pid=self.process.pid,
-                        dataset_is_ready=self.dataset.is_ready
-                    )
-                    socket.send_pyobj(info_dict)
-
-                else:  # ignore any other input
-                    # NOTE: response dictionary must include 'ctrl' key
-                    message = {'ctrl': 'waiting for control keys:  <_reset_data>, <_get_data>, <_get_info>, <_stop>.'}
-                    self.log.debug('Sent: ' + str(message))
-                    socket.send_pyobj(message)  # pairs any other input
-
-            else:
-                message = {'ctrl': 'No <ctrl> key received, got:\n{}'.format(msg)}
-                self.log.debug(str(message))
-                socket.send_pyobj(message) # pairs input
+        if self.shared_memory:
+            self._share_data()
+
+        # Start prefetching samples:
+        self.dataset_lock = threading.RLock()
+        self.prefetch_condition = threading.Condition()
+        self._flush_prefetch_pool()
+        self.prefetch_thread = threading.Thread(target=self._prefetch_loop, name='prefetch', daemon=True)
+        self.prefetch_thread.start()
+
+        # Start request handlers:
+        self.stop_event = threading.Event()
+        for worker_id in range(self.num_workers):
+            threading.Thread(
+                target=self._worker_loop,
+                args=(context, worker_id),
+                name='worker_{}'.format(worker_id),
+                daemon=True
+            ).start()
+
+        # Main loop, route messages between clients and workers until '_stop' received:
+        poller = zmq.Poller()
+        poller.register(frontend, zmq.POLLIN)
+        poller.register(backend, zmq.POLLIN)
+
+        while not self.stop_event.is_set():
+            events = dict(poller.poll(timeout=100))
+            if frontend in events:
+                backend.send_multipart(frontend.recv_multipart())
+
+            if backend in events:
+                frontend.send_multipart(backend.recv_multipart())
+
+        # Deliver pending responses, including one to '_stop' itself:
+        while backend.poll(timeout=100):
+            frontend.send_multipart(backend.recv_multipart())
+
+        frontend.close(linger=1000)
+        backend.close(linger=0)
+        # Idle workers are released by context termination:
+        context.term()
+        if self.shared_data is not None:
+            self.shared_data.close()
+
+        return None
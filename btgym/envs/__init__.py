@@ -18,3 +18,4 @@
 ###############################################################################
 
 from btgym.envs.backtrader import BTgymEnv
+from btgym.envs.vector import BTgymVecEnv
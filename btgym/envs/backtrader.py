@@ -34,8 +34,10 @@ from collections import OrderedDict
 import backtrader as bt
 
 from btgym import BTgymServer, BTgymBaseStrategy, BTgymDataset, BTgymRendering, BTgymDataFeedServer, DictSpace
+from btgym import BTgymFastEngine, BTgymFastStrategy
 
 from btgym.rendering import BTgymNullRendering
+from btgym.server import BTgymInProcessServer, send_message, recv_message
 
 ############################## OpenAI Gym Environment  ##############################
 
@@ -53,6 +55,8 @@ class BTgymEnv(gym.Env):
     data_context = None
     data_socket = None
     data_server_response = None
+    data_shared_memory = False  # serve data via shared memory segment.
+    data_server_workers = 4  # number of data_server threads serving requests concurrently.
 
     # Dataset:
     dataset = None  # BTgymDataset instance.
@@ -60,6 +64,7 @@ class BTgymEnv(gym.Env):
 
     # Backtrader engine:
     engine = None  # bt.Cerbro subclass for server to execute.
+    fast_engine = False  # use pure numpy BTgymFastEngine instead of bt.Cerebro if no <engine> been passed.
 
     # Strategy:
     strategy = None  # strategy to use if no <engine> class been passed.
@@ -72,6 +77,8 @@ class BTgymEnv(gym.Env):
     network_address = 'tcp://127.0.0.1:'  # using localhost.
     ctrl_actions = ('_done', '_reset', '_stop', '_getstat', '_render')  # server control messages.
     server_response = None
+    in_process = False  # run server episode loop in this process, no network communication.
+    pipeline_episodes = False  # prepare next episode from current trial while current one runs.
 
     # Connection timeout:
     connect_timeout = 60  # server connection timeout in seconds.
@@ -107,13 +114,26 @@ class BTgymEnv(gym.Env):
                                                             overrides `filename` or any other datafeed-related args.
             strategy=None (btgym.startegy):                 strategy to be used by `engine`, any subclass of
                                                             btgym.strategy.base.BTgymBaseStrateg
-            engine=None (bt.Cerebro):                       environment simulation engine, any bt.Cerebro subclass,
-                                                            overrides `strategy` arg.
+            engine=None (bt.Cerebro):                       environment simulation engine, any bt.Cerebro subclass
+                                                            or BTgymFastEngine instance, overrides `strategy` arg.
+            fast_engine=False (bool):                       if True and no <engine> is given, use BTgymFastEngine
+                                                            running `strategy`, any subclass of BTgymFastStrategy;
+                                                            rendering is disabled. Broker supports commission and
+                                                            leverage, but no futures-like margin or multiplier.
             network_address=`tcp://127.0.0.1:` (str):       BTGym_server address.
             port=5500 (int):                                network port to use for server - API_shell communication.
+            in_process=False (bool):                        if True, run server episode loop in environment process,
+                                                            passing messages via in-memory channel instead of ZMQ,
+                                                            `port` is ignored. Data_server is still used.
+            pipeline_episodes=False (bool):                 if True, server prepares next episode from current trial
+                                                            in background while current episode runs.
             data_master=True (bool):                        let this environment control over data_server;
             data_network_address=`tcp://127.0.0.1:` (str):  data_server address.
             data_port=4999 (int):                           network port to use for server -- data_server communication.
+            data_shared_memory=False (bool):                if True, data_server puts dataset in shared memory segment
+                                                            and sends Trials as row descriptors, valid for data_master.
+            data_server_workers=4 (int):                    number of data_server threads serving environments requests
+                                                            concurrently, valid for data_master.
             connect_timeout=60 (int):                       server connection timeout in seconds.
             render_enabled=True (bool):                     enable rendering for this environment;
             render_modes=['human', 'episode'] (list):       `episode` - plotted episode results;
@@ -202,8 +222,12 @@ class BTgymEnv(gym.Env):
                 # Number of environment steps to skip before returning next response,
                 # e.g. if set to 10 -- agent will interact with environment every 10th episode step;
                 # Every other step agent's action is assumed to be 'hold'.
-                # Note: INFO part of environment response is a list of all skipped frame's info's,
-                #       i.e. [info[-9], info[-8], ..., info[0].
+            info_policy=None,
+                # INFO part of environment response: either `last` step info, [info[0]],
+                # `all` skipped frame's info's, i.e. [info[-9], info[-8], ..., info[0]], `none`, i.e. [{}], or
+                # callable reducing list of all skipped frame's info's.
+            state_dtype=None,
+                # observation dtype, floating point `state_shape` spaces should be of this dtype, default np.float32.
         )
         # Update self attributes, remove used kwargs:
         for key in dir(self):
@@ -212,6 +236,10 @@ class BTgymEnv(gym.Env):
 
         self.metadata = {'render.modes': self.render_modes}
 
+        # Fast engine doesn't support episode plotting:
+        if self.fast_engine or isinstance(self.engine, BTgymFastEngine):
+            self.render_enabled = False
+
         # Logging and verbosity control:
         if self.log is None:
             StreamHandler(sys.stdout).push_application()
@@ -302,8 +330,13 @@ class BTgymEnv(gym.Env):
             # Default configuration for Backtrader computational engine (Cerebro),
             # if no bt.Cerebro() custom subclass has been passed,
             # get base class Cerebro(), using kwargs on top of defaults:
-            self.engine = bt.Cerebro()
-            msg = 'Base Cerebro class used.'
+            if self.fast_engine:
+                self.engine = BTgymFastEngine()
+                msg = 'Fast engine used.'
+
+            else:
+                self.engine = bt.Cerebro()
+                msg = 'Base Cerebro class used.'
 
             # First, set STRATEGY configuration:
             if self.strategy is not None:
@@ -312,9 +345,14 @@ class BTgymEnv(gym.Env):
 
             else:
                 # Base class strategy :
-                self.strategy = BTgymBaseStrategy
+                self.strategy = BTgymFastStrategy if self.fast_engine else BTgymBaseStrategy
                 msg2 = 'Base Strategy class used.'
 
+            if self.fast_engine and not issubclass(self.strategy, BTgymFastStrategy):
+                msg = 'Fast engine runs BTgymFastStrategy subclasses only, got strategy: {}'.format(self.strategy)
+                self.log.error(msg)
+                raise TypeError(msg)
+
             # Add, using kwargs on top of defaults:
             #self.log.debug('kwargs for strategy: {}'.format(kwargs))
             strat_idx = self.engine.addstrategy(self.strategy, **kwargs)
@@ -370,7 +408,10 @@ class BTgymEnv(gym.Env):
                                  self.dataset_stat.loc['max', self.dataset_columns].max()))
 
         # Set observation space shape from engine/strategy parameters:
-        self.observation_space = DictSpace(self.params['strategy']['state_shape'])
+        self.observation_space = DictSpace(
+            self.params['strategy']['state_shape'],
+            dtype=self.params['strategy'].get('state_dtype', None),
+        )
 
         self.log.debug('Obs. shape: {}'.format(self.observation_space.spaces))
         #self.log.debug('Obs. min:\n{}\nmax:\n{}'.format(self.observation_space.low, self.observation_space.high))
@@ -408,7 +449,9 @@ class BTgymEnv(gym.Env):
             message: message to send;
 
         Note:
-            socket zmq.RCVTIMEO and zmq.SNDTIMEO should be set to some finite number of milliseconds.
+            socket zmq.RCVTIMEO and zmq.SNDTIMEO should be set to some finite number of milliseconds;
+            numpy arrays are exchanged as raw buffer frames, received ones are read-only,
+            see `btgym.server.send_message()`.
 
         Returns:
             dictionary:
@@ -421,7 +464,7 @@ class BTgymEnv(gym.Env):
             message=None,
         )
         try:
-            socket.send_pyobj(message)
+            send_message(socket, message)
 
         except zmq.ZMQError as e:
             if e.errno == zmq.EAGAIN:
@@ -433,7 +476,7 @@ class BTgymEnv(gym.Env):
 
         start = time.time()
         try:
-            response['message'] = socket.recv_pyobj()
+            response['message'] = recv_message(socket)
             response['time'] = time.time() - start
 
         except zmq.ZMQError as e:
@@ -446,6 +489,15 @@ class BTgymEnv(gym.Env):
 
         return response
 
+    def _make_server(self, **kwargs):
+        """
+        Returns configured server process instance.
+
+        Args:
+            kwargs:     BTgymServer kwargs.
+        """
+        return BTgymServer(**kwargs)
+
     def _start_server(self):
         """
         Configures backtrader REQ/REP server instance and starts server process.
@@ -457,19 +509,7 @@ class BTgymEnv(gym.Env):
             self.context.destroy()
             self.socket = None
 
-        # 2. Kill any process using server port:
-        cmd = "kill $( lsof -i:{} -t ) > /dev/null 2>&1".format(self.port)
-        os.system(cmd)
-
-        # Set up client channel:
-        self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.REQ)
-        self.socket.setsockopt(zmq.RCVTIMEO, self.connect_timeout * 1000)
-        self.socket.setsockopt(zmq.SNDTIMEO, self.connect_timeout * 1000)
-        self.socket.connect(self.network_address)
-
-        # Configure and start server:
-        self.server = BTgymServer(
+        server_kwargs = dict(
             cerebro=self.engine,
             render=self.renderer,
             network_address=self.network_address,
@@ -477,11 +517,33 @@ class BTgymEnv(gym.Env):
             connect_timeout=self.connect_timeout,
             log_level=self.log_level,
             task=self.task,
+            pipeline_episodes=self.pipeline_episodes,
         )
-        self.server.daemon = False
-        self.server.start()
-        # Wait for server to startup:
-        time.sleep(1)
+        if self.in_process:
+            # Configure and start server thread, its channel serves as both context and socket:
+            self.server = BTgymInProcessServer(**server_kwargs)
+            self.context = self.socket = self.server.channel
+            self.socket.setsockopt(zmq.RCVTIMEO, self.connect_timeout * 1000)
+            self.server.start()
+
+        else:
+            # 2. Kill any process using server port:
+            cmd = "kill $( lsof -i:{} -t ) > /dev/null 2>&1".format(self.port)
+            os.system(cmd)
+
+            # Set up client channel:
+            self.context = zmq.Context()
+            self.socket = self.context.socket(zmq.REQ)
+            self.socket.setsockopt(zmq.RCVTIMEO, self.connect_timeout * 1000)
+            self.socket.setsockopt(zmq.SNDTIMEO, self.connect_timeout * 1000)
+            self.socket.connect(self.network_address)
+
+            # Configure and start server:
+            self.server = self._make_server(**server_kwargs)
+            self.server.daemon = False
+            self.server.start()
+            # Wait for server to startup:
+            time.sleep(1)
 
         # Check connection:
         self.log.info('Server started, pinging {} ...'.format(self.network_address))
@@ -605,6 +667,32 @@ class BTgymEnv(gym.Env):
 
         return response
 
+    def _check_servers(self):
+        """
+        Ensures data_server [for data_master] and server processes are running and domain dataset is ready.
+        """
+        # Data Server check:
+        if self.data_master:
+            if not self.data_server or not self.data_server.is_alive():
+                self.log.info('No running data_server found, starting...')
+                self._start_data_server()
+
+            # Domain dataset status check:
+            self.data_server_response = self._comm_with_timeout(
+                socket=self.data_socket,
+                message={'ctrl': '_get_info'}
+            )
+            if not self.data_server_response['message']['dataset_is_ready']:
+                self.log.info(
+                    'Data domain `reset()` called prior to `reset_data()` with [possibly inconsistent] defaults.'
+                )
+                self.reset_data()
+
+        # Server process check:
+        if not self.server or not self.server.is_alive():
+            self.log.info('No running server found, starting...')
+            self._start_server()
+
     def reset(self, **kwargs):
         """
         Implementation of OpenAI Gym env.reset method. Starts new episode. Episode data are sampled
@@ -636,27 +724,7 @@ class BTgymEnv(gym.Env):
                     )
                 )
         """
-        # Data Server check:
-        if self.data_master:
-            if not self.data_server or not self.data_server.is_alive():
-                self.log.info('No running data_server found, starting...')
-                self._start_data_server()
-
-            # Domain dataset status check:
-            self.data_server_response = self._comm_with_timeout(
-                socket=self.data_socket,
-                message={'ctrl': '_get_info'}
-            )
-            if not self.data_server_response['message']['dataset_is_ready']:
-                self.log.info(
-                    'Data domain `reset()` called prior to `reset_data()` with [possibly inconsistent] defaults.'
-                )
-                self.reset_data()
-
-        # Server process check:
-        if not self.server or not self.server.is_alive():
-            self.log.info('No running server found, starting...')
-            self._start_server()
+        self._check_servers()
 
         if self._force_control_mode():
             self.server_response = self._comm_with_timeout(
@@ -768,7 +836,7 @@ class BTgymEnv(gym.Env):
 
     def get_stat(self):
         """
-        Returns last run episode statistics.
+        Returns last run episode statistics, including engine setup time `setup_time`.
 
         Note:
             when invoked, forces running episode to terminate.
@@ -863,7 +931,9 @@ class BTgymEnv(gym.Env):
                 dataset=self.dataset,
                 network_address=self.data_network_address,
                 log_level=self.log_level,
-                task=self.task
+                task=self.task,
+                shared_memory=self.data_shared_memory,
+                num_workers=self.data_server_workers,
             )
             self.data_server.daemon = False
             self.data_server.start()
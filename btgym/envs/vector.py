@@ -0,0 +1,140 @@
+###############################################################################
+#
+# Copyright (C) 2017-2018 Andrew Muzikin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+from btgym.envs.backtrader import BTgymEnv
+from btgym.server import BTgymVecServer
+from btgym.spaces import batch_space
+
+
+class BTgymVecEnv(BTgymEnv):
+    """
+    Vectorized OpenAI Gym API shell for Backtrader backtesting/trading library.
+    Runs `num_envs` independent episodes within single server process and exchanges
+    batches of actions and responses with it, one message per step for all sub-environments.
+
+    Finished sub-environments are reset automatically, see `BTgymVecServer` for details.
+    Rendering is not supported.
+
+    Note:
+        as for gym vectorized environments, `observation_space` and `action_space` describe batches
+        for all sub-environments, while `single_observation_space` and `single_action_space` describe
+        single sub-environment ones.
+    """
+    num_envs = 4  # number of sub-environments.
+
+    def __init__(self, **kwargs):
+        """
+        Keyword Args:
+
+            num_envs=4 (int):   number of sub-environments to run;
+            **kwargs:           same as for BTgymEnv, except `render_enabled` and `in_process`, which are ignored.
+        """
+        kwargs['render_enabled'] = False
+        kwargs['in_process'] = False
+        super(BTgymVecEnv, self).__init__(**kwargs)
+
+        self.single_observation_space = self.observation_space
+        self.single_action_space = self.action_space
+        self.observation_space = batch_space(self.single_observation_space, self.num_envs)
+        self.action_space = batch_space(self.single_action_space, self.num_envs)
+
+    def _make_server(self, **kwargs):
+        """
+        Returns configured vectorized server process instance.
+
+        Args:
+            kwargs:     BTgymServer kwargs.
+        """
+        return BTgymVecServer(num_envs=self.num_envs, **kwargs)
+
+    def reset(self, **kwargs):
+        """
+        Ends running episodes and starts new ones for all sub-environments.
+
+        Args:
+            kwargs:         same as for BTgymEnv.reset(), applies to all sub-environments
+                            including ones being reset automatically.
+
+        Returns:
+            stacked sub-environments observations, first dimension is `num_envs`.
+        """
+        self._check_servers()
+
+        if self._force_control_mode():
+            self.env_response = self._exchange(
+                {'ctrl': '_reset', 'kwargs': kwargs, 'action': self.server_actions[0]}
+            )
+            self._assert_response(self.env_response)
+            return self.env_response[0]
+
+        else:
+            msg = 'Something went wrong. env.reset() can not get response from server.'
+            self.log.exception(msg)
+            raise ChildProcessError(msg)
+
+    def step(self, actions):
+        """
+        Makes a step in every sub-environment.
+
+        Args:
+            actions:    list of `num_envs` ints, each representing action from env.single_action_space
+
+        Returns:
+            tuple (stacked observations, rewards array, dones array, list of infos)
+        """
+        try:
+            assert len(actions) == self.num_envs
+            for action in actions:
+                assert self.single_action_space.contains(action)
+
+            assert not self._closed and self.socket is not None and not self.socket.closed
+
+        except (AssertionError, TypeError):
+            msg = (
+                '\nExpected {} actions from space {}, got: {}, or environment closed: {}.' +
+                '\nHint: forgot to call reset()?'
+            ).format(self.num_envs, self.single_action_space, actions, self._closed)
+            self.log.exception(msg)
+            raise AssertionError(msg)
+
+        self.env_response = self._exchange({'action': [self.server_actions[action] for action in actions]})
+        if not isinstance(self.env_response, tuple):
+            # Server replies with `ctrl` message if actions can't be taken:
+            self._assert_response(self.env_response)
+
+        return self.env_response
+
+    def _exchange(self, message):
+        """
+        Sends message to server, returns response.
+        """
+        response = self._comm_with_timeout(socket=self.socket, message=message)
+        if not response['status'] in 'ok':
+            msg = 'Server unreachable with status: <{}>.'.format(response['status'])
+            self.log.error(msg)
+            raise ConnectionError(msg)
+
+        return response['message']
+
+    def render(self, mode='other_mode', close=False):
+        """
+        Rendering is not supported for vectorized environment.
+        """
+        self.log.warning('Rendering is not supported for vectorized environment.')
+        return None
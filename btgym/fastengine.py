@@ -0,0 +1,813 @@
+###############################################################################
+#
+# Copyright (C) 2017-2018 Andrew Muzikin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+import copy
+
+import numpy as np
+import pandas as pd
+
+
+class BTgymFastLine:
+    """
+    Backtrader-like data line over preallocated numpy array: supports `[ago]` indexing relative
+    to current step, `get(ago, size)` and `buflen()`. Engine moves the line forward.
+    """
+    __slots__ = ('array', 'idx')
+
+    def __init__(self, array):
+        self.array = array
+        self.idx = -1
+
+    def __getitem__(self, ago):
+        i = self.idx + ago
+        if i < 0:
+            raise IndexError('array index out of range')
+
+        return self.array[i]
+
+    def __setitem__(self, ago, value):
+        self.array[self.idx + ago] = value
+
+    def get(self, ago=0, size=1):
+        """
+        Returns:
+            array view of `size` values ending `ago` steps back from current one.
+        """
+        end = self.idx + ago + 1
+        return self.array[max(end - size, 0):end]
+
+    def buflen(self):
+        return self.idx + 1
+
+    def __len__(self):
+        return self.idx + 1
+
+
+class BTgymFastDateTimeLine(BTgymFastLine):
+    """
+    Data line holding datetime64 values.
+    """
+    __slots__ = ()
+
+    def datetime(self, ago=0):
+        """
+        Returns:
+            python datetime of the bar `ago` steps back.
+        """
+        return pd.Timestamp(self[ago]).to_pydatetime()
+
+
+class BTgymFastData:
+    """
+    Backtrader-like datafeed over episode dataframe, holds every price line as numpy array.
+    Built from `backtrader.feeds.PandasDirectData` instance as returned by BTgymDataset.to_btfeed(),
+    so feed params (dataframe and columns mapping) are the same as for Cerebro engine.
+    """
+    line_names = ('open', 'high', 'low', 'close', 'volume', 'openinterest')
+
+    def __init__(self, feed):
+        """
+        Args:
+            feed:   backtrader.feeds.PandasDirectData instance.
+        """
+        self.p = self.params = feed.p
+        self._name = getattr(feed, '_name', '')
+        dataframe = self.p.dataname
+        values = dataframe.values
+        self.numrecords = dataframe.shape[0]
+
+        self.lines = []
+        for name in self.line_names:
+            column = getattr(self.p, name)
+            # Pandas to BT.feeds params count index as column 0:
+            if column is not None and column > 0:
+                array = np.ascontiguousarray(values[:, column - 1], dtype=np.float64)
+
+            else:
+                array = np.full(self.numrecords, np.nan)
+
+            line = BTgymFastLine(array)
+            setattr(self, name, line)
+            self.lines.append(line)
+
+        self.datetime = BTgymFastDateTimeLine(pd.DatetimeIndex(dataframe.index).values)
+        self.lines.append(self.datetime)
+
+    def forward(self):
+        for line in self.lines:
+            line.idx += 1
+
+    def __len__(self):
+        return self.close.idx + 1
+
+
+class BTgymFastOrderData:
+    """
+    Order creation/execution details, same fields as for backtrader.OrderData.
+    """
+
+    def __init__(self, size=0, price=0.0, remsize=0):
+        self.size = size
+        self.remsize = remsize
+        self.price = price
+        self.value = 0.0
+        self.comm = 0.0
+        self.pnl = 0.0
+        self.psize = 0
+        self.pprice = 0.0
+
+    def add(self, size, price, value, comm, pnl, psize, pprice):
+        self.remsize -= size
+        oldvalue = self.size * self.price
+        newvalue = size * price
+        self.size += size
+        self.price = (oldvalue + newvalue) / self.size
+        self.value += value
+        self.comm += comm
+        self.pnl += pnl
+        self.psize = psize
+        self.pprice = pprice
+
+
+class BTgymFastOrder:
+    """
+    Market order, mimics backtrader.Order interface as seen by strategy notify_order().
+    """
+    Created, Submitted, Accepted, Partial, Completed, Canceled, Expired, Margin, Rejected = range(9)
+    Status = ['Created', 'Submitted', 'Accepted', 'Partial', 'Completed', 'Canceled', 'Expired', 'Margin', 'Rejected']
+
+    def __init__(self, data, size):
+        """
+        Args:
+            data:   BTgymFastData instance;
+            size:   signed order size, negative for sell orders.
+        """
+        self.data = data
+        self.size = size
+        self.status = self.Created
+        self.created = BTgymFastOrderData(size=size, price=data.close[0])
+        self.created_bar = len(data)
+        self.executed = BTgymFastOrderData(remsize=size)
+
+    def isbuy(self):
+        return self.size > 0
+
+    def issell(self):
+        return self.size < 0
+
+    def alive(self):
+        return self.status in [self.Created, self.Submitted, self.Partial, self.Accepted]
+
+    def getstatusname(self, status=None):
+        return self.Status[self.status if status is None else status]
+
+    def clone(self):
+        obj = copy.copy(self)
+        obj.executed = copy.copy(self.executed)
+        return obj
+
+
+class BTgymFastPosition:
+    """
+    Position size and average price, same update rules as for backtrader.Position.
+    """
+
+    def __init__(self, size=0, price=0.0):
+        self.size = size
+        self.price = price
+        self.price_orig = price
+
+    def clone(self):
+        return BTgymFastPosition(size=self.size, price=self.price)
+
+    def update(self, size, price):
+        """
+        Updates position.
+
+        Returns:
+            tuple (new size, new price, opened, closed), where `opened` and `closed` are parts of `size`
+            used to open/increase and close/reduce position respectively.
+        """
+        self.price_orig = self.price
+        oldsize = self.size
+        self.size += size
+
+        if not self.size:
+            opened, closed = 0, size
+            self.price = 0.0
+
+        elif not oldsize:
+            opened, closed = size, 0
+            self.price = price
+
+        elif oldsize > 0:
+            if size > 0:
+                opened, closed = size, 0
+                self.price = (self.price * oldsize + size * price) / self.size
+
+            elif self.size > 0:
+                opened, closed = 0, size
+
+            else:
+                opened, closed = self.size, -oldsize
+                self.price = price
+
+        else:
+            if size < 0:
+                opened, closed = size, 0
+                self.price = (self.price * oldsize + size * price) / self.size
+
+            elif self.size < 0:
+                opened, closed = 0, size
+
+            else:
+                opened, closed = self.size, -oldsize
+                self.price = price
+
+        return self.size, self.price, opened, closed
+
+    def __bool__(self):
+        return self.size != 0
+
+
+class BTgymFastTrade:
+    """
+    Round-trip trade record, mimics backtrader.Trade interface as seen by strategy notify_trade().
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.size = 0
+        self.price = 0.0
+        self.value = 0.0
+        self.commission = 0.0
+        self.pnl = 0.0
+        self.pnlcomm = 0.0
+        self.justopened = False
+        self.isopen = False
+        self.isclosed = False
+        self.long = None
+        self.baropen = 0
+        self.barclose = 0
+        self.barlen = 0
+
+    def update(self, size, price, commission):
+        if not size:
+            return
+
+        self.commission += commission
+        oldsize = self.size
+        self.size += size
+
+        self.justopened = bool(not oldsize and size)
+        if self.justopened:
+            self.baropen = len(self.data)
+            self.long = self.size > 0
+
+        self.isopen = bool(self.size)
+        self.barlen = len(self.data) - self.baropen
+        self.isclosed = bool(oldsize and not self.size)
+        if self.isclosed:
+            self.isopen = False
+            self.barclose = len(self.data)
+
+        if abs(self.size) > abs(oldsize):
+            self.price = (oldsize * self.price + size * price) / self.size
+            pnl = 0.0
+
+        else:
+            pnl = -size * (price - self.price)
+
+        self.pnl += pnl
+        self.pnlcomm = self.pnl - self.commission
+        self.value = self.size * self.price
+
+
+class BTgymFastBroker:
+    """
+    Single instrument broker: market orders executed at next bar open price,
+    stock-like asset with percentage commission and leverage.
+    Cash, value and execution arithmetic follows backtrader.brokers.BackBroker for that setup,
+    so both engines produce identical accounts given same orders.
+    """
+
+    def __init__(self, cash=10000.0, commission=0.0, leverage=1.0, shortcash=True):
+        """
+        Args:
+            cash:       starting cash;
+            commission: commission as fraction of operation value;
+            leverage:   cash needed to hold long position is position value divided by leverage;
+            shortcash:  if False, short positions are accounted with positive value, as for backtrader broker.
+        """
+        self.startingcash = self.cash = cash
+        self.commission = commission
+        self.leverage = leverage
+        self.shortcash = shortcash
+        self.data = None
+        self.start()
+
+    def start(self):
+        """
+        Resets account to starting state.
+        """
+        self.cash = self.startingcash
+        self._value = self.cash
+        self._leverage = 0.0
+        self.position = BTgymFastPosition()
+        self.trade = None
+        self.submitted = []
+        self.pending = []
+        self.order_notifications = []
+        self.trade_notifications = []
+
+    def setcash(self, cash):
+        self.startingcash = self.cash = cash
+
+    def setcommission(self, commission=0.0, margin=None, mult=1.0, leverage=1.0, **kwargs):
+        try:
+            assert not margin and mult == 1.0
+
+        except AssertionError:
+            raise ValueError('Fast engine supports stock-like assets only: no margin or multiplier.')
+
+        self.commission = commission
+        self.leverage = leverage
+
+    def set_shortcash(self, shortcash):
+        self.shortcash = shortcash
+
+    def getcash(self):
+        return self.cash
+
+    get_cash = getcash
+
+    def getvalue(self, datas=None):
+        return self._value
+
+    get_value = getvalue
+
+    def get_leverage(self):
+        return self._leverage
+
+    def getposition(self, data=None):
+        return self.position
+
+    def submit(self, order):
+        order.status = order.Submitted
+        self.submitted.append(order)
+        self.notify(order)
+        return order
+
+    def notify(self, order):
+        self.order_notifications.append(order.clone())
+
+    def _execute(self, order, price, cash=None, position=None):
+        """
+        Executes order at given price, or pseudo-executes it against given `cash` and `position`
+        to check margin at submission time.
+
+        Returns:
+            cash left after pseudo-execution, None for real one.
+        """
+        size = order.executed.remsize
+
+        if cash is None:
+            position = self.position
+            pprice_orig = position.price
+            psize, pprice, opened, closed = position.clone().update(size, price)
+            pnl = -closed * (price - pprice_orig)
+            cash = self.cash
+
+        else:
+            pnl = 0
+            pprice_orig = price
+            psize, pprice, opened, closed = position.update(size, price)
+
+        is_pseudo = position is not self.position
+
+        if closed:
+            if self.shortcash:
+                closedvalue = -closed * pprice_orig
+
+            else:
+                closedvalue = abs(closed) * pprice_orig
+
+            # Positive value operations move cash with leverage:
+            cash += (closedvalue / self.leverage if closedvalue > 0 else closedvalue) + pnl
+            closedcomm = abs(closed) * self.commission * price
+            cash -= closedcomm
+            if not is_pseudo:
+                self.cash = cash
+
+        else:
+            closedvalue = closedcomm = 0.0
+
+        popened = opened
+        if opened:
+            if self.shortcash:
+                openedvalue = opened * price
+
+            else:
+                openedvalue = abs(opened) * price
+
+            cash -= openedvalue / self.leverage if openedvalue > 0 else openedvalue
+            openedcomm = abs(opened) * self.commission * price
+            cash -= openedcomm
+
+            if cash < 0.0:
+                # Not enough cash, nullify:
+                opened = 0
+                openedvalue = openedcomm = 0.0
+
+            elif not is_pseudo:
+                self.cash = cash
+
+        else:
+            openedvalue = openedcomm = 0.0
+
+        if is_pseudo:
+            return cash
+
+        execsize = closed + opened
+        if execsize:
+            position.update(execsize, price)
+            order.executed.add(
+                execsize,
+                price,
+                closedvalue + openedvalue,
+                closedcomm + openedcomm,
+                pnl,
+                psize,
+                pprice
+            )
+            order.status = order.Partial if order.executed.remsize else order.Completed
+            self.notify(order)
+            self._update_trade(closed, opened, price, closedcomm, openedcomm)
+
+        if popened and not opened:
+            order.status = order.Margin
+            self.notify(order)
+
+        return None
+
+    def _update_trade(self, closed, opened, price, closedcomm, openedcomm):
+        """
+        Updates current trade with executed parts of the order, queues trade notifications.
+        """
+        if self.trade is None:
+            self.trade = BTgymFastTrade(self.data)
+
+        if closed:
+            self.trade.update(closed, price, closedcomm)
+            if self.trade.isclosed:
+                self.trade_notifications.append(copy.copy(self.trade))
+
+        if opened:
+            if self.trade.isclosed:
+                self.trade = BTgymFastTrade(self.data)
+
+            self.trade.update(opened, price, openedcomm)
+            if self.trade.isclosed:
+                self.trade_notifications.append(copy.copy(self.trade))
+
+        if self.trade.justopened:
+            self.trade_notifications.append(copy.copy(self.trade))
+
+    def next(self):
+        """
+        Broker step: accepts or rejects submitted orders, executes pending ones at current bar open price,
+        updates account value with current bar close price.
+        """
+        # Check margin for all submitted orders at creation prices:
+        cash = self.cash
+        position = self.position.clone()
+        for order in self.submitted:
+            cash = self._execute(order, order.created.price, cash=cash, position=position)
+            if cash >= 0.0:
+                order.status = order.Accepted
+                self.pending.append(order)
+
+            else:
+                order.status = order.Margin
+
+            self.notify(order)
+
+        self.submitted = []
+
+        # Market orders get executed at first bar after creation:
+        pending = []
+        for order in self.pending:
+            if len(self.data) > order.created_bar:
+                self._execute(order, self.data.open[0])
+
+            if order.alive():
+                pending.append(order)
+
+        self.pending = pending
+
+        self._update_value()
+
+    def _update_value(self):
+        size = self.position.size
+        price = self.position.price
+        close = self.data.close[0]
+
+        if not self.shortcash:
+            if size >= 0:
+                dvalue = size * close
+
+            else:
+                dvalue = price * size
+                dvalue += (price - close) * size
+
+            dvalue = abs(dvalue)
+
+        else:
+            dvalue = size * close
+
+        dunrealized = size * (close - price)
+
+        pos_value_unlever = 0.0
+        if dvalue > 0:
+            pos_value_unlever += (dvalue - dunrealized) / self.leverage
+            pos_value_unlever += dunrealized
+
+        else:
+            pos_value_unlever += dvalue
+
+        self._value = self.cash + pos_value_unlever
+        self._leverage = dvalue / (pos_value_unlever or 1.0)
+
+
+class BTgymFastObserver:
+    """
+    Statistics lines holder, mimics `strategy.stats.<observer>.<line>` access.
+    """
+
+    def __init__(self, length, *line_names):
+        for name in line_names:
+            setattr(self, name, BTgymFastLine(np.full(length, np.nan)))
+
+
+class BTgymFastStats:
+    """
+    Strategy statistics, equivalent to bt.observers.Broker and bt.observers.DrawDown lines.
+    """
+
+    def __init__(self, length):
+        self.broker = BTgymFastObserver(length, 'cash', 'value')
+        self.drawdown = BTgymFastObserver(length, 'drawdown', 'maxdrawdown')
+
+
+class BTgymFastAnalyzers:
+    """
+    Named analyzers collection, mimics `strategy.analyzers` access.
+    """
+
+    def __init__(self):
+        self._items = []
+        self._names = []
+
+    def append(self, item, name):
+        self._items.append(item)
+        self._names.append(name)
+        setattr(self, name, item)
+
+    def getnames(self):
+        return list(self._names)
+
+    def getbyname(self, name):
+        return self._items[self._names.index(name)]
+
+    def __getitem__(self, key):
+        return self._items[key]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class BTgymFastEngine:
+    """
+    Pure numpy backtesting engine, drop-in replacement for bt.Cerebro within BTgymServer
+    for the common setup: single instrument, market orders, fixed stake, percentage commission, leverage.
+
+    Exposes Cerebro configuration API: addstrategy(), addsizer(), addanalyzer(), adddata(), run(), runstop()
+    and `broker` property. Runs strategies derived from BTgymFastStrategy.
+
+    Per-bar order of events is the same as for Cerebro engine run with `preload=False`:
+    broker step, order and trade notifications, strategy prenext/nextstart/next, analyzers, statistics update.
+    Broker value and cash, drawdown and max. drawdown statistics are always computed, equivalent to
+    bt.observers.Broker and bt.observers.DrawDown; any other observers are ignored.
+    """
+
+    def __init__(self, **kwargs):
+        self.strats = []
+        self.analyzers = []
+        self.observers = []
+        self.sizers = dict()
+        self.datas = []
+        self.stake = 1
+        self._broker = BTgymFastBroker()
+        self._event_stop = False
+        self.runstrats = []
+
+    @property
+    def broker(self):
+        return self._broker
+
+    def addstrategy(self, strategy, *args, **kwargs):
+        # Strategy module depends on this one:
+        from btgym.strategy.fast import BTgymFastStrategy
+
+        if not (isinstance(strategy, type) and issubclass(strategy, BTgymFastStrategy)):
+            raise TypeError(
+                'Fast engine runs BTgymFastStrategy subclasses only, got: {}'.format(strategy)
+            )
+        self.strats.append([(strategy, args, kwargs)])
+        return len(self.strats) - 1
+
+    def addsizer(self, sizercls, *args, **kwargs):
+        """
+        Only fixed size sizers are supported, stake is taken from `stake` kwarg.
+        """
+        self.sizers[None] = (sizercls, args, kwargs)
+        self.stake = kwargs.get('stake', 1)
+
+    def addobserver(self, obscls, *args, **kwargs):
+        self.observers.append((False, obscls, args, kwargs))
+
+    def addanalyzer(self, ancls, *args, **kwargs):
+        self.analyzers.append((ancls, args, kwargs))
+
+    def adddata(self, data, name=None):
+        """
+        Args:
+            data:   backtrader.feeds.PandasDirectData instance.
+        """
+        self.datas.append(BTgymFastData(data))
+        return self.datas[-1]
+
+    def runstop(self):
+        self._event_stop = True
+
+    def run(self, **kwargs):
+        """
+        Runs episode over entire data.
+
+        Returns:
+            list holding strategy instance.
+        """
+        try:
+            assert len(self.strats) == 1 and len(self.datas) == 1
+
+        except AssertionError:
+            raise ValueError('Fast engine runs exactly one strategy over exactly one data feed.')
+
+        self._event_stop = False
+        data = self.datas[0]
+        broker = self._broker
+        broker.data = data
+        broker.start()
+
+        strategy_class, args, kwargs = self.strats[0][0]
+        strategy = strategy_class.__new__(strategy_class)
+        strategy.p = strategy.params = strategy_class.params._derive(**kwargs)
+        strategy.env = strategy.cerebro = self
+        strategy.broker = broker
+        strategy.datas = self.datas
+        strategy.data = data
+        strategy.stats = BTgymFastStats(data.numrecords)
+        strategy.analyzers = BTgymFastAnalyzers()
+        strategy.__init__(*args, **kwargs)
+        self.runstrats = [strategy]
+
+        analyzers = []
+        for analyzer_class, an_args, an_kwargs in self.analyzers:
+            an_kwargs = dict(an_kwargs)
+            name = an_kwargs.pop('_name', analyzer_class.__name__.lower())
+            analyzer = analyzer_class.__new__(analyzer_class)
+            analyzer.strategy = strategy
+            analyzer.__init__(*an_args, **an_kwargs)
+            strategy.analyzers.append(analyzer, name)
+            analyzers.append(analyzer)
+
+        cash_line = strategy.stats.broker.cash
+        value_line = strategy.stats.broker.value
+        drawdown_line = strategy.stats.drawdown.drawdown
+        maxdrawdown_line = strategy.stats.drawdown.maxdrawdown
+        max_value = float('-inf')
+        max_drawdown = 0.0
+        min_period = strategy.min_period
+
+        for bar in range(data.numrecords):
+            data.forward()
+            broker.next()
+
+            # Notifications:
+            notifications = broker.order_notifications
+            broker.order_notifications = []
+            for order in notifications:
+                strategy.notify_order(order)
+
+            notifications = broker.trade_notifications
+            broker.trade_notifications = []
+            for trade in notifications:
+                strategy.notify_trade(trade)
+
+            value = broker.getvalue()
+            max_value = max(max_value, value)
+
+            # Strategy and analyzers step:
+            min_period_status = min_period - bar - 1
+            if min_period_status > 0:
+                strategy.prenext()
+                for analyzer in analyzers:
+                    analyzer.prenext()
+
+            elif min_period_status == 0:
+                strategy.nextstart()
+                for analyzer in analyzers:
+                    analyzer.nextstart()
+
+            else:
+                strategy.next()
+                for analyzer in analyzers:
+                    analyzer.next()
+
+            # Statistics:
+            drawdown = 100.0 * (max_value - value) / max_value
+            max_drawdown = max(max_drawdown, drawdown)
+            for line, value in [
+                (cash_line, broker.getcash()),
+                (value_line, broker.getvalue()),
+                (drawdown_line, drawdown),
+                (maxdrawdown_line, max_drawdown),
+            ]:
+                line.idx += 1
+                line[0] = value
+
+            if self._event_stop:
+                break
+
+        strategy.stop()
+        for analyzer in analyzers:
+            analyzer.stop()
+
+        return self.runstrats
+
+
+class BTgymFastEngineFactory:
+    """
+    Builds fresh BTgymFastEngine instance for every episode from template engine configuration,
+    same interface as for BTgymCerebroFactory.
+    """
+
+    def __init__(self, engine, observers=(), analyzers=()):
+        """
+        Args:
+            engine:     template BTgymFastEngine instance with no data added;
+            observers:  ignored, drawdown statistics are always computed by fast engine;
+            analyzers:  iterable of (analyzer class, kwargs) tuples to add.
+        """
+        self.template = engine
+        self.engine_class = type(engine)
+        self.strats = [[(cls, args, kwargs) for cls, args, kwargs in strat] for strat in engine.strats]
+        self.analyzers = list(engine.analyzers) + [(aux, (), kwargs) for aux, kwargs in analyzers]
+
+    def make(self):
+        """
+        Returns:
+            new engine instance, ready to add data and run.
+        """
+        engine = self.engine_class()
+        engine.strats = [[(cls, args, dict(kwargs)) for cls, args, kwargs in strat] for strat in self.strats]
+        engine.analyzers = list(self.analyzers)
+        engine.observers = list(self.template.observers)
+        engine.sizers = dict(self.template.sizers)
+        engine.stake = self.template.stake
+        engine._broker = BTgymFastBroker(
+            cash=self.template.broker.startingcash,
+            commission=self.template.broker.commission,
+            leverage=self.template.broker.leverage,
+            shortcash=self.template.broker.shortcash,
+        )
+        return engine
@@ -168,7 +168,7 @@ class BTgymRendering():
             assert type(info[-1]) == dict
             info_dict = info[-1]
 
-        except AssertionError:
+        except (AssertionError, IndexError, KeyError, TypeError):
             try:
                 assert type(info) == dict
                 info_dict = info
@@ -5,7 +5,7 @@ import backtrader as bt
 import backtrader.indicators as btind
 
 from btgym.strategy.base import BTgymBaseStrategy
-from btgym.strategy.utils import tanh, abs_norm_ratio, exp_scale, discounted_average, log_transform
+from btgym.strategy.utils import tanh, abs_norm_ratio, exp_scale, discounted_average, log_transform, rolling_mean
 
 from gym import spaces
 from btgym import DictSpace
@@ -126,7 +126,24 @@ class DevStrat_4_6(BTgymBaseStrategy):
             'first_row': np.asarray(self.p.metadata['first_row'])
         }
 
+    def get_episode_features(self, prices):
+        # Same channels as in get_market_state(), computed for entire episode at once:
+        x = np.stack(
+            [
+                np.concatenate([[np.nan], np.diff(prices['open'])]),
+                prices['high'] - prices['open'],
+                prices['low'] - prices['open'],
+            ],
+            axis=-1
+        )
+        x_market = tanh(x * self.p.state_ext_scale)
+
+        return dict(external=x_market[:, None, :])
+
     def get_market_state(self):
+        x_market = self.get_feature_window('external')
+        if x_market is not None:
+            return x_market
 
         x = np.stack(
             [
@@ -170,8 +187,9 @@ class DevStrat_4_6(BTgymBaseStrategy):
 
         self.state['external'] = self.get_market_state()
         self.state['internal'] = self.get_broker_state()
-        self.state['action'] = np.asarray(self.sliding_stat['action'])[:, None, None]
-        self.state['reward'] = np.asarray(self.sliding_stat['reward'])[:, None, None]
+        # Buffer windows get overwritten by next update, so take copies:
+        self.state['action'] = np.array(self.sliding_stat['action'])[:, None, None]
+        self.state['reward'] = np.array(self.sliding_stat['reward'])[:, None, None]
 
         return self.state
 
@@ -197,13 +215,13 @@ class DevStrat_4_6(BTgymBaseStrategy):
 
         # Potential-based shaping function 1:
         # based on potential of averaged profit/loss for current opened trade (unrealized p/l):
-        unrealised_pnl = np.asarray(self.sliding_stat['unrealized_pnl'])
-        f1 = 1.0 * np.average(unrealised_pnl[1:]) - np.average(unrealised_pnl[:-1])
+        unrealised_pnl = self.sliding_stat['unrealized_pnl']
+        f1 = 1.0 * unrealised_pnl.mean(skip_first=1) - unrealised_pnl.mean(skip_last=1)
 
         # Potential-based shaping function 2:
         # based on potential of averaged broker value, normalized wrt to max drawdown and target bounds.
-        norm_broker_value = np.asarray(self.sliding_stat['broker_value'])
-        f2 = 1.0 * np.average(norm_broker_value[1:]) - np.average(norm_broker_value[:-1])
+        norm_broker_value = self.sliding_stat['broker_value']
+        f2 = 1.0 * norm_broker_value.mean(skip_first=1) - norm_broker_value.mean(skip_last=1)
 
         # Main reward function: normalized realized profit/loss:
         realized_pnl = np.asarray(self.sliding_stat['realized_pnl'])[-1]
@@ -338,8 +356,8 @@ class DevStrat_4_7(DevStrat_4_6):
 
         # Potential-based shaping function 1:
         # based on potential of averaged profit/loss for current opened trade (unrealized p/l):
-        unrealised_pnl = np.asarray(self.sliding_stat['unrealized_pnl'])
-        f1 = self.p.gamma * np.average(unrealised_pnl[1:]) - np.average(unrealised_pnl[:-1])
+        unrealised_pnl = self.sliding_stat['unrealized_pnl']
+        f1 = self.p.gamma * unrealised_pnl.mean(skip_first=1) - unrealised_pnl.mean(skip_last=1)
         #f1 = self.p.gamma * discounted_average(unrealised_pnl[1:], self.p.gamma)\
         #     - discounted_average(unrealised_pnl[:-1], self.p.gamma)
 
@@ -347,8 +365,8 @@ class DevStrat_4_7(DevStrat_4_6):
 
         # Potential-based shaping function 2:
         # based on potential of averaged broker value, normalized wrt to max drawdown and target bounds.
-        norm_broker_value = np.asarray(self.sliding_stat['broker_value'])
-        f2 = self.p.gamma * np.average(norm_broker_value[1:]) - np.average(norm_broker_value[:-1])
+        norm_broker_value = self.sliding_stat['broker_value']
+        f2 = self.p.gamma * norm_broker_value.mean(skip_first=1) - norm_broker_value.mean(skip_last=1)
         #f2 = self.p.gamma * discounted_average(norm_broker_value[1:], self.p.gamma)\
         #     - discounted_average(norm_broker_value[:-1], self.p.gamma)
 
@@ -573,7 +591,19 @@ class DevStrat_4_9(DevStrat_4_7):
         )
         self.data.dim_sma.plotinfo.plot = False
 
+    def get_episode_features(self, prices):
+        x = np.stack(
+            [prices['open']] + [rolling_mean(prices['close'], period) for period in [4, 8, 16, 32, 64, 128, 256]],
+            axis=-1
+        )
+        x = log_transform(np.gradient(x, axis=1) * self.p.state_ext_scale)
+
+        return dict(external=x[:, None, :])
+
     def get_market_state(self):
+        x_market = self.get_feature_window('external')
+        if x_market is not None:
+            return x_market
 
         x = np.stack(
             [
@@ -631,16 +661,19 @@ class DevStrat_4_10(DevStrat_4_7):
         scale = 10.0
         # Potential-based shaping function 1:
         # based on log potential of averaged profit/loss for current opened trade (unrealized p/l):
-        unrealised_pnl = np.asarray(self.sliding_stat['unrealized_pnl']) / 2 + 1 # shift [-1,1] -> [0,1]
+        # Averages are shifted [-1,1] -> [0,1]:
+        unrealised_pnl = self.sliding_stat['unrealized_pnl']
         # TODO: make normalizing util func to return in [0,1] by default
-        f1 = self.p.gamma * np.log(np.average(unrealised_pnl[1:])) - np.log(np.average(unrealised_pnl[:-1]))
+        f1 = self.p.gamma * np.log(unrealised_pnl.mean(skip_first=1) / 2 + 1) -\
+            np.log(unrealised_pnl.mean(skip_last=1) / 2 + 1)
 
         debug['f1'] = f1
 
         # Potential-based shaping function 2:
         # based on potential of averaged broker value, log-normalized wrt to max drawdown and target bounds.
-        norm_broker_value = np.asarray(self.sliding_stat['broker_value']) / 2 + 1 # shift [-1,1] -> [0,1]
-        f2 = self.p.gamma * np.log(np.average(norm_broker_value[1:])) - np.log(np.average(norm_broker_value[:-1]))
+        norm_broker_value = self.sliding_stat['broker_value']
+        f2 = self.p.gamma * np.log(norm_broker_value.mean(skip_first=1) / 2 + 1) -\
+            np.log(norm_broker_value.mean(skip_last=1) / 2 + 1)
 
         debug['f2'] = f2
 
@@ -764,7 +797,16 @@ class DevStrat_4_11(DevStrat_4_10):
         )
         self.data.dim_sma.plotinfo.plot = False
 
+    def get_episode_features(self, prices):
+        x_sma = np.stack([rolling_mean(prices['close'], period) for period in [16, 32, 64, 128, 256]], axis=-1)
+        x = tanh(np.gradient(x_sma, axis=-1) * self.p.state_ext_scale)
+
+        return dict(external=x[:, None, :])
+
     def get_market_state(self):
+        x_market = self.get_feature_window('external')
+        if x_market is not None:
+            return x_market
 
         x_sma = np.stack(
             [
@@ -884,7 +926,16 @@ class DevStrat_4_12(DevStrat_4_11):
         )
         self.data.dim_sma.plotinfo.plot = False
 
+    def get_episode_features(self, prices):
+        x_sma = np.stack([rolling_mean(prices['close'], period) for period in [8, 16, 32, 64, 128, 256]], axis=-1)
+        x = tanh(np.gradient(x_sma, axis=-1) * self.p.state_ext_scale)
+
+        return dict(external=x[:, None, :])
+
     def get_market_state(self):
+        x_market = self.get_feature_window('external')
+        if x_market is not None:
+            return x_market
 
         x_sma = np.stack(
             [
@@ -1,7 +1,7 @@
 
 import numpy as np
 
-from btgym.algorithms.rollout import Rollout
+from btgym.algorithms.rollout import ArrayRollout
 from btgym.algorithms.memory import _DummyMemory
 from btgym.algorithms.math_utils import softmax
 
@@ -84,7 +84,7 @@ def VerboseEnvRunnerFn(
 
     while True:
         terminal_end = False
-        rollout = Rollout()
+        rollout = ArrayRollout(rollout_length)
 
         action, logits, value_, context = policy.act(last_state, last_context, last_action_reward)
 
@@ -104,6 +104,7 @@ def VerboseEnvRunnerFn(
             'action': action,
             'reward': reward,
             'value': value_,
+            'logits': logits,
             'terminal': terminal,
             'context': last_context,
             'last_action_reward': last_action_reward,
@@ -143,6 +144,7 @@ def VerboseEnvRunnerFn(
                     'action': action,
                     'reward': reward,
                     'value': value_,
+                    'logits': logits,
                     'terminal': terminal,
                     'context': last_context,
                     'last_action_reward': last_action_reward,
@@ -18,23 +18,192 @@
 ###############################################################################
 
 import multiprocessing
-import gc
+import threading
+import queue
 
 import itertools
 import zmq
 import copy
+import pickle
 
 import time
 import random
 from datetime import timedelta
 
+import numpy as np
 import backtrader as bt
 from .datafeed import DataSampleConfig, EnvResetConfig
+from .datafeed.shared import BTgymSharedData
+from .fastengine import BTgymFastEngine, BTgymFastEngineFactory
 from .strategy.observers import NormPnL, Position, Reward
 
 ###################### BT Server in-episode communocation method ##############
 
 
+class BTgymInProcessChannel:
+    """
+    One end of in-process message channel, mimics subset of ZMQ REQ/REP socket API used by BTgym
+    environment and server. Objects are passed by reference, no serialization performed.
+    Also serves as its own `context`, see `destroy()`.
+    """
+
+    def __init__(self, inbox, outbox):
+        """
+        Args:
+            inbox:      queue.Queue instance to receive messages from;
+            outbox:     queue.Queue instance to send messages to.
+        """
+        self.inbox = inbox
+        self.outbox = outbox
+        self.rcvtimeo = -1
+        self.closed = False
+
+    @classmethod
+    def pair(cls):
+        """
+        Returns:
+            two connected channel ends.
+        """
+        queue_a = queue.Queue()
+        queue_b = queue.Queue()
+        return cls(queue_a, queue_b), cls(queue_b, queue_a)
+
+    def setsockopt(self, option, value):
+        if option == zmq.RCVTIMEO:
+            self.rcvtimeo = value
+
+    def bind(self, address):
+        pass
+
+    def connect(self, address):
+        pass
+
+    def send_pyobj(self, obj, *args, **kwargs):
+        self.outbox.put(obj)
+
+    def recv_pyobj(self, *args, **kwargs):
+        timeout = None if self.rcvtimeo < 0 else self.rcvtimeo / 1000
+        try:
+            return self.inbox.get(timeout=timeout)
+
+        except queue.Empty:
+            raise zmq.Again()
+
+    def close(self, *args, **kwargs):
+        self.closed = True
+
+    def destroy(self, *args, **kwargs):
+        self.close()
+
+
+class _ArrayRef:
+    """
+    Placeholder for numpy array sent as separate raw buffer frame, see `send_message()`.
+    """
+    __slots__ = ('index', 'dtype', 'shape')
+
+    def __init__(self, index, dtype, shape):
+        self.index = index
+        self.dtype = dtype
+        self.shape = shape
+
+    def __getstate__(self):
+        return self.index, self.dtype, self.shape
+
+    def __setstate__(self, state):
+        self.index, self.dtype, self.shape = state
+
+
+def _strip_arrays(obj, buffers):
+    """
+    Replaces numpy arrays found in nested dicts, lists and tuples with references
+    to `buffers` list items, everything else is left intact.
+    """
+    obj_type = type(obj)
+    if obj_type is np.ndarray and not obj.dtype.hasobject:
+        buffers.append(np.ascontiguousarray(obj))
+        return _ArrayRef(len(buffers) - 1, obj.dtype.str, obj.shape)
+
+    elif obj_type is dict:
+        return {key: _strip_arrays(value, buffers) for key, value in obj.items()}
+
+    elif obj_type is list or obj_type is tuple:
+        return obj_type(_strip_arrays(value, buffers) for value in obj)
+
+    else:
+        return obj
+
+
+def _restore_arrays(obj, frames):
+    """
+    Inverse of `_strip_arrays()`: replaces references with read-only arrays backed by received frames.
+    """
+    obj_type = type(obj)
+    if obj_type is _ArrayRef:
+        array = np.frombuffer(frames[obj.index].buffer, dtype=obj.dtype).reshape(obj.shape)
+        array.flags.writeable = False
+        return array
+
+    elif obj_type is dict:
+        return {key: _restore_arrays(value, frames) for key, value in obj.items()}
+
+    elif obj_type is list or obj_type is tuple:
+        return obj_type(_restore_arrays(value, frames) for value in obj)
+
+    else:
+        return obj
+
+
+def send_message(socket, message):
+    """
+    Sends message as multipart: pickled header frame holding message structure and any non-array content
+    followed by one raw buffer frame per numpy array found in nested dicts, lists and tuples of message.
+    Arrays are sent without copying.
+    Messages without arrays are sent as single frame compatible with `socket.recv_pyobj()`.
+
+    Args:
+        socket:     ZMQ socket or BTgymInProcessChannel instance;
+        message:    any picklable object.
+
+    Note:
+        Sent arrays should not be modified in-place afterwards as ZMQ reads their buffers asynchronously.
+        In-process channel passes messages by reference.
+    """
+    if isinstance(socket, BTgymInProcessChannel):
+        socket.send_pyobj(message)
+        return
+
+    buffers = []
+    header = _strip_arrays(message, buffers)
+    if buffers:
+        socket.send_multipart([pickle.dumps(header, pickle.HIGHEST_PROTOCOL)] + buffers, copy=False)
+
+    else:
+        socket.send(pickle.dumps(header, pickle.HIGHEST_PROTOCOL))
+
+
+def recv_message(socket):
+    """
+    Receives message sent by either `send_message()` or `send_pyobj()`.
+    Arrays are returned as read-only views of received frames.
+
+    Args:
+        socket:     ZMQ socket or BTgymInProcessChannel instance.
+
+    Returns:
+        message
+    """
+    if isinstance(socket, BTgymInProcessChannel):
+        return socket.recv_pyobj()
+
+    frames = socket.recv_multipart(copy=False)
+    message = pickle.loads(frames[0].buffer)
+    if len(frames) > 1:
+        message = _restore_arrays(message, frames[1:])
+
+    return message
+
+
 class _BTgymAnalyzer(bt.Analyzer):
     """
     This [kind of] misused analyzer handles strategy/environment communication logic
@@ -51,7 +220,11 @@ class _BTgymAnalyzer(bt.Analyzer):
         self.socket = self.strategy.env._socket
         self.render = self.strategy.env._render
         self.message = None
-        self.step_to_render = None # Due to reset(), this will get populated before first render() call.
+        self.render_backup = None  # Due to reset(), this will get populated before first render() call.
+
+        # What info to send, see BTgymBaseStrategy `info_policy` param:
+        self.info_policy = getattr(self.strategy.p, 'info_policy', 'last')
+        self.collect_info = self.info_policy == 'all' or callable(self.info_policy)
 
         # At the end of the episode - render everything but episode:
         self.render_at_stop = self.render.render_modes.copy()
@@ -63,6 +236,34 @@ class _BTgymAnalyzer(bt.Analyzer):
 
         self.info_list = []
 
+    @property
+    def step_to_render(self):
+        """
+        Last communication step data as expected by renderer, composed on demand.
+        """
+        if self.render_backup is None:
+            return None
+
+        raw_state, state, reward, is_done, info = self.render_backup
+        return {'human': raw_state}, state, reward, is_done, info
+
+    def get_step_info(self):
+        """
+        Returns info part of environment response according to info policy.
+        """
+        if self.info_policy == 'last':
+            return [self.strategy.get_info()]
+
+        elif self.info_policy == 'all':
+            return self.info_list
+
+        elif self.info_policy == 'none':
+            # Keep `info[-1]` valid for consumers:
+            return [{}]
+
+        else:
+            return [self.info_policy(self.info_list)]
+
     def prenext(self):
         pass
 
@@ -88,26 +289,34 @@ class _BTgymAnalyzer(bt.Analyzer):
         # We'll do it every step:
         # If it's time to leave:
         is_done = self.strategy._get_done()
-        # Collect step info:
-        self.info_list.append(self.strategy.get_info())
+        is_comm_step = self.strategy.iteration % self.strategy.p.skip_frame == 0 or is_done
+
+        # Collect step info, if every bar is to be sent:
+        if self.collect_info:
+            self.info_list.append(self.strategy.get_info())
+
+        # Compose info part of response before action gets changed:
+        if is_comm_step:
+            info = self.get_step_info()
+
         # Put agent on hold:
         self.strategy.action = 'hold'
 
         # Only if it's time to communicate or episode has come to end:
-        if self.strategy.iteration % self.strategy.p.skip_frame == 0 or is_done:
+        if is_comm_step:
 
             #print('Analyzer_strat_iteration:', self.strategy.iteration)
             #print('Analyzer_env_iteration:', self.strategy.env_iteration)
 
             # Gather response:
             raw_state = self.strategy._get_raw_state()
-            state = self.strategy.get_state()
+            state = self.strategy._cast_state(self.strategy.get_state())
             # DUMMY:
 
             reward = self.strategy.get_reward()
 
             # Halt and wait to receive message from outer world:
-            self.message = self.socket.recv_pyobj()
+            self.message = recv_message(self.socket)
             msg = 'COMM recieved: {}'.format(self.message)
             self.log.debug(msg)
 
@@ -129,7 +338,7 @@ class _BTgymAnalyzer(bt.Analyzer):
                     return None
 
                 # Halt again:
-                self.message = self.socket.recv_pyobj()
+                self.message = recv_message(self.socket)
                 msg = 'COMM recieved: {}'.format(self.message)
                 self.log.debug(msg)
 
@@ -143,14 +352,12 @@ class _BTgymAnalyzer(bt.Analyzer):
                 raise AssertionError(msg)
 
             # Send response as <o, r, d, i> tuple (Gym convention),
-            # opt to send entire info_list or just latest part:
-            info = [self.info_list[-1]]
-            self.socket.send_pyobj((state, reward, is_done, info))
+            # info content is set by policy:
+            send_message(self.socket, (state, reward, is_done, info))
 
             # Back up step information for rendering.
             # It pays when using skip-frames: will'll get future state otherwise.
-
-            self.step_to_render = ({'human':raw_state}, state, reward, is_done, self.info_list)
+            self.render_backup = (raw_state, state, reward, is_done, info)
 
             # Reset info:
             self.info_list = []
@@ -164,6 +371,90 @@ class _BTgymAnalyzer(bt.Analyzer):
         self.strategy.iteration += 1
         self.strategy.broker_message = '-'
 
+
+class _BTgymFastAnalyzer:
+    """
+    Strategy/environment communication logic for BTgymFastEngine episodes,
+    same as for _BTgymAnalyzer.
+    """
+    log = None
+    socket = None
+
+    def __init__(self):
+        _BTgymAnalyzer.__init__(self)
+
+    step_to_render = _BTgymAnalyzer.step_to_render
+    get_step_info = _BTgymAnalyzer.get_step_info
+    prenext = _BTgymAnalyzer.prenext
+    stop = _BTgymAnalyzer.stop
+    early_stop = _BTgymAnalyzer.early_stop
+    next = _BTgymAnalyzer.next
+
+    def nextstart(self):
+        self.next()
+
+    def get_analysis(self):
+        return dict()
+
+
+class BTgymCerebroFactory:
+    """
+    Builds fresh lightweight Cerebro instance for every episode from configuration
+    captured once from template engine: strategies with params, broker, sizers, observers, analyzers etc.
+    Only unstarted broker gets copied per episode, everything else are class specifications
+    shared by reference, so episode setup is way cheaper than deep copy of entire engine.
+    Template engine itself is never modified.
+    """
+    # Cerebro attributes holding run-time specifications:
+    list_attrs = (
+        'stores', 'optcbs', 'observers', 'analyzers', 'indicators', 'writers', 'storecbs', 'datacbs', 'signals',
+        '_pretimers'
+    )
+    value_attrs = ('_signal_strat', '_signal_concurrent', '_signal_accumulate', '_tradingcal')
+
+    def __init__(self, cerebro, observers=(), analyzers=()):
+        """
+        Args:
+            cerebro:    template backtrader.Cerebro instance with no data added;
+            observers:  iterable of observer classes to add if not already present;
+            analyzers:  iterable of (analyzer class, kwargs) tuples to add.
+        """
+        self.template = cerebro
+        self.cerebro_class = type(cerebro)
+        self.params = cerebro.p._getkwargs()
+        self.config = {attr: list(getattr(cerebro, attr)) for attr in self.list_attrs}
+        self.config.update({attr: getattr(cerebro, attr) for attr in self.value_attrs})
+        self.strats = [[(cls, args, kwargs) for cls, args, kwargs in strat] for strat in cerebro.strats]
+        self.sizers = dict(cerebro.sizers)
+
+        for aux in observers:
+            if not any(aux in observer for observer in self.config['observers']):
+                self.config['observers'].append((False, aux, (), {}))
+
+        for aux, kwargs in analyzers:
+            self.config['analyzers'].append((aux, (), kwargs))
+
+    def make(self):
+        """
+        Returns:
+            new Cerebro instance, ready to add data and run.
+        """
+        cerebro = self.cerebro_class(**self.params)
+        for attr in self.list_attrs:
+            setattr(cerebro, attr, list(self.config[attr]))
+
+        for attr in self.value_attrs:
+            setattr(cerebro, attr, self.config[attr])
+
+        # Strategy kwargs get episode-specific entries, so give each episode own dicts:
+        cerebro.strats = [[(cls, args, dict(kwargs)) for cls, args, kwargs in strat] for strat in self.strats]
+        cerebro.sizers = dict(self.sizers)
+
+        # Broker keeps back-reference to engine; map it to new instance instead of copying template:
+        cerebro._broker = copy.deepcopy(self.template._broker, {id(self.template): cerebro})
+
+        return cerebro
+
     ##############################  BTgym Server Main  ##############################
 
 
@@ -211,16 +502,23 @@ class BTgymServer(multiprocessing.Process):
         connect_timeout=90,
         log_level=None,
         task=0,
+        channel=None,
+        pipeline_episodes=False,
     ):
         """
 
         Args:
-            cerebro:                backtrader.cerebro engine class.
+            cerebro:                backtrader.cerebro engine class or BTgymFastEngine instance.
             render:                 render class
             network_address:        environmnet communication, str
             data_network_address:   data communication, str
             connect_timeout:        seconds, int
             log_level:              int, logbook.level
+            channel:                BTgymInProcessChannel instance, if given - environment communication
+                                    goes through it instead of ZMQ socket, see `BTgymInProcessServer`.
+            pipeline_episodes:      bool, if True - prepares next episode from current trial in background thread
+                                    while current episode runs, using most recent sampling config; prepared
+                                    episode is used only if next `_reset` asks to reuse trial.
         """
 
         super(BTgymServer, self).__init__()
@@ -234,6 +532,12 @@ class BTgymServer(multiprocessing.Process):
         self.data_network_address = data_network_address
         self.connect_timeout = connect_timeout # server connection timeout in seconds.
         self.connect_timeout_step = 0.01
+        self.channel = channel
+        self.shared_data = None  # Data server shared memory segment, attached on first use.
+        self.pipeline_episodes = pipeline_episodes
+        self.next_episode = None  # Episode being prepared in background.
+        self.pipeline_hits = 0
+        self.pipeline_misses = 0
 
     @staticmethod
     def _comm_with_timeout(socket, message):
@@ -253,7 +557,7 @@ class BTgymServer(multiprocessing.Process):
             message=None,
         )
         try:
-            socket.send_pyobj(message)
+            send_message(socket, message)
 
         except zmq.ZMQError as e:
             if e.errno == zmq.EAGAIN:
@@ -265,7 +569,7 @@ class BTgymServer(multiprocessing.Process):
 
         start = time.time()
         try:
-            response['message'] = socket.recv_pyobj()
+            response['message'] = recv_message(socket)
             response['time'] =  time.time() - start
 
         except zmq.ZMQError as e:
@@ -326,13 +630,122 @@ class BTgymServer(multiprocessing.Process):
             except (AssertionError, KeyError) as e:
                 break
         # Get trial instance:
-        trial_sample = data_server_response['message']['sample']
+        try:
+            trial_sample = data_server_response['message']['sample']
+
+        except KeyError:
+            msg = 'Data_server failed to provide Trial sample, got: <{}>.'.format(data_server_response['message'])
+            self.log.error(msg)
+            raise RuntimeError(msg)
+
+        if 'sample_descriptor' in data_server_response['message']:
+            # Shared memory mode: map trial data without copying:
+            descriptor = data_server_response['message']['sample_descriptor']
+            if self.shared_data is None or self.shared_data.descriptor['name'] != descriptor['name']:
+                if self.shared_data is not None:
+                    self.shared_data.close()
+                self.shared_data = BTgymSharedData(descriptor=descriptor)
+                self.log.debug('Attached to shared data segment <{}>.'.format(descriptor['name']))
+
+            trial_sample.data = self.shared_data.get_slice(descriptor['start_row'], descriptor['end_row'])
+
         trial_stat = trial_sample.describe()
         trial_sample.reset()
         dataset_stat = data_server_response['message']['stat']
 
         return trial_sample, trial_stat, dataset_stat
 
+    def _prepare_episode(self, sample_config, trial=None):
+        """
+        Gets episode data according to sampling config.
+
+        Args:
+            sample_config:  dict of `trial_config` and `episode_config` dicts;
+            trial:          tuple (trial_sample, trial_stat, dataset_stat) of current trial or None.
+
+        Returns:
+            dict of `trial` tuple, `episode_sample`, `episode_stat`, `btfeed` and preparation time `prep_time`.
+        """
+        start_time = time.time()
+        # Get new Trial from data_server if requested,
+        # despite bult-in new/reuse data object sampling option, perform checks here to avoid
+        # redundant traffic:
+        if sample_config['trial_config']['get_new'] or trial is None:
+            self.log.debug(
+                'Requesting new Trial sample with args: {}'.format(sample_config['trial_config'])
+            )
+            trial = self.get_data(**sample_config['trial_config'])
+            trial[0].set_logger(self.log_level, self.task)
+            self.log.debug('Got new Trial: <{}>'.format(trial[0].filename))
+
+        else:
+            self.log.debug('Reusing Trial <{}>'.format(trial[0].filename))
+
+        # Get episode:
+        self.log.debug('Requesting episode from <{}>'.format(trial[0].filename))
+        episode_sample = trial[0].sample(**sample_config['episode_config'])
+
+        return dict(
+            trial=trial,
+            episode_sample=episode_sample,
+            episode_stat=episode_sample.describe(),
+            btfeed=episode_sample.to_btfeed(),
+            prep_time=time.time() - start_time,
+        )
+
+    def _start_next_episode(self, sample_config, trial):
+        """
+        Starts preparing next episode data from current trial in background thread.
+        New trial is never requested ahead: it can't be known in advance whether next episode will
+        ask for one and for stateful data domains such request would skip a trial.
+
+        Args:
+            sample_config:  dict, sampling config to use, usually the one current episode was prepared with;
+            trial:          current trial tuple.
+        """
+        next_episode = dict(config=copy.deepcopy(sample_config), result=None)
+        next_episode['config']['trial_config']['get_new'] = False
+
+        def prepare():
+            try:
+                next_episode['result'] = self._prepare_episode(next_episode['config'], trial)
+
+            except Exception as e:
+                self.log.warning('Background episode preparation failed: {}'.format(e))
+
+        next_episode['thread'] = threading.Thread(target=prepare, daemon=True)
+        next_episode['thread'].start()
+        self.next_episode = next_episode
+
+    def _get_next_episode(self, sample_config):
+        """
+        Waits for episode being prepared in background and returns it if it has been prepared with same config.
+
+        Args:
+            sample_config:  dict, requested sampling config.
+
+        Returns:
+            (prepared episode dict or None, hidden latency in seconds)
+        """
+        if self.next_episode is None:
+            return None, 0
+
+        start_time = time.time()
+        self.next_episode['thread'].join()
+        wait_time = time.time() - start_time
+
+        next_episode = self.next_episode
+        self.next_episode = None
+
+        if next_episode['result'] is not None and next_episode['config'] == sample_config:
+            self.pipeline_hits += 1
+            return next_episode['result'], max(next_episode['result']['prep_time'] - wait_time, 0)
+
+        else:
+            self.log.debug('Prepared episode discarded, config mismatch or preparation failed.')
+            self.pipeline_misses += 1
+            return None, 0
+
     def run(self):
         """
         Server process runtime body. This method is invoked by env._start_server().
@@ -340,7 +753,9 @@ class BTgymServer(multiprocessing.Process):
         # Logging:
         from logbook import Logger, StreamHandler, WARNING
         import sys
-        StreamHandler(sys.stdout).push_application()
+        if self.channel is None:
+            # In-process server shares application handler with environment:
+            StreamHandler(sys.stdout).push_application()
         if self.log_level is None:
             self.log_level = WARNING
         self.log = Logger('BTgymServer_{}'.format(self.task), level=self.log_level)
@@ -364,11 +779,15 @@ class BTgymServer(multiprocessing.Process):
         # Set up a comm. channel for server as ZMQ socket
         # to carry both service and data signal
         # !! Reminder: Since we use REQ/REP - messages do go in pairs !!
-        self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.REP)
-        self.socket.setsockopt(zmq.RCVTIMEO, -1)
-        self.socket.setsockopt(zmq.SNDTIMEO, connect_timeout * 1000)
-        self.socket.bind(self.network_address)
+        if self.channel is not None:
+            self.context = self.socket = self.channel
+
+        else:
+            self.context = zmq.Context()
+            self.socket = self.context.socket(zmq.REP)
+            self.socket.setsockopt(zmq.RCVTIMEO, -1)
+            self.socket.setsockopt(zmq.SNDTIMEO, connect_timeout * 1000)
+            self.socket.bind(self.network_address)
 
         self.data_context = zmq.Context()
         self.data_socket = self.data_context.socket(zmq.REQ)
@@ -404,11 +823,25 @@ class BTgymServer(multiprocessing.Process):
         else:
             aux_obsrevers = [bt.observers.DrawDown]
 
+        # Episode engines factory, also adds communication utility:
+        if isinstance(self.cerebro, BTgymFastEngine):
+            cerebro_factory = BTgymFastEngineFactory(
+                self.cerebro,
+                analyzers=[(_BTgymFastAnalyzer, dict(_name='_env_analyzer'))],
+            )
+
+        else:
+            cerebro_factory = BTgymCerebroFactory(
+                self.cerebro,
+                observers=aux_obsrevers,
+                analyzers=[(_BTgymAnalyzer, dict(_name='_env_analyzer'))],
+            )
+
         # Server 'Control Mode' loop:
         for episode_number in itertools.count(0):
             while True:
                 # Stuck here until '_reset' or '_stop':
-                service_input = self.socket.recv_pyobj()
+                service_input = recv_message(self.socket)
                 msg = 'Control mode: received <{}>'.format(service_input)
                 self.log.debug(msg)
 
@@ -419,9 +852,13 @@ class BTgymServer(multiprocessing.Process):
                         # send last run statistic, release comm channel and exit:
                         message = 'Exiting.'
                         self.log.info(message)
+                        if self.next_episode is not None:
+                            self.next_episode['thread'].join()
                         self.socket.send_pyobj(message)
                         self.socket.close()
                         self.context.destroy()
+                        if self.shared_data is not None:
+                            self.shared_data.close()
                         return None
 
                     # Start episode:
@@ -456,22 +893,11 @@ class BTgymServer(multiprocessing.Process):
 
             # Got '_reset' signal -> prepare Cerebro subclass and run episode:
             start_time = time.time()
-            cerebro = copy.deepcopy(self.cerebro)
+            cerebro = cerebro_factory.make()
             cerebro._socket = self.socket
             cerebro._log = self.log
             cerebro._render = self.render
-
-            # Add auxillary observers, if not already:
-            for aux in aux_obsrevers:
-                is_added = False
-                for observer in cerebro.observers:
-                    if aux in observer:
-                        is_added = True
-                if not is_added:
-                    cerebro.addobserver(aux)
-
-            # Add communication utility:
-            cerebro.addanalyzer(_BTgymAnalyzer, _name='_env_analyzer',)
+            setup_time = timedelta(seconds=time.time() - start_time)
 
             # Data preparation:
             # Parse args we got with _reset call:
@@ -488,36 +914,33 @@ class BTgymServer(multiprocessing.Process):
                         '_reset <{}> kwarg not found, using default values: {}'.format(key, config)
                     )
 
-            # Get new Trial from data_server if requested,
-            # despite bult-in new/reuse data object sampling option, perform checks here to avoid
-            # redundant traffic:
-            if sample_config['trial_config']['get_new'] or trial_sample is None:
-                self.log.debug(
-                    'Requesting new Trial sample with args: {}'.format(sample_config['trial_config'])
+            # Take episode prepared in background if it matches requested config, prepare now otherwise:
+            episode_data, hidden_latency = self._get_next_episode(sample_config)
+            if episode_data is None:
+                episode_data = self._prepare_episode(
+                    sample_config,
+                    trial=None if trial_sample is None else (trial_sample, trial_stat, dataset_stat)
                 )
-                trial_sample, trial_stat, dataset_stat = self.get_data(**sample_config['trial_config'])
-                trial_sample.set_logger(self.log_level, self.task)
-                self.log.debug('Got new Trial: <{}>'.format(trial_sample.filename))
 
-            else:
-                self.log.debug('Reusing Trial <{}>'.format(trial_sample.filename))
-
-            # Get episode:
-            self.log.debug('Requesting episode from <{}>'.format(trial_sample.filename))
-            episode_sample = trial_sample.sample(**sample_config['episode_config'])
+            trial_sample, trial_stat, dataset_stat = episode_data['trial']
+            episode_sample = episode_data['episode_sample']
 
             # Get episode data statistic and pass it to strategy params:
             cerebro.strats[0][0][2]['trial_stat'] = trial_stat
             cerebro.strats[0][0][2]['trial_metadata'] = trial_sample.metadata
             cerebro.strats[0][0][2]['dataset_stat'] = dataset_stat
-            cerebro.strats[0][0][2]['episode_stat'] = episode_sample.describe()
+            cerebro.strats[0][0][2]['episode_stat'] = episode_data['episode_stat']
             cerebro.strats[0][0][2]['metadata'] = episode_sample.metadata
 
             # Set nice broker cash plotting:
             cerebro.broker.set_shortcash(False)
 
-            # Convert and add data to engine:
-            cerebro.adddata(episode_sample.to_btfeed())
+            # Add data to engine:
+            cerebro.adddata(episode_data['btfeed'])
+
+            # Overlap next episode preparation with this one:
+            if self.pipeline_episodes:
+                self._start_next_episode(sample_config, episode_data['trial'])
 
             # Finally:
             episode = cerebro.run(stdstats=True, preload=False, oldbuysell=True)[0]
@@ -536,11 +959,288 @@ class BTgymServer(multiprocessing.Process):
             episode_result['episode'] = episode_number
             episode_result['runtime'] = elapsed_time
             episode_result['length'] = len(episode.data.close)
+            episode_result['setup_time'] = setup_time
+            episode_result['data_hidden_latency'] = timedelta(seconds=hidden_latency)
+            episode_result['data_pipeline_hit_rate'] = \
+                self.pipeline_hits / max(self.pipeline_hits + self.pipeline_misses, 1)
 
             for name in analyzers_list:
                 episode_result[name] = episode.analyzers.getbyname(name).get_analysis()
 
-            gc.collect()
-
         # Just in case -- we actually shouldn't get there except by some error:
         return None
+
+
+class BTgymInProcessServer(threading.Thread):
+    """
+    Runs BTgymServer episode loop in caller's process as a thread driven by environment `step()` / `reset()`,
+    communicating via `BTgymInProcessChannel`. Strategy and analyzer code paths are the same as for
+    server process, but every step is just a pair of in-memory queue hand-offs instead of
+    pickled round trip over the network.
+
+    Exposes subset of multiprocessing.Process API used by environment.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Args:
+            kwargs:     BTgymServer kwargs, except `channel`.
+        """
+        super(BTgymInProcessServer, self).__init__(daemon=True)
+        self.channel, server_channel = BTgymInProcessChannel.pair()
+        self.server = BTgymServer(channel=server_channel, **kwargs)
+        self.exitcode = None
+
+    def run(self):
+        self.server.run()
+        self.exitcode = 0
+
+    def terminate(self):
+        """
+        Threads can't be killed; asks server to finish running episode, if any, and shut down,
+        so thread exits and can be joined. Server replies are discarded along with the channel.
+        """
+        if self.is_alive():
+            self.channel.send_pyobj({'ctrl': '_done'})
+            self.channel.send_pyobj({'ctrl': '_stop'})
+
+        self.channel.close()
+
+
+class BTgymVecServer(multiprocessing.Process):
+    """
+    Vectorized backtrader server class: runs `num_envs` independent episodes within single process,
+    each one by `BTgymInProcessServer` thread with its own Trial and episode sampling.
+
+    Control mode IN::
+
+        dict(ctrl=<control action, type=str>,), where control action is:
+        '_reset' - ends running sub-episodes and starts new ones for all sub-environments,
+                   expects `kwargs` key as for BTgymServer and `action` key holding initial agent action;
+        '_done' - ends running sub-episodes;
+        '_getstat' - retrieve list of sub-episodes results and statistics;
+        '_stop' - server shut-down.
+
+    Episode mode IN::
+
+        dict(action=<list of num_envs agent actions, type=str>,)
+
+    Episode mode OUT::
+
+        response  <tuple>: observation - stacked sub-environments observations, first dimension is `num_envs`;
+                           reward, <array> - sub-environments rewards;
+                           done, <array of bool> - sub-environments termination flags;
+                           info, <list> - list of sub-environments auxiliary information.
+    Note:
+        Finished sub-environments are reset automatically with last received `_reset` kwargs:
+        returned observation for such sub-environment is the first one of new episode,
+        while last observation of finished episode is added to `info` as `terminal_observation` entry.
+    """
+
+    def __init__(
+        self,
+        num_envs=4,
+        cerebro=None,
+        render=None,
+        network_address=None,
+        data_network_address=None,
+        connect_timeout=90,
+        log_level=None,
+        task=0,
+        pipeline_episodes=False,
+    ):
+        """
+
+        Args:
+            num_envs:               int, number of sub-environments to run.
+            cerebro:                backtrader.cerebro engine class.
+            render:                 render class, rendering is not supported for sub-environments.
+            network_address:        environmnet communication, str
+            data_network_address:   data communication, str
+            connect_timeout:        seconds, int
+            log_level:              int, logbook.level
+            pipeline_episodes:      bool, passed to sub-environments servers, see `BTgymServer`.
+        """
+        super(BTgymVecServer, self).__init__()
+        self.num_envs = num_envs
+        self.task = task
+        self.log_level = log_level
+        self.log = None
+        self.process = None
+        self.cerebro = cerebro
+        self.network_address = network_address
+        self.render = render
+        self.data_network_address = data_network_address
+        self.connect_timeout = connect_timeout
+        self.pipeline_episodes = pipeline_episodes
+        self.sub_servers = []
+        self.reset_message = None
+
+    @staticmethod
+    def _stack(structs):
+        """
+        Stacks list of [nested dicts of] arrays along new first axis.
+        """
+        if isinstance(structs[0], dict):
+            return {key: BTgymVecServer._stack([struct[key] for struct in structs]) for key in structs[0].keys()}
+
+        else:
+            return np.stack(structs, axis=0)
+
+    @staticmethod
+    def _comm(channel, message):
+        channel.send_pyobj(message)
+        return channel.recv_pyobj()
+
+    def _force_control_mode(self, channel):
+        """
+        Puts sub-server to control mode.
+        """
+        response = {}
+        while 'ctrl' not in response:
+            response = self._comm(channel, {'ctrl': '_done'})
+
+    def _reset_sub_env(self, channel):
+        """
+        Starts new sub-episode.
+
+        Returns:
+            initial sub-environment response as <o, r, d, i> tuple.
+        """
+        self._comm(channel, {'ctrl': '_reset', 'kwargs': self.reset_message['kwargs']})
+        return self._comm(channel, {'action': self.reset_message['action']})
+
+    def _step(self, actions):
+        """
+        Makes step in every sub-environment, resets finished ones.
+
+        Returns:
+            stacked <o, r, d, i> tuple.
+        """
+        for sub_server, action in zip(self.sub_servers, actions):
+            sub_server.channel.send_pyobj({'action': action})
+
+        responses = [sub_server.channel.recv_pyobj() for sub_server in self.sub_servers]
+
+        for i, (state, reward, is_done, info) in enumerate(responses):
+            if is_done:
+                info[-1]['terminal_observation'] = state
+                new_state = self._reset_sub_env(self.sub_servers[i].channel)[0]
+                responses[i] = (new_state, reward, is_done, info)
+
+        states, rewards, dones, infos = zip(*responses)
+
+        return self._stack(list(states)), np.asarray(rewards), np.asarray(dones), list(infos)
+
+    def run(self):
+        """
+        Server process runtime body.
+        """
+        # Logging:
+        from logbook import Logger, StreamHandler, WARNING
+        import sys
+        StreamHandler(sys.stdout).push_application()
+        if self.log_level is None:
+            self.log_level = WARNING
+        self.log = Logger('BTgymVecServer_{}'.format(self.task), level=self.log_level)
+
+        self.process = multiprocessing.current_process()
+        self.log.info('PID: {}'.format(self.process.pid))
+
+        context = zmq.Context()
+        socket = context.socket(zmq.REP)
+        socket.setsockopt(zmq.RCVTIMEO, -1)
+        socket.setsockopt(zmq.SNDTIMEO, self.connect_timeout * 1000)
+        socket.bind(self.network_address)
+
+        # Start sub-environments servers:
+        for i in range(self.num_envs):
+            sub_server = BTgymInProcessServer(
+                cerebro=self.cerebro,
+                render=self.render,
+                data_network_address=self.data_network_address,
+                connect_timeout=self.connect_timeout,
+                log_level=self.log_level,
+                task=self.task,
+                pipeline_episodes=self.pipeline_episodes,
+            )
+            sub_server.start()
+            self.sub_servers.append(sub_server)
+
+        self.log.info('Started {} sub-environments.'.format(self.num_envs))
+
+        is_running = False
+        while True:
+            service_input = recv_message(socket)
+            self.log.debug('Received <{}>'.format(service_input))
+
+            if 'action' in service_input and is_running:
+                actions = service_input['action']
+                if len(actions) != self.num_envs:
+                    msg = 'Expected {} actions, got: {}'.format(self.num_envs, actions)
+                    self.log.error(msg)
+                    socket.send_pyobj({'ctrl': msg})
+                    continue
+
+                send_message(socket, self._step(actions))
+
+            elif 'ctrl' in service_input:
+                if service_input['ctrl'] == '_stop':
+                    for sub_server in self.sub_servers:
+                        if is_running:
+                            self._force_control_mode(sub_server.channel)
+                        self._comm(sub_server.channel, {'ctrl': '_stop'})
+                        sub_server.join()
+
+                    message = 'Exiting.'
+                    self.log.info(message)
+                    socket.send_pyobj(message)
+                    socket.close()
+                    context.destroy()
+                    return None
+
+                elif service_input['ctrl'] == '_reset':
+                    self.reset_message = dict(
+                        kwargs=service_input.get('kwargs', {}),
+                        action=service_input.get('action', 'hold'),
+                    )
+                    responses = []
+                    for sub_server in self.sub_servers:
+                        if is_running:
+                            self._force_control_mode(sub_server.channel)
+                        responses.append(self._reset_sub_env(sub_server.channel))
+
+                    is_running = True
+                    states, rewards, dones, infos = zip(*responses)
+                    send_message(
+                        socket,
+                        (self._stack(list(states)), np.asarray(rewards), np.asarray(dones), list(infos))
+                    )
+
+                elif service_input['ctrl'] == '_done':
+                    if is_running:
+                        for sub_server in self.sub_servers:
+                            self._force_control_mode(sub_server.channel)
+                        is_running = False
+
+                    socket.send_pyobj({'ctrl': 'Sub-episodes finished.'})
+
+                elif service_input['ctrl'] == '_getstat':
+                    if is_running:
+                        for sub_server in self.sub_servers:
+                            self._force_control_mode(sub_server.channel)
+                        is_running = False
+
+                    socket.send_pyobj(
+                        [self._comm(sub_server.channel, {'ctrl': '_getstat'}) for sub_server in self.sub_servers]
+                    )
+
+                else:
+                    message = {'ctrl': 'send control keys: <_reset>, <_done>, <_getstat>, <_stop>.'}
+                    self.log.debug('Control mode: sent: ' + str(message))
+                    socket.send_pyobj(message)
+
+            else:
+                message = {'ctrl': 'No <ctrl> key received:{}\nHint: forgot to call reset()?'.format(service_input)}
+                self.log.debug(message)
+                socket.send_pyobj(message)
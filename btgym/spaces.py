@@ -22,6 +22,8 @@ from gym import spaces
 
 from collections import OrderedDict
 
+import numpy as np
+
 #DictSpace = spaces.Dict
 
 
@@ -31,18 +33,39 @@ class DictSpace(spaces.Dict):
     Defines space as nested dictionary of simpler gym spaces.
     """
 
-    def __init__(self, spaces):
+    def __init__(self, spaces, dtype=None):
         """
 
         Args:
             spaces_dict:    [nested] dictionary of core Gym spaces.
+            dtype:          if given, every [nested] floating point space is checked to be of this dtype.
         """
         super(DictSpace, self).__init__(spaces)
         self.shape = self._get_shape()
+        self.dtype = dtype
+        if dtype is not None:
+            self._assert_dtype(self.spaces, np.dtype(dtype))
 
     def _get_shape(self):
         return OrderedDict([(k, space.shape) for k, space in self.spaces.items()])
 
+    @staticmethod
+    def _assert_dtype(spaces_dict, dtype, _path=''):
+        for key, space in spaces_dict.items():
+            if isinstance(space, spaces.Dict):
+                DictSpace._assert_dtype(space.spaces, dtype, _path + key + '/')
+
+            elif getattr(space, 'dtype', None) is not None and np.issubdtype(space.dtype, np.floating):
+                try:
+                    assert space.dtype == dtype
+
+                except AssertionError:
+                    raise AssertionError(
+                        'Space <{}{}> dtype {} does not match observation dtype {}.'.format(
+                            _path, key, space.dtype, dtype
+                        )
+                    )
+
 
 class _DictSpace(Space):
     """
@@ -178,3 +201,37 @@ class _DictSpace(Space):
 
 
 
+
+
+def batch_space(space, n):
+    """
+    Makes space of `n` stacked samples of given space, as observed by vectorized environment.
+
+    Args:
+        space:  [nested dictionary of] Box, Discrete or Tuple gym spaces
+        n:      int, batch size
+
+    Returns:
+        batched space, leading dimension of every [nested] Box is `n`.
+    """
+    if isinstance(space, spaces.Dict):
+        return DictSpace(
+            OrderedDict([(key, batch_space(subspace, n)) for key, subspace in space.spaces.items()]),
+            dtype=getattr(space, 'dtype', None),
+        )
+
+    elif isinstance(space, spaces.Box):
+        return spaces.Box(
+            low=np.repeat(space.low[None, ...], n, axis=0),
+            high=np.repeat(space.high[None, ...], n, axis=0),
+            dtype=space.dtype,
+        )
+
+    elif isinstance(space, spaces.Discrete):
+        return spaces.MultiDiscrete([space.n] * n)
+
+    elif isinstance(space, spaces.Tuple):
+        return spaces.Tuple(tuple([batch_space(subspace, n) for subspace in space.spaces]))
+
+    else:
+        raise TypeError('Batching of space {} is not supported.'.format(type(space)))
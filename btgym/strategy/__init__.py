@@ -18,3 +18,4 @@
 ###############################################################################
 
 from .base import BTgymBaseStrategy
+from .fast import BTgymFastStrategy
@@ -23,9 +23,8 @@ import backtrader.indicators as btind
 from gym import spaces
 
 import numpy as np
-from collections import deque
 
-from btgym.strategy.utils import norm_value, decayed_result, exp_scale
+from btgym.strategy.utils import norm_value, decayed_result, exp_scale, sliding_windows, RingBuffer, cast_state
 
 
 ############################## Base BTgymStrategy Class ###################
@@ -80,6 +79,8 @@ class BTgymBaseStrategy(bt.Strategy):
         episode_stat=None,  # current episode. Got updated by server.
         portfolio_actions=portfolio_actions,
         skip_frame=skip_frame,
+        info_policy='last',  # what to send as info part of environment response, see __init__().
+        state_dtype=np.float32,  # observation dtype, should match floating point spaces of `state_shape`.
     )
 
     def __init__(self, **kwargs):
@@ -104,6 +105,13 @@ class BTgymBaseStrategy(bt.Strategy):
                     skip_frame:         number of environment steps to skip before returning next response,
                                         e.g. if set to 10 -- agent will interact with environment every 10th step;
                                         every other step agent action is assumed to be 'hold'.
+                    info_policy:        `last` - send [info] for communication step only;
+                                        `all` - send infos for all skipped steps, [info[-9], ..., info[0]];
+                                        `none` - send empty list, get_info() is never called;
+                                        callable - send [info_policy(list of infos for all skipped steps)].
+                                        get_info() is called for skipped steps with `all` and callable only.
+                    state_dtype:        numpy floating point dtype observation state entries are cast to before
+                                        being sent to environment, see _cast_state(); None disables casting.
 
                 Default values are::
 
@@ -114,6 +122,8 @@ class BTgymBaseStrategy(bt.Strategy):
                     episode_stat=None
                     portfolio_actions=('hold', 'buy', 'sell', 'close')
                     skip_frame=1
+                    info_policy='last'
+                    state_dtype=np.float32
         """
         try:
             self.time_dim = self.p.state_shape['raw_state'].shape[0]
@@ -140,6 +150,7 @@ class BTgymBaseStrategy(bt.Strategy):
         self.final_message = '_'
         self.raw_state = None
         self.state = dict()
+        self.episode_features = None  # Precomputed features windows, see get_feature_window().
 
         # Inherit logger from cerebro:
         self.log = self.env._log
@@ -173,7 +184,8 @@ class BTgymBaseStrategy(bt.Strategy):
         self.data.dim_sma.plotinfo.plot = False
 
         # Sliding staistics accumulators, globally normalized last `avg_perod` values,
-        # so it's a bit more efficient than use bt.Observers:
+        # so it's a bit more efficient than use bt.Observers;
+        # ring buffers provide zero-copy windows and running sums:
         sliding_datalines = [
             'broker_cash',
             'broker_value',
@@ -188,7 +200,7 @@ class BTgymBaseStrategy(bt.Strategy):
             'action',
             'reward',
         ]
-        self.sliding_stat = {key: deque(maxlen=self.avg_period) for key in sliding_datalines}
+        self.sliding_stat = {key: RingBuffer(maxlen=self.avg_period) for key in sliding_datalines}
 
         # Add custom data Lines if any (convenience wrapper):
         self.set_datalines()
@@ -214,7 +226,7 @@ class BTgymBaseStrategy(bt.Strategy):
 
     def update_sliding_stat(self):
         """
-        Updates all sliding statistics deques with latest-step values:
+        Updates all sliding statistics buffers with latest-step values:
             - normalized broker value
             - normalized broker cash
             - normalized exposure (position size)
@@ -360,6 +372,66 @@ class BTgymBaseStrategy(bt.Strategy):
 
         return self.raw_state
 
+    def get_episode_features(self, prices):
+        """
+        Override this method to enable precomputed features mode: features depending on price data only
+        are computed once for entire episode instead of being composed from datalines at every step.
+
+        Args:
+            prices:     dict of `open`, `high`, `low`, `close` [and `volume`] float64 arrays
+                        of entire episode data, first dimension is time.
+
+        Returns:
+            dict of arrays of shape [episode_length, ...], keyed by feature name, or None to disable mode (default).
+
+        Note:
+            Since backtrader lines are not preloaded, values should be derived from `prices` directly;
+            value at row `i` should only depend on rows [0, i].
+        """
+        return None
+
+    def _get_episode_prices(self):
+        """
+        Returns:
+            dict of price columns arrays of entire episode data, as seen by `self.data` feed.
+        """
+        values = self.datas[0].p.dataname.values
+        prices = dict()
+        for name in ['open', 'high', 'low', 'close', 'volume']:
+            column = getattr(self.datas[0].p, name)
+            # Pandas to BT.feeds params count index as column 0:
+            if column is not None and column > 0:
+                prices[name] = np.ascontiguousarray(values[:, column - 1], dtype=np.float64)
+
+        return prices
+
+    def get_feature_window(self, name):
+        """
+        Returns `time_dim`-long window of precomputed feature ending at current step.
+        Features are computed by get_episode_features() on first call within episode.
+
+        Args:
+            name:   str, feature name
+
+        Returns:
+            read-only array view of shape [time_dim, ...] or None if feature has not been precomputed
+            or fewer than `time_dim` bars have been seen yet.
+        """
+        if len(self.data) < self.time_dim:
+            # Negative window index would wrap around to future bars:
+            return None
+
+        if self.episode_features is None:
+            features = self.get_episode_features(self._get_episode_prices()) or dict()
+            self.episode_features = {
+                key: sliding_windows(value, self.time_dim) for key, value in features.items()
+            }
+        try:
+            return self.episode_features[name][len(self.data) - self.time_dim]
+
+        except KeyError:
+            return None
+
     def get_state(self):
         """
         Override this method, defining necessary calculations and return arbitrary shaped tensor.
@@ -380,6 +452,19 @@ class BTgymBaseStrategy(bt.Strategy):
         self.state['raw_state'] = self.raw_state
         return self.state
 
+    def _cast_state(self, state):
+        """
+        Enforces observation dtype: casts state entries described by floating point `state_shape` spaces
+        to `state_dtype`. Invoked by server on get_state() output, shouldn't be overridden.
+
+        Returns:
+            new state dictionary.
+        """
+        if self.p.state_dtype is None:
+            return state
+
+        return cast_state(state, self.p.state_shape, self.p.state_dtype)
+
     def get_reward(self):
         """
         Default reward estimator.
@@ -404,7 +489,7 @@ class BTgymBaseStrategy(bt.Strategy):
         Note:
             Due to 'skip_frame' feature, INFO part of environment response transmitted by server can be  a list
             containing either all skipped frame's info objects, i.e. [info[-9], info[-8], ..., info[0]] or
-            just latest one, [info[0]]. This behaviour is set inside btgym.server._BTgymAnalyzer().next() method.
+            just latest one, [info[0]]. This behaviour is set by `info_policy` strategy parameter.
         """
         return dict(
             step=self.iteration,
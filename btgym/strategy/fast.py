@@ -0,0 +1,220 @@
+###############################################################################
+#
+# Copyright (C) 2017-2018 Andrew Muzikin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+from btgym.strategy.base import BTgymBaseStrategy
+from btgym.strategy.utils import RingBuffer
+from btgym.fastengine import BTgymFastOrder
+
+
+class BTgymFastParams:
+    """
+    Strategy parameters holder, mimics backtrader params access: `p.<name>`, `_gettuple()`, `_getkwargs()`.
+    """
+
+    def __init__(self, defaults=None, **kwargs):
+        self.__dict__.update(defaults or dict())
+        self.__dict__.update(kwargs)
+
+    def _gettuple(self):
+        return tuple(self.__dict__.items())
+
+    def _getkwargs(self):
+        return dict(self.__dict__)
+
+    def _derive(self, **kwargs):
+        """
+        Returns:
+            new instance with values of known parameters updated from kwargs, unknown kwargs are ignored.
+        """
+        return BTgymFastParams(
+            self._getkwargs(),
+            **{key: value for key, value in kwargs.items() if key in self.__dict__}
+        )
+
+
+class BTgymFastStrategy:
+    """
+    BTgymBaseStrategy counterpart to run by pure numpy BTgymFastEngine.
+    Provides same attributes, params and hooks: get_state(), get_reward(), get_info(), get_done(),
+    set_datalines(), get_episode_features() etc., with default implementations shared with BTgymBaseStrategy.
+
+    Subclassing logic is the same as for BTgymBaseStrategy except that backtrader indicators are not available:
+    features should be computed from `self.data` lines or precomputed via get_episode_features().
+
+    Note:
+        - `params` are defined as class dictionary and get merged with parent class ones;
+        - strategy loop starts (first next() call) after `min_period` steps, which is `time_dim` by default.
+    """
+    time_dim = BTgymBaseStrategy.time_dim
+    skip_frame = BTgymBaseStrategy.skip_frame
+    avg_period = BTgymBaseStrategy.avg_period
+    portfolio_actions = BTgymBaseStrategy.portfolio_actions
+
+    params = BTgymFastParams(dict(BTgymBaseStrategy.params._gettuple()))
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if isinstance(cls.__dict__.get('params'), dict):
+            cls.params = BTgymFastParams(cls.__mro__[1].params._getkwargs(), **cls.__dict__['params'])
+
+    def __init__(self, **kwargs):
+        """
+        Keyword Args:
+
+            params (dict):          parameters dictionary, same as for BTgymBaseStrategy.
+        """
+        try:
+            self.time_dim = self.p.state_shape['raw_state'].shape[0]
+        except KeyError:
+            pass
+
+        try:
+            self.skip_frame = self.p.skip_frame
+        except KeyError:
+            pass
+
+        # Number of steps before first next() call:
+        self.min_period = self.time_dim
+
+        self.iteration = 0
+        self.env_iteration = 0
+        self.inner_embedding = 1
+        self.is_done = False
+        self.is_done_enabled = False
+        self.steps_till_is_done = 2  # extra steps to make when episode terminal conditions are met
+        self.action = 'hold'
+        self.last_action = 'hold'
+        self.reward = 0
+        self.order = None
+        self.order_failed = 0
+        self.broker_message = '_'
+        self.final_message = '_'
+        self.raw_state = None
+        self.state = dict()
+        self.episode_features = None  # Precomputed features windows, see get_feature_window().
+
+        # Inherit logger from engine:
+        self.log = self.env._log
+
+        # Normalisation constant for statistics derived from account value:
+        self.broker_value_normalizer = 1 / \
+            self.env.broker.startingcash / (self.p.drawdown_call + self.p.target_call) * 100
+
+        self.target_value = self.env.broker.startingcash * (1 + self.p.target_call / 100)
+
+        self.trade_just_closed = False
+        self.trade_result = 0
+
+        self.unrealized_pnl = None
+        self.norm_broker_value = None
+        self.realized_pnl = None
+
+        self.current_pos_duration = 0
+        self.current_pos_min_value = 0
+        self.current_pos_max_value = 0
+
+        self.realized_broker_value = self.env.broker.startingcash
+        self.episode_result = 0  # not used
+
+        sliding_datalines = [
+            'broker_cash',
+            'broker_value',
+            'exposure',
+            'leverage',
+            'pos_duration',
+            'episode_step',
+            'realized_pnl',
+            'unrealized_pnl',
+            'max_unrealized_pnl',
+            'min_unrealized_pnl',
+            'action',
+            'reward',
+        ]
+        self.sliding_stat = {key: RingBuffer(maxlen=self.avg_period) for key in sliding_datalines}
+
+        # Add custom data Lines if any (convenience wrapper):
+        self.set_datalines()
+        self.log.debug('Kwargs:\n{}\n'.format(str(kwargs)))
+
+    # Same episode logic as for backtrader engine:
+    prenext = BTgymBaseStrategy.prenext
+    nextstart = BTgymBaseStrategy.nextstart
+    next = BTgymBaseStrategy.next
+    notify_trade = BTgymBaseStrategy.notify_trade
+    notify_order = BTgymBaseStrategy.notify_order
+    update_sliding_stat = BTgymBaseStrategy.update_sliding_stat
+    action_one_hot = BTgymBaseStrategy.action_one_hot
+    action_norm = BTgymBaseStrategy.action_norm
+    set_datalines = BTgymBaseStrategy.set_datalines
+    _get_raw_state = BTgymBaseStrategy._get_raw_state
+    get_episode_features = BTgymBaseStrategy.get_episode_features
+    _get_episode_prices = BTgymBaseStrategy._get_episode_prices
+    get_feature_window = BTgymBaseStrategy.get_feature_window
+    get_state = BTgymBaseStrategy.get_state
+    _cast_state = BTgymBaseStrategy._cast_state
+    get_reward = BTgymBaseStrategy.get_reward
+    get_info = BTgymBaseStrategy.get_info
+    get_done = BTgymBaseStrategy.get_done
+    _get_done = BTgymBaseStrategy._get_done
+
+    def stop(self):
+        pass
+
+    @property
+    def position(self):
+        return self.broker.getposition(self.data)
+
+    def getposition(self, data=None, broker=None):
+        return self.broker.getposition(data)
+
+    def _submit(self, size):
+        if not size:
+            return None
+
+        return self.broker.submit(BTgymFastOrder(self.data, size))
+
+    def buy(self, size=None):
+        """
+        Creates market buy order, `size` defaults to engine fixed stake.
+        """
+        return self._submit(self.env.stake if size is None else size)
+
+    def sell(self, size=None):
+        """
+        Creates market sell order, `size` defaults to engine fixed stake.
+        """
+        return self._submit(-(self.env.stake if size is None else size))
+
+    def close(self, size=None):
+        """
+        Creates market order closing current position, returns None if there is no position.
+        """
+        possize = self.position.size
+        size = abs(size if size is not None else possize)
+
+        if possize > 0:
+            return self.sell(size=size)
+
+        elif possize < 0:
+            return self.buy(size=size)
+
+        return None
+
+    def __len__(self):
+        return len(self.data)
@@ -93,4 +93,146 @@ def discounted_average(x, gamma=1):
     while len(x.shape) < 2:
         x = x[..., None]
     gamma = gamma * np.ones(x.shape)
-    return np.squeeze(np.average(x, weights=(gamma ** np.arange(x.shape[0])[..., None])[::-1], axis=0))
\ No newline at end of file
+    return np.squeeze(np.average(x, weights=(gamma ** np.arange(x.shape[0])[..., None])[::-1], axis=0))
+
+
+def sliding_windows(x, size):
+    """
+    Read-only view of all `size`-long windows of `x` along first axis, no data is copied.
+
+    Returns:
+        array of shape [x.shape[0] - size + 1, size, *x.shape[1:]]
+    """
+    x = np.ascontiguousarray(x)
+    return np.lib.stride_tricks.as_strided(
+        x,
+        shape=(x.shape[0] - size + 1, size) + x.shape[1:],
+        strides=(x.strides[0],) + x.strides,
+        writeable=False,
+    )
+
+
+def rolling_mean(x, period):
+    """
+    Simple moving average of `x` along first axis, first `period - 1` values are NaN.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    mean = np.full(x.shape, np.nan)
+    if x.shape[0] >= period:
+        mean[period - 1:] = sliding_windows(x, period).mean(axis=1)
+    return mean
+
+
+class RingBuffer:
+    """
+    Fixed-size FIFO of scalar values backed by preallocated contiguous array, deque(maxlen) replacement.
+    Every value is written twice, at `pos` and `pos + maxlen`, so ordered window of last values
+    is always continuous slice of buffer and can be returned as view, no data is copied.
+    Running sum of stored values is maintained on every append.
+
+    Supports `append()`, `len()`, indexing and slicing (applied to ordered window) and `np.asarray()`.
+
+    Note:
+        Window views are read-only and are overwritten by subsequent appends,
+        copy values explicitly if those should be kept.
+    """
+
+    def __init__(self, maxlen, dtype=np.float64):
+        """
+        Args:
+            maxlen:     int, buffer capacity
+            dtype:      values dtype
+        """
+        self.maxlen = maxlen
+        self.buffer = np.zeros(2 * maxlen, dtype=dtype)
+        self._view = self.buffer.view()
+        self._view.flags.writeable = False
+        self.pos = 0
+        self.count = 0
+        self.sum = 0.0
+
+    def append(self, value):
+        if self.count == self.maxlen:
+            self.sum -= self.buffer[self.pos]
+
+        else:
+            self.count += 1
+
+        self.buffer[self.pos] = self.buffer[self.pos + self.maxlen] = value
+        self.sum += self.buffer[self.pos]
+        self.pos += 1
+
+        if self.pos == self.maxlen:
+            self.pos = 0
+            # Buffer is full here, get rid of accumulated rounding errors:
+            self.sum = self.buffer[:self.maxlen].sum()
+
+    @property
+    def window(self):
+        """
+        Read-only view of stored values, oldest first.
+        """
+        end = self.pos + self.maxlen
+        return self._view[end - self.count: end]
+
+    def mean(self, skip_first=0, skip_last=0):
+        """
+        Mean of stored values excluding `skip_first` oldest and `skip_last` newest ones,
+        estimated from running sum.
+        """
+        window = self.window
+        total = self.sum
+        if skip_first > 0:
+            total -= window[:skip_first].sum()
+
+        if skip_last > 0:
+            total -= window[self.count - skip_last:].sum()
+
+        return total / (self.count - skip_first - skip_last)
+
+    def clear(self):
+        self.pos = 0
+        self.count = 0
+        self.sum = 0.0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, item):
+        return self.window[item]
+
+    def __iter__(self):
+        return iter(self.window)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is not None or copy:
+            return np.array(self.window, dtype=dtype)
+
+        return self.window
+
+
+def cast_state(state, state_shape, dtype):
+    """
+    Casts entries of [nested] state dictionary described by floating point spaces of `state_shape` to given dtype.
+    Entries described by other spaces or not described at all are passed as is.
+
+    Args:
+        state:          [nested] dictionary of arrays;
+        state_shape:    [nested] dictionary of gym spaces;
+        dtype:          numpy floating point dtype.
+
+    Returns:
+        new [nested] dictionary; arrays already of given dtype are not copied.
+    """
+    cast = dict(state)
+    for key, space in state_shape.items():
+        if key not in cast:
+            continue
+
+        if isinstance(space, dict) or hasattr(space, 'spaces'):
+            cast[key] = cast_state(cast[key], getattr(space, 'spaces', space), dtype)
+
+        elif getattr(space, 'dtype', None) is not None and np.issubdtype(space.dtype, np.floating):
+            cast[key] = np.asarray(cast[key], dtype=dtype)
+
+    return cast
@@ -0,0 +1,134 @@
+import os
+import copy
+import unittest
+
+import numpy as np
+import backtrader as bt
+from logbook import Logger, WARNING
+
+from btgym.datafeed import BTgymDataset
+from btgym.rendering import BTgymNullRendering
+from btgym.strategy import BTgymBaseStrategy, BTgymFastStrategy
+from btgym.fastengine import BTgymFastEngine, BTgymFastEngineFactory
+from btgym.server import BTgymInProcessChannel, BTgymCerebroFactory, _BTgymAnalyzer, _BTgymFastAnalyzer
+
+
+filename = os.path.join(os.path.dirname(__file__), '../examples/data/DAT_ASCII_EURUSD_M1_201703.csv')
+
+log_level = WARNING
+
+
+class ScriptedChannel(BTgymInProcessChannel):
+    """
+    Plays recorded action sequence to episode analyzer and records environment responses.
+    """
+
+    def __init__(self, actions):
+        super(ScriptedChannel, self).__init__(None, None)
+        self.actions = iter(actions)
+        self.responses = []
+
+    def send_pyobj(self, obj, *args, **kwargs):
+        self.responses.append(copy.deepcopy(obj))
+
+    def recv_pyobj(self, *args, **kwargs):
+        return {'action': next(self.actions)}
+
+
+class FastEngineParityTest(unittest.TestCase):
+    """Testing fast engine against backtrader one"""
+
+    @classmethod
+    def setUpClass(cls):
+        domain = BTgymDataset(
+            filename=filename,
+            episode_duration={'days': 0, 'hours': 12, 'minutes': 0},
+            start_00=False,
+            time_gap={'days': 0, 'hours': 5},
+            log_level=log_level,
+        )
+        domain.reset()
+        trial = domain.sample()
+        trial.reset()
+        cls.episode = trial.sample()
+
+    def run_episode(self, engine, factory_class, analyzer_class, actions, leverage=1.0, **strategy_kwargs):
+        engine.addstrategy(engine.strategy_class, **strategy_kwargs)
+        engine.broker.setcash(100.0)
+        engine.broker.setcommission(0.001, leverage=leverage)
+        engine.addsizer(bt.sizers.SizerFix, stake=60)
+
+        if factory_class is BTgymCerebroFactory:
+            factory = factory_class(
+                engine,
+                observers=[bt.observers.DrawDown],
+                analyzers=[(analyzer_class, dict(_name='_env_analyzer'))],
+            )
+
+        else:
+            factory = factory_class(engine, analyzers=[(analyzer_class, dict(_name='_env_analyzer'))])
+
+        episode_engine = factory.make()
+        episode_engine._socket = channel = ScriptedChannel(actions)
+        episode_engine._log = Logger('ParityTest', level=log_level)
+        episode_engine._render = BTgymNullRendering()
+        episode_engine.broker.set_shortcash(False)
+        episode_engine.adddata(self.episode.to_btfeed())
+        strategy = episode_engine.run(stdstats=True, preload=False, oldbuysell=True)[0]
+
+        return channel.responses, strategy.broker.get_value()
+
+    def assert_parity(self, seed, leverage=1.0, **strategy_kwargs):
+        actions = np.random.RandomState(seed).choice(BTgymBaseStrategy.portfolio_actions, size=2000)
+
+        cerebro = bt.Cerebro()
+        cerebro.strategy_class = BTgymBaseStrategy
+        bt_responses, bt_value = self.run_episode(
+            cerebro, BTgymCerebroFactory, _BTgymAnalyzer, actions, leverage, **strategy_kwargs
+        )
+
+        engine = BTgymFastEngine()
+        engine.strategy_class = BTgymFastStrategy
+        fast_responses, fast_value = self.run_episode(
+            engine, BTgymFastEngineFactory, _BTgymFastAnalyzer, actions, leverage, **strategy_kwargs
+        )
+
+        self.assertEqual(len(bt_responses), len(fast_responses))
+        self.assertTrue(bt_responses[-1][2])
+        self.assertEqual(bt_value, fast_value)
+
+        for (bt_state, bt_reward, bt_done, bt_info), (state, reward, done, info) in zip(bt_responses, fast_responses):
+            self.assertTrue(np.array_equal(bt_state['raw_state'], state['raw_state']))
+            self.assertEqual(bt_reward, reward)
+            self.assertEqual(bt_done, done)
+            self.assertEqual(bt_info, info)
+
+    def test_default_strategy_parity(self):
+        """
+        Same actions should result in identical states, rewards, dones, infos and broker value.
+        """
+        for seed in range(3):
+            self.assert_parity(seed, drawdown_call=30)
+
+    def test_skip_frame_parity(self):
+        """
+        Parity with frame skipping and drawdown termination.
+        """
+        self.assert_parity(0, skip_frame=5, drawdown_call=1, target_call=1)
+
+    def test_leverage_parity(self):
+        """
+        Parity for leveraged account.
+        """
+        self.assert_parity(1, leverage=10.0, drawdown_call=30)
+
+    def test_base_strategy_rejected(self):
+        """
+        Fast engine should refuse to run backtrader strategies.
+        """
+        with self.assertRaises(TypeError):
+            BTgymFastEngine().addstrategy(BTgymBaseStrategy)
+
+
+if __name__ == '__main__':
+    unittest.main()